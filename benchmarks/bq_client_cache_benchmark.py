@@ -0,0 +1,156 @@
+"""bq_hookのBigQueryクライアントのキャッシュの効果を、ローカルの偽サーバーで計測する。
+
+キャッシュなし（従来の__get_client）は呼び出し毎に認証ファイルを読み込み、
+アクセストークンを取得し、新しいHTTPセッションでAPIを呼び出す。
+キャッシュあり（現在のbq_hook.__get_client）は認証情報とHTTPセッションを使い回す。
+トークンの発行とBigQuery APIはローカルの偽サーバーが応答するため、認証情報もネットワークも不要。
+TLSのハンドシェイクは計測に含まれないため、実環境の差はこれより大きくなる。
+
+実行方法（リポジトリのルートで実行する）:
+    python benchmarks/bq_client_cache_benchmark.py --calls 200 --rtt-ms 0
+"""
+import argparse
+import json
+import logging
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from google.cloud import bigquery
+from google.cloud.bigquery import _http as bigquery_http
+from google.oauth2 import service_account
+
+try:
+    # google-authの新しいバージョンのみ
+    from google.auth import _regional_access_boundary_utils as rab_utils
+except ImportError:
+    rab_utils = None
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from lib.hooks import bq_hook  # noqa: E402
+
+PROJECT_ID = 'benchmark-project'
+DATASET_ID = 'benchmark_dataset'
+
+
+class FakeGoogleApiHandler(BaseHTTPRequestHandler):
+    """トークンの発行とdatasets.getに応答する偽サーバー
+    """
+    protocol_version = 'HTTP/1.1'
+    rtt = 0
+    token_requests = 0
+    connections = set()
+
+    def setup(self):
+        super().setup()
+        # ヘッダと本文を別々に送信するため、Nagleアルゴリズムによる遅延を無効にする
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def do_POST(self):
+        self.__count_connection()
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        type(self).token_requests += 1
+        self.__respond({'access_token': 'fake-token', 'expires_in': 3600, 'token_type': 'Bearer'})
+
+    def do_GET(self):
+        self.__count_connection()
+        if self.path.endswith('/allowedLocations'):
+            # google-authが認証情報の作成毎に問い合わせるRegional Access Boundary
+            self.__respond({'locations': [], 'encodedLocations': '0x0'})
+            return
+        self.__respond({'kind': 'bigquery#dataset',
+                        'id': '{}:{}'.format(PROJECT_ID, DATASET_ID),
+                        'datasetReference': {'projectId': PROJECT_ID, 'datasetId': DATASET_ID},
+                        'location': 'asia-northeast1'})
+
+    def log_message(self, format, *args):
+        pass
+
+    def __count_connection(self):
+        type(self).connections.add(self.client_address)
+
+    def __respond(self, body):
+        time.sleep(self.rtt)
+        data = json.dumps(body).encode('UTF-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def write_credentials_file(path, token_uri):
+    """偽のサービスアカウント認証ファイルを作成する。
+    """
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    pem = key.private_bytes(serialization.Encoding.PEM,
+                            serialization.PrivateFormat.PKCS8,
+                            serialization.NoEncryption()).decode('UTF-8')
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='UTF-8') as f:
+        json.dump({
+            'type': 'service_account',
+            'project_id': PROJECT_ID,
+            'private_key_id': 'benchmark',
+            'private_key': pem,
+            'client_email': 'benchmark@{}.iam.gserviceaccount.com'.format(PROJECT_ID),
+            'client_id': '0',
+            'token_uri': token_uri,
+        }, f)
+
+
+def get_client_without_cache(credentials_file):
+    """キャッシュ導入前の__get_clientと同じ処理"""
+    credentials = service_account.Credentials.from_service_account_file(
+        credentials_file,
+        scopes=["https://www.googleapis.com/auth/cloud-platform"],
+    )
+    return bigquery.Client(project=PROJECT_ID, credentials=credentials)
+
+
+def measure(name, get_client, calls):
+    FakeGoogleApiHandler.token_requests = 0
+    FakeGoogleApiHandler.connections = set()
+    start = time.perf_counter()
+    for _ in range(calls):
+        get_client().get_dataset('{}.{}'.format(PROJECT_ID, DATASET_ID))
+    elapsed = time.perf_counter() - start
+    print('{:<14} {:>8.2f} ms/call  トークン取得 {:>4}回  TCP接続 {:>4}回'.format(
+        name, elapsed / calls * 1000, FakeGoogleApiHandler.token_requests, len(FakeGoogleApiHandler.connections)))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--calls', type=int, default=200, help='APIの呼び出し回数')
+    parser.add_argument('--rtt-ms', type=float, default=0, help='偽サーバーの応答に加える遅延（ミリ秒）')
+    args = parser.parse_args()
+
+    FakeGoogleApiHandler.rtt = args.rtt_ms / 1000
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeGoogleApiHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    endpoint = 'http://127.0.0.1:{}'.format(server.server_address[1])
+    bigquery_http.Connection.DEFAULT_API_ENDPOINT = endpoint
+    if rab_utils is not None and hasattr(rab_utils, 'get_service_account_rab_endpoint'):
+        rab_utils.get_service_account_rab_endpoint = \
+            lambda email: '{}/v1/serviceAccounts/{}/allowedLocations'.format(endpoint, email)
+    # lib.loggerのログ出力を抑止する
+    logging.disable(logging.WARNING)
+
+    work_dir = tempfile.mkdtemp()
+    os.chdir(work_dir)
+    write_credentials_file(bq_hook.CREDENTIALS_FILE, '{}/token'.format(endpoint))
+
+    get_client = getattr(bq_hook, '__get_client')
+    measure('キャッシュなし', lambda: get_client_without_cache(bq_hook.CREDENTIALS_FILE), args.calls)
+    measure('キャッシュあり', lambda: get_client(PROJECT_ID, local=True), args.calls)
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+"""bq_pivot_to_google_drive_hookのピボットテーブル作成の処理時間と最大メモリ使用量を、合成データで計測する。
+
+従来の処理（集計項目ごとにpd.pivot_tableを実行してpd.concatで結合する）と、
+現在の__create_pivot_table（1回のgroupbyで全集計項目を集計する）を同じデータで比較する。
+処理時間は複数回の最小値。最大メモリ使用量はtracemallocで計測した、ピボットテーブル作成中に確保したメモリの最大値。
+BigQueryとGoogleドライブには接続しないが、フックのモジュールを読み込むためAirflowの環境で実行する。
+
+実行方法（リポジトリのルートで実行する）:
+    python benchmarks/bq_pivot_benchmark.py --rows 500000 --metrics 10
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from lib.hooks import bq_pivot_to_google_drive_hook  # noqa: E402
+
+
+def create_data(rows, metrics, shops, seed=0):
+    """ピボットテーブルの元データを作成する。
+    店舗（インデックス）、地域（ソート）、月（カラム）と、整数と小数が交互の集計項目を持つ。
+    """
+    rng = np.random.default_rng(seed)
+    shop_ids = rng.integers(0, shops, rows)
+    data = {
+        'shop_id': ['shop_{:05d}'.format(i) for i in shop_ids],
+        'area': ['area_{:02d}'.format(i % 47) for i in shop_ids],
+        'month': rng.integers(1, 13, rows),
+    }
+    for i in range(metrics):
+        if i % 2 == 0:
+            data['metric_{}'.format(i)] = rng.integers(0, 1000, rows)
+        else:
+            data['metric_{}'.format(i)] = rng.random(rows) * 1000
+    return pd.DataFrame(data)
+
+
+def create_pivot_table_before(df, pivot_index, pivot_columns, pivot_values, pivot_sort):
+    """変更前の__create_pivot_tableと同じ処理
+    """
+    piv_list = []
+    index_list = []
+    index_name_list = []
+    for index in pivot_index:
+        index_list.append(index['column'])
+        index_name_list.append(index['name'])
+
+    sort_name_list = []
+    for i, sort in enumerate(pivot_sort):
+        if sort == 'values':
+            sort_name_list.append('__values_sort__')
+            continue
+        skip = False
+        for index in pivot_index:
+            if sort == index['column']:
+                sort_name_list.append(index['name'])
+                skip = True
+                break
+        if skip:
+            continue
+        index_list.append(sort)
+        index_name_list.append('{}__sort__'.format(i))
+        sort_name_list.append('{}__sort__'.format(i))
+
+    for i, value in enumerate(pivot_values):
+        piv = pd.pivot_table(
+            df,
+            index=index_list,
+            columns=pivot_columns,
+            values=[value['column']],
+            fill_value=0)
+        piv.insert(0, '__values_sort__', i)
+        piv.insert(0, '指標', value['name'])
+        index_column_names = index_name_list.copy()
+        index_column_names.extend(['指標', '__values_sort__'])
+        piv.reset_index(inplace=True)
+        value_column_names = [col[1] for col in piv.columns.values]
+        n = len(index_column_names)
+        index_column_names.extend(value_column_names[n:])
+        piv.columns = index_column_names
+        piv_list.append(piv)
+
+    ret_df = pd.concat(piv_list)
+    ret_df = ret_df.sort_values(sort_name_list)
+    ret_df = ret_df.drop('__values_sort__', axis=1)
+    for i, s in enumerate(pivot_sort):
+        try:
+            ret_df = ret_df.drop('{}__sort__'.format(i), axis=1)
+        except KeyError:
+            continue
+    return ret_df
+
+
+def measure(name, create_pivot_table, df, pivot_args, repeat):
+    # tracemallocは処理を遅くするため、処理時間とメモリは別に計測する
+    elapsed = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        piv = create_pivot_table(df, *pivot_args)
+        elapsed.append(time.perf_counter() - start)
+    tracemalloc.start()
+    create_pivot_table(df, *pivot_args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    print('{:<8} {:>8.3f} 秒  最大メモリ {:>8.1f} MB  出力 {:,}行 x {}列'.format(
+        name, min(elapsed), peak / 1024 / 1024, len(piv), len(piv.columns)))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=500000, help='元データの行数')
+    parser.add_argument('--metrics', type=int, default=10, help='集計項目の数')
+    parser.add_argument('--shops', type=int, default=5000, help='インデックス（店舗）の種類の数')
+    parser.add_argument('--repeat', type=int, default=3, help='計測回数。処理時間は最小値を出力する')
+    args = parser.parse_args()
+
+    df = create_data(args.rows, args.metrics, args.shops)
+    pivot_args = (
+        [{'column': 'shop_id', 'name': '店舗'}],
+        ['month'],
+        [{'column': 'metric_{}'.format(i), 'name': '指標{}'.format(i)} for i in range(args.metrics)],
+        ['area', 'shop_id', 'values'],
+    )
+    measure('変更前', create_pivot_table_before, df, pivot_args, args.repeat)
+    measure('変更後', getattr(bq_pivot_to_google_drive_hook, '__create_pivot_table'), df, pivot_args, args.repeat)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""bq_hookのクエリパラメータの型付けによる、パーティションプルーニングの効果（スキャンバイト数）を計測する。
+
+日付で分割したテーブルに同じ日付の条件のクエリを、パラメータの渡し方を変えてドライランし、
+totalBytesProcessedを比較する。
+- STRING（CAST）: 型付け導入前のように、日付をSTRINGのパラメータで渡し、パーティション列を文字列にして比較する。
+- STRING: 日付をSTRINGのパラメータで渡し、パーティション列と直接比較する。
+- DATE（型ヒント）: 日付の文字列をSQL先頭の「-- @param target_date DATE」でDATEのパラメータにして比較する
+  （bq_hook.__set_query_paramsと同じ処理）。
+ドライランは課金されないが、BigQueryへの接続とジョブを実行できる認証情報が必要。
+認証ファイルはbq_hookと同じ（リポジトリのルートからの相対パスのCREDENTIALS_FILE）を使う。
+
+実行方法（リポジトリのルートで実行する）:
+    python benchmarks/bq_query_param_bytes_benchmark.py --project-id <プロジェクトID> \\
+        --table bigquery-public-data.google_trends.top_terms --partition-column refresh_date --date 2024-01-01
+"""
+import argparse
+import os
+import sys
+
+from google.api_core.exceptions import BadRequest
+from google.cloud import bigquery
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from lib.hooks import bq_hook  # noqa: E402
+
+QUERIES = [
+    ('STRING（CAST）', '''
+SELECT * FROM `{table}` WHERE CAST({column} AS STRING) = @target_date
+'''),
+    ('STRING', '''
+SELECT * FROM `{table}` WHERE {column} = @target_date
+'''),
+    ('DATE（型ヒント）', '''-- @param target_date DATE
+SELECT * FROM `{table}` WHERE {column} = @target_date
+'''),
+]
+
+
+def dry_run(client, query_str, target_date):
+    """クエリをドライランし、スキャンするバイト数を返す。
+    """
+    set_query_params = getattr(bq_hook, '__set_query_params')
+    job_config = bigquery.QueryJobConfig()
+    job_config.dry_run = True
+    job_config.use_query_cache = False
+    job_config.query_parameters = set_query_params({'target_date': target_date}, query_str)
+    return client.query(query_str, job_config=job_config).total_bytes_processed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--project-id', required=True, help='ドライランを実行するプロジェクト')
+    parser.add_argument('--table', default='bigquery-public-data.google_trends.top_terms',
+                        help='日付で分割したテーブル（project.dataset.table）')
+    parser.add_argument('--partition-column', default='refresh_date', help='パーティション列（DATE）')
+    parser.add_argument('--date', default='2024-01-01', help='条件の日付（YYYY-MM-DD）')
+    args = parser.parse_args()
+
+    client = getattr(bq_hook, '__get_client')(args.project_id, local=True)
+    for name, query in QUERIES:
+        query_str = query.format(table=args.table, column=args.partition_column)
+        try:
+            total_bytes = dry_run(client, query_str, args.date)
+        except BadRequest as e:
+            print('{:<16} エラー: {}'.format(name, e.message))
+            continue
+        print('{:<16} {:>20,} bytes'.format(name, total_bytes))
+
+
+if __name__ == '__main__':
+    main()
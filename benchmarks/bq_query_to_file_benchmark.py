@@ -0,0 +1,178 @@
+"""bq_hook.bq_query_to_fileのページ単位のファイル出力のMB/sと最大メモリ使用量を、偽のバックエンドで計測する。
+
+bq_hook.bq_queryを偽のRowIteratorを返す関数に置き換え、bq_query_to_fileの出力処理をそのまま実行する。
+認証情報とネットワークは不要。偽のRowIteratorは以下のいずれか。
+- arrow: ページ毎にpyarrow.RecordBatchを生成する（Storage Read APIと同じくデコード済み）。出力処理のみを計測できる。
+- rest: tabledata.listと同じJSONのページを生成する偽のapi_requestを、google-cloud-bigqueryのRowIteratorで読み込む。
+  REST APIのレスポンスのデコードを含むため、出力処理の差は小さく見える。
+従来の処理（全件をDataFrameで取得してDataFrame.to_csvで出力）と、CSV、CSV_GZIP、PARQUETの出力を比較する。
+最大メモリ使用量（ru_maxrss）はプロセス単位のため、出力形式毎に別プロセスで計測する。
+
+実行方法（リポジトリのルートで実行する）:
+    python benchmarks/bq_query_to_file_benchmark.py --rows 1000000 --page-size 10000 --source arrow
+"""
+import argparse
+import datetime
+import json
+import logging
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pyarrow as pa
+from google.cloud import bigquery
+from google.cloud.bigquery.table import RowIterator
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from lib.hooks import bq_hook  # noqa: E402
+
+SCHEMA = [
+    bigquery.SchemaField('id', 'INT64'),
+    bigquery.SchemaField('name', 'STRING'),
+    bigquery.SchemaField('amount', 'FLOAT64'),
+    bigquery.SchemaField('order_date', 'DATE'),
+    bigquery.SchemaField('updated_at', 'TIMESTAMP'),
+]
+BASE_DATE = datetime.date(2020, 1, 1)
+BASE_TIMESTAMP_US = 1600000000 * 1000000
+MODES = ('DataFrame', 'CSV', 'CSV_GZIP', 'PARQUET')
+
+
+def create_row(i):
+    """tabledata.listのレスポンスと同じ形式の1行を作成する。
+    値はすべて文字列で、TIMESTAMPはuseInt64Timestampと同じエポックからのマイクロ秒。
+    """
+    return {'f': [
+        {'v': str(i)},
+        {'v': '名前_{}'.format(i % 1000)},
+        {'v': repr(i * 0.5)},
+        {'v': (BASE_DATE + datetime.timedelta(days=i % 3650)).isoformat()},
+        {'v': str(BASE_TIMESTAMP_US + i * 1000000)},
+    ]}
+
+
+def create_row_iterator(rows, page_size, schema=SCHEMA, create_row=create_row):
+    """ページ毎にJSONを生成する偽のapi_requestで、クエリ結果のRowIteratorを作成する。
+    生成済みのページは保持しないため、結果の件数に関わらずメモリに保持するのは1ページ分のみとなる。
+    """
+    def api_request(method, path, query_params=None, **kwargs):
+        start = int((query_params or {}).get('pageToken') or 0)
+        end = min(start + page_size, rows)
+        page = {'rows': [create_row(i) for i in range(start, end)], 'totalRows': str(rows)}
+        if end < rows:
+            page['pageToken'] = str(end)
+        return page
+
+    return RowIterator(client=None, api_request=api_request, path='/fake', schema=schema, page_size=page_size)
+
+
+class FakeRowIterator:
+    """ページ毎にpyarrow.RecordBatchを生成する、RowIteratorの代わり
+    """
+
+    def __init__(self, rows, page_size):
+        self.rows = rows
+        self.page_size = page_size
+        self.schema = SCHEMA
+
+    def to_arrow_iterable(self, bqstorage_client=None):
+        for start in range(0, self.rows, self.page_size):
+            yield create_batch(start, min(start + self.page_size, self.rows))
+
+    def to_arrow(self, create_bqstorage_client=False):
+        return pa.Table.from_batches(list(self.to_arrow_iterable()))
+
+
+def create_batch(start, end):
+    """create_rowと同じ値の行のpyarrow.RecordBatchを作成する。
+    """
+    ids = np.arange(start, end, dtype=np.int64)
+    return pa.RecordBatch.from_arrays([
+        pa.array(ids),
+        pa.array(['名前_{}'.format(i % 1000) for i in range(start, end)], pa.string()),
+        pa.array(ids * 0.5),
+        pa.array(((BASE_DATE - datetime.date(1970, 1, 1)).days + ids % 3650).astype(np.int32)).cast(pa.date32()),
+        pa.array(BASE_TIMESTAMP_US + ids * 1000000, pa.timestamp('us', tz='UTC')),
+    ], names=[field.name for field in SCHEMA])
+
+
+def get_source(source, rows, page_size):
+    if source == 'arrow':
+        return FakeRowIterator(rows, page_size)
+    return create_row_iterator(rows, page_size)
+
+
+def get_peak_rss_mb():
+    # Linuxのru_maxrssはKB単位
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def export_dataframe(source, local_file):
+    """従来の処理。全件をDataFrameで取得してから、DataFrame.to_csvで出力する。
+    """
+    start = time.time()
+    df = source.to_arrow(create_bqstorage_client=False).to_pandas()
+    df.to_csv(local_file, index=False, encoding='utf_8', lineterminator='\n')
+    elapsed_seconds = time.time() - start
+    file_bytes = os.path.getsize(local_file)
+    return {
+        'records': len(df),
+        'bytes': file_bytes,
+        'elapsed_seconds': round(elapsed_seconds, 3),
+        'mb_per_second': round(file_bytes / 1024 / 1024 / elapsed_seconds, 3),
+        'peak_rss_mb': get_peak_rss_mb(),
+    }
+
+
+def export_file(source, local_file, file_format):
+    """bq_query_to_fileで出力する。
+    """
+    bq_hook.bq_query = lambda *args, **kwargs: source
+    return bq_hook.bq_query_to_file('benchmark.sql', local_file, file_format=file_format)
+
+
+def run_child(mode, source):
+    """1つの出力形式を計測し、結果をJSONで標準出力に出力する。
+    """
+    with tempfile.TemporaryDirectory() as work_dir:
+        local_file = os.path.join(work_dir, 'result')
+        if mode == 'DataFrame':
+            result = export_dataframe(source, local_file)
+        else:
+            result = export_file(source, local_file, mode)
+    print(json.dumps(result))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=1000000, help='クエリ結果の行数')
+    parser.add_argument('--page-size', type=int, default=10000, help='1ページあたりの行数')
+    parser.add_argument('--source', default='arrow', choices=('arrow', 'rest'), help='偽のRowIteratorの種類')
+    parser.add_argument('--modes', nargs='+', default=MODES, choices=MODES, help='計測する出力形式')
+    parser.add_argument('--child', choices=MODES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child is not None:
+        # lib.loggerのログ出力を抑止する
+        logging.disable(logging.WARNING)
+        run_child(args.child, get_source(args.source, args.rows, args.page_size))
+        return
+
+    print('{:<10} {:>10} {:>12} {:>8} {:>10} {:>12}'.format('出力形式', 'レコード数', 'ファイルサイズ', '秒', 'MB/s', '最大RSS(MB)'))
+    for mode in args.modes:
+        output = subprocess.run([sys.executable, os.path.abspath(__file__),
+                                 '--rows', str(args.rows), '--page-size', str(args.page_size),
+                                 '--source', args.source, '--child', mode],
+                                check=True, stdout=subprocess.PIPE, universal_newlines=True).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        print('{:<10} {:>10,} {:>12,} {:>8.2f} {:>10.2f} {:>12.1f}'.format(
+            mode, result['records'], result['bytes'], result['elapsed_seconds'],
+            result['mb_per_second'], result['peak_rss_mb']))
+
+
+if __name__ == '__main__':
+    main()
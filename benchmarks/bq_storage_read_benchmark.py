@@ -0,0 +1,131 @@
+"""bq_queryのREST API（tabledata.list）とBigQuery Storage Read APIの取得経路のrows/secを、偽のバックエンドで比較する。
+
+REST APIは、tabledata.listと同じJSONのページを返す偽のapi_requestを、
+google-cloud-bigqueryのRowIterator.to_arrow(create_bqstorage_client=False)で読み込み、DataFrameに変換する
+（bq_hook.__to_arrowのREST経路と同じ処理）。
+Storage Read APIは、ReadRowsのレスポンスと同じArrow IPC形式のレコードバッチを、
+ストリームごとに並列でデコードしてpyarrow.Tableに結合し、DataFrameに変換する（ライブラリのStorage Read経路と同じ処理）。
+どちらも認証情報とネットワークは不要で、計測するのはクライアント側のデコードの時間。
+--rtt-msで1ページあたりの応答待ちを加えられる。転送量の目安として、それぞれのレスポンスの合計バイト数も出力する。
+
+実行方法（リポジトリのルートで実行する）:
+    python benchmarks/bq_storage_read_benchmark.py --rows 200000 --page-size 10000 --streams 4 --rtt-ms 0
+"""
+import argparse
+import datetime
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pyarrow as pa
+from google.cloud import bigquery
+from google.cloud.bigquery.table import RowIterator
+
+SCHEMA = [
+    bigquery.SchemaField('id', 'INT64'),
+    bigquery.SchemaField('name', 'STRING'),
+    bigquery.SchemaField('amount', 'FLOAT64'),
+    bigquery.SchemaField('order_date', 'DATE'),
+    bigquery.SchemaField('updated_at', 'TIMESTAMP'),
+]
+BASE_DATE = datetime.date(2020, 1, 1)
+BASE_TIMESTAMP_US = 1600000000 * 1000000
+
+
+def create_table(rows):
+    """ベンチマーク用のクエリ結果を作成する。
+    """
+    return pa.table({
+        'id': pa.array(range(rows), pa.int64()),
+        'name': pa.array(['name_{}'.format(i % 1000) for i in range(rows)], pa.string()),
+        'amount': pa.array([i * 0.5 for i in range(rows)], pa.float64()),
+        'order_date': pa.array([BASE_DATE + datetime.timedelta(days=i % 3650) for i in range(rows)], pa.date32()),
+        'updated_at': pa.array([BASE_TIMESTAMP_US + i * 1000000 for i in range(rows)], pa.timestamp('us', tz='UTC')),
+    })
+
+
+def create_rest_pages(table, page_size):
+    """tabledata.listのレスポンスと同じ形式のJSONのページを作成する。
+    値はすべて文字列で、TIMESTAMPはuseInt64Timestampと同じエポックからのマイクロ秒。
+    """
+    pages = []
+    columns = [table.column(i).to_pylist() for i in range(table.num_columns)]
+    for start in range(0, table.num_rows, page_size):
+        rows = []
+        for i in range(start, min(start + page_size, table.num_rows)):
+            rows.append({'f': [
+                {'v': str(columns[0][i])},
+                {'v': columns[1][i]},
+                {'v': repr(columns[2][i])},
+                {'v': columns[3][i].isoformat()},
+                {'v': str(BASE_TIMESTAMP_US + i * 1000000)},
+            ]})
+        pages.append({'rows': rows, 'totalRows': str(table.num_rows)})
+    for i, page in enumerate(pages[:-1]):
+        page['pageToken'] = str(i + 1)
+    return pages
+
+
+def create_storage_streams(table, page_size, streams):
+    """ReadRowsのレスポンスと同じArrow IPC形式のレコードバッチを、ストリームごとに作成する。
+    """
+    batches = table.to_batches(max_chunksize=page_size)
+    result = [[] for _ in range(streams)]
+    for i, batch in enumerate(batches):
+        result[i % streams].append(batch.serialize().to_pybytes())
+    return table.schema, result
+
+
+def read_rest(pages, page_size, rtt):
+    def api_request(method, path, query_params=None, **kwargs):
+        time.sleep(rtt)
+        token = (query_params or {}).get('pageToken')
+        return pages[int(token) if token else 0]
+
+    rows = RowIterator(client=None, api_request=api_request, path='/fake', schema=SCHEMA, page_size=page_size)
+    return rows.to_arrow(create_bqstorage_client=False).to_pandas()
+
+
+def read_storage(schema, streams, rtt):
+    def read_stream(serialized_batches):
+        batches = []
+        for serialized in serialized_batches:
+            time.sleep(rtt)
+            batches.append(pa.ipc.read_record_batch(pa.py_buffer(serialized), schema))
+        return batches
+
+    with ThreadPoolExecutor(max_workers=len(streams)) as executor:
+        batches = [batch for stream in executor.map(read_stream, streams) for batch in stream]
+    return pa.Table.from_batches(batches, schema=schema).to_pandas()
+
+
+def measure(name, read, rows):
+    start = time.perf_counter()
+    df = read()
+    elapsed = time.perf_counter() - start
+    assert len(df) == rows
+    print('{:<18} {:>8.2f} 秒  {:>12,.0f} rows/sec'.format(name, elapsed, rows / elapsed))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=200000, help='クエリ結果の行数')
+    parser.add_argument('--page-size', type=int, default=10000, help='1ページ（レコードバッチ）あたりの行数')
+    parser.add_argument('--streams', type=int, default=4, help='Storage Read APIのストリーム数')
+    parser.add_argument('--rtt-ms', type=float, default=0, help='1ページあたりの応答待ち（ミリ秒）')
+    args = parser.parse_args()
+
+    table = create_table(args.rows)
+    pages = create_rest_pages(table, args.page_size)
+    schema, streams = create_storage_streams(table, args.page_size, args.streams)
+    rtt = args.rtt_ms / 1000
+    print('レスポンスの合計バイト数  REST API: {:,}  Storage Read API: {:,}'.format(
+        sum(len(json.dumps(page)) for page in pages),
+        sum(len(batch) for stream in streams for batch in stream)))
+
+    measure('REST API', lambda: read_rest(pages, args.page_size, rtt), args.rows)
+    measure('Storage Read API', lambda: read_storage(schema, streams, rtt), args.rows)
+
+
+if __name__ == '__main__':
+    main()
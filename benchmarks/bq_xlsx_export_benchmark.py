@@ -0,0 +1,96 @@
+"""bq_to_google_drive_hook.execute_sqlのXLSX出力のrows/secと最大メモリ使用量を、偽のバックエンドで計測する。
+
+従来の処理（全件をDataFrameで取得し、itertuplesでセルごとにworksheet.writeで書き込む）と、
+現在の処理（bq_hook.bq_query_to_fileのXLSX出力。ページ単位で取得して1行ずつwrite_rowで書き込む）を比較する。
+クエリの結果はbq_query_to_file_benchmarkの偽のRowIteratorで生成するため、認証情報とネットワークは不要。
+従来の処理はタイムゾーン付きの日時を書き込めないため、TIMESTAMPの列はタイムゾーンを除いてから書き込む。
+最大メモリ使用量（ru_maxrss）はプロセス単位のため、処理毎に別プロセスで計測する。
+
+実行方法（リポジトリのルートで実行する）:
+    python benchmarks/bq_xlsx_export_benchmark.py --rows 1000000 --page-size 10000
+"""
+import argparse
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import pandas as pd
+import xlsxwriter
+
+from bq_query_to_file_benchmark import export_file, get_peak_rss_mb, get_source
+
+MODES = ('DataFrame', 'XLSX')
+
+
+def export_dataframe(source, local_file, print_header=True):
+    """従来の処理。全件をDataFrameで取得してから、セルごとに書き込む。
+    """
+    start = time.time()
+    df = source.to_arrow(create_bqstorage_client=False).to_pandas()
+    for column in df.columns:
+        if isinstance(df[column].dtype, pd.DatetimeTZDtype):
+            df[column] = df[column].dt.tz_localize(None)
+    workbook = xlsxwriter.Workbook(local_file, {'constant_memory': True})
+    worksheet = workbook.add_worksheet()
+    for index_row, row_data in enumerate(df.itertuples(name=None)):
+        if index_row == 0 and print_header:
+            continue
+        for index_column, data in enumerate(row_data):
+            if index_column == 0:
+                continue
+            worksheet.write(index_row, index_column - 1, data)
+    workbook.close()
+    elapsed_seconds = time.time() - start
+    return {
+        'records': len(df),
+        'elapsed_seconds': round(elapsed_seconds, 3),
+        'peak_rss_mb': get_peak_rss_mb(),
+    }
+
+
+def run_child(mode, source):
+    """1つの処理を計測し、結果をJSONで標準出力に出力する。
+    """
+    with tempfile.TemporaryDirectory() as work_dir:
+        local_file = os.path.join(work_dir, 'result.xlsx')
+        if mode == 'DataFrame':
+            result = export_dataframe(source, local_file)
+        else:
+            result = export_file(source, local_file, mode)
+        result['bytes'] = os.path.getsize(local_file)
+    print(json.dumps(result))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=1000000, help='クエリ結果の行数')
+    parser.add_argument('--page-size', type=int, default=10000, help='1ページあたりの行数')
+    parser.add_argument('--source', default='arrow', choices=('arrow', 'rest'), help='偽のRowIteratorの種類')
+    parser.add_argument('--modes', nargs='+', default=MODES, choices=MODES, help='計測する処理')
+    parser.add_argument('--child', choices=MODES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child is not None:
+        # lib.loggerのログ出力を抑止する
+        logging.disable(logging.WARNING)
+        run_child(args.child, get_source(args.source, args.rows, args.page_size))
+        return
+
+    print('{:<10} {:>10} {:>12} {:>8} {:>12} {:>12}'.format('処理', 'レコード数', 'ファイルサイズ', '秒', 'rows/sec', '最大RSS(MB)'))
+    for mode in args.modes:
+        output = subprocess.run([sys.executable, os.path.abspath(__file__),
+                                 '--rows', str(args.rows), '--page-size', str(args.page_size),
+                                 '--source', args.source, '--child', mode],
+                                check=True, stdout=subprocess.PIPE, universal_newlines=True).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        print('{:<10} {:>10,} {:>12,} {:>8.2f} {:>12,.0f} {:>12.1f}'.format(
+            mode, result['records'], result['bytes'], result['elapsed_seconds'],
+            result['records'] / result['elapsed_seconds'], result['peak_rss_mb']))
+
+
+if __name__ == '__main__':
+    main()
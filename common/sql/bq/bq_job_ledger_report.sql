@@ -0,0 +1,70 @@
+-- SQLファイル毎の日別の課金バイト数、スロット時間、実行時間の集計。
+-- 期間内の課金バイト数、実行時間の上位@top_n件のSQLファイルを出力する。
+-- @param days INT64
+-- @param top_n INT64
+WITH jobs AS (
+    -- タスクのリトライで同じジョブが複数回記録されるため、ジョブID毎に1件とする
+    SELECT
+        *
+    FROM
+        `jinzaisystem-tool.bq_job_ledger.job_statistics`
+    WHERE
+        DATE(recorded_at) >= DATE_SUB(CURRENT_DATE('Asia/Tokyo'), INTERVAL @days DAY)
+        AND job_type = 'query'
+    QUALIFY
+        ROW_NUMBER() OVER (PARTITION BY job_id ORDER BY recorded_at DESC) = 1
+),
+daily AS (
+    SELECT
+        COALESCE(sql_file, '(クエリ文字列)') AS sql_file,
+        DATE(start_time, 'Asia/Tokyo') AS run_date,
+        COUNT(*) AS job_count,
+        COUNTIF(state = 'FAILED') AS failed_count,
+        COUNTIF(cache_hit) AS cache_hit_count,
+        SUM(total_bytes_billed) AS total_bytes_billed,
+        SUM(slot_ms) AS slot_ms,
+        SUM(elapsed_ms) AS elapsed_ms,
+        MAX(elapsed_ms) AS max_elapsed_ms,
+        SUM(rows_written) AS rows_written,
+        ARRAY_AGG(DISTINCT CONCAT(dag_id, '.', task_id) IGNORE NULLS) AS tasks
+    FROM
+        jobs
+    GROUP BY
+        sql_file, run_date
+),
+ranking AS (
+    SELECT
+        sql_file,
+        RANK() OVER (ORDER BY SUM(total_bytes_billed) DESC) AS bytes_billed_rank,
+        RANK() OVER (ORDER BY SUM(elapsed_ms) DESC) AS elapsed_rank,
+        RANK() OVER (ORDER BY SUM(slot_ms) DESC) AS slot_rank
+    FROM
+        daily
+    GROUP BY
+        sql_file
+)
+SELECT
+    r.bytes_billed_rank,
+    r.elapsed_rank,
+    r.slot_rank,
+    d.sql_file,
+    d.run_date,
+    d.job_count,
+    d.failed_count,
+    d.cache_hit_count,
+    ROUND(d.total_bytes_billed / POW(1024, 3), 2) AS gib_billed,
+    ROUND(d.slot_ms / 1000 / 60, 1) AS slot_minutes,
+    ROUND(d.elapsed_ms / 1000, 1) AS elapsed_seconds,
+    ROUND(d.max_elapsed_ms / 1000, 1) AS max_elapsed_seconds,
+    d.rows_written,
+    d.tasks
+FROM
+    daily AS d
+    INNER JOIN ranking AS r
+        ON d.sql_file = r.sql_file
+WHERE
+    r.bytes_billed_rank <= @top_n
+    OR r.elapsed_rank <= @top_n
+    OR r.slot_rank <= @top_n
+ORDER BY
+    r.bytes_billed_rank, d.sql_file, d.run_date
@@ -0,0 +1,31 @@
+-- lib.utils.bq_job_ledgerが統計情報を記録するテーブルの作成SQL
+-- ジョブを実行するプロジェクト毎に作成する。プロジェクトIDは作成するプロジェクトに置き換える。
+CREATE TABLE IF NOT EXISTS `jinzaisystem-tool.bq_job_ledger.job_statistics`
+(
+    job_id STRING NOT NULL,
+    job_type STRING,
+    project_id STRING,
+    location STRING,
+    state STRING,
+    error STRING,
+    dag_id STRING,
+    task_id STRING,
+    execution_date STRING,
+    sql_file STRING,
+    creation_time TIMESTAMP,
+    start_time TIMESTAMP,
+    end_time TIMESTAMP,
+    elapsed_ms INT64,
+    total_bytes_processed INT64,
+    total_bytes_billed INT64,
+    slot_ms INT64,
+    cache_hit BOOL,
+    rows_written INT64,
+    stages STRING,
+    recorded_at TIMESTAMP NOT NULL
+)
+PARTITION BY DATE(recorded_at)
+CLUSTER BY dag_id, task_id
+OPTIONS (
+    partition_expiration_days = 400
+)
@@ -41,3 +41,8 @@ class SendGridFailedToSendException(Exception):
 class SendGridNotAllowedToSendException(Exception):
     """SendGridで許可されていない宛先に送信しようとしたときの例外クラス
     """
+
+
+class BqBytesBilledExceededException(Exception):
+    """BigQueryのクエリの処理バイト数の見積もりが、課金バイト数の上限を超えたときの例外クラス
+    """
@@ -1,7 +1,38 @@
+import datetime
+import decimal
+import csv
+import gzip
+import hashlib
+import json
+import os
+import random
 import re
+import resource
+import shutil
+import tempfile
+import threading
+import time
+import uuid
 
+from google.api_core import exceptions as api_exceptions
+from google.api_core.exceptions import GoogleAPICallError, NotFound
 from google.cloud import bigquery
 from google.oauth2 import service_account
+import pyarrow as pa
+import pyarrow.parquet as pq
+import xlsxwriter
+
+from lib.errors.exception import BqBytesBilledExceededException
+from lib.logger import logger
+from lib.utils import bq_job_ledger
+from lib.utils.bq_result_cache import BqResultCache
+from lib.utils.cloud_storage import CloudStorageClient
+
+try:
+    # BigQuery Storage Read APIはオプション。未インストールの場合はREST APIで結果を取得する
+    from google.cloud import bigquery_storage
+except ImportError:
+    bigquery_storage = None
 
 # サービスアカウント認証ファイル
 CREDENTIALS_FILE = 'config/jinzaisystem-tool-composer.json'
@@ -9,14 +40,94 @@ CREDENTIALS_FILE = 'config/jinzaisystem-tool-composer.json'
 # AirflowのDAGディレクトリ
 AIRFLOW_DAGS_DIR = '/home/airflow/gcs/dags'
 
+# BigQueryクライアントのキャッシュ（ワーカープロセス内で共有）
+__clients = {}
+# BigQuery Storage Read APIクライアントのキャッシュ
+__bqstorage_clients = {}
+# 認証情報のキャッシュ
+__credentials = {}
+__client_lock = threading.Lock()
+# 実行中のタスクインスタンスの試行での、ジョブの内容ごとの呼び出し回数。同じ内容のジョブを1タスクで複数回実行する場合に区別する
+# {(DAG ID, タスクID, 実行日時, 試行回数): {ジョブの内容: 呼び出し回数}}。別の試行になったら破棄する
+__job_sequences = {}
+__job_sequence_lock = threading.Lock()
+
+# bq_query_manyのデフォルトの同時実行数
+DEFAULT_MAX_CONCURRENCY = 5
+# bq_query_manyでジョブの状態を確認する間隔（秒）
+DEFAULT_POLL_INTERVAL = 5
+# bq_query_manyでジョブの状態の取得が連続して失敗した場合に、ジョブを失敗とする回数
+MAX_POLL_ERRORS = 5
+
+# bq_loadで読み込めるファイル形式。CSVとNEWLINE_DELIMITED_JSONはgzip圧縮したファイルも読み込める
+LOAD_SOURCE_FORMATS = ('CSV', 'NEWLINE_DELIMITED_JSON', 'PARQUET', 'AVRO', 'ORC')
+# bq_load_fileで送信時にgzip圧縮するファイル形式。PARQUET、AVRO、ORCはファイル自体が圧縮されている
+LOAD_GZIP_SOURCE_FORMATS = ('CSV', 'NEWLINE_DELIMITED_JSON')
+# クエリパラメータに指定できる型
+QUERY_PARAMETER_TYPES = ('STRING', 'BYTES', 'INT64', 'FLOAT64', 'NUMERIC', 'BIGNUMERIC', 'BOOL',
+                         'DATE', 'DATETIME', 'TIMESTAMP', 'TIME', 'GEOGRAPHY')
+# クエリパラメータの型の別名
+QUERY_PARAMETER_TYPE_ALIASES = {'INTEGER': 'INT64', 'FLOAT': 'FLOAT64', 'BOOLEAN': 'BOOL'}
+# SQLファイル先頭のコメントに記載するクエリパラメータの型ヒント。例: -- @param target_date DATE
+QUERY_PARAMETER_HINT_PATTERN = re.compile(r'^\s*--\s*@param\s+(\w+)\s+(\S+)\s*$')
+# 保存先テーブルの差分更新の書き込み方法
+# MERGE: キー列が一致する行を更新し、一致しない行を追加する
+# REPLACE_PARTITIONS: クエリの結果に含まれるパーティションのみを置き換える
+INCREMENTAL_WRITE_DISPOSITIONS = ('MERGE', 'REPLACE_PARTITIONS')
+# 差分更新でクエリの結果を保存する一時テーブル名
+INCREMENTAL_STAGING_TABLE = '_incremental_staging'
+# 差分更新で更新対象のパーティションを保持する変数名
+INCREMENTAL_PARTITIONS_VARIABLE = '_incremental_partitions'
+# skip_if_unchangedで保存先テーブルに記録するフィンガープリントのラベルのキー
+FINGERPRINT_LABEL_KEY = 'bq_hook_input_fingerprint'
+# フィンガープリントの文字数。ラベルの値は63文字以内
+FINGERPRINT_LABEL_LENGTH = 32
+# bq_query_to_fileで出力できるファイル形式
+QUERY_FILE_FORMATS = ('CSV', 'CSV_GZIP', 'PARQUET', 'XLSX')
+# XLSXの1シートあたりの最大行数
+XLSX_MAX_ROWS = 1048576
+# XLSXの列の表示形式。BigQueryの型ごとに設定する
+XLSX_NUM_FORMATS = {
+    'DATE': 'yyyy-mm-dd',
+    'DATETIME': 'yyyy-mm-dd hh:mm:ss',
+    'TIMESTAMP': 'yyyy-mm-dd hh:mm:ss',
+    'TIME': 'hh:mm:ss',
+}
+# ジョブのデフォルトのリトライ回数
+DEFAULT_RETRY = 3
+# リトライ間隔の基準値（秒）。リトライ毎に2倍にし、ジッターを加える
+RETRY_BASE_INTERVAL = 5
+# リトライ間隔の上限（秒）
+RETRY_MAX_INTERVAL = 120
+# 一時的なエラーとしてリトライするHTTPエラー
+TRANSIENT_API_EXCEPTIONS = (
+    api_exceptions.TooManyRequests,
+    api_exceptions.InternalServerError,
+    api_exceptions.BadGateway,
+    api_exceptions.ServiceUnavailable,
+    api_exceptions.GatewayTimeout,
+)
+# 一時的なエラーとしてリトライするBigQueryのエラー理由
+TRANSIENT_ERROR_REASONS = ('backendError', 'internalError', 'rateLimitExceeded', 'jobBackendError', 'jobInternalError')
+
+# 実行の度に結果が変わる関数。これらを含むクエリは結果をキャッシュしない
+NON_DETERMINISTIC_FUNCTION_PATTERN = re.compile(
+    r'\b(CURRENT_DATE|CURRENT_DATETIME|CURRENT_TIME|CURRENT_TIMESTAMP|RAND|GENERATE_UUID|SESSION_USER)\b',
+    re.IGNORECASE)
+
 
 def __get_client(project_id,
-                 local=False):
+                 local=False,
+                 location=None):
     """BigQueryクライアントインスタンスを取得する。
+    クライアントは（プロジェクト、認証ファイル、ロケーション）をキーにプロセス内でキャッシュし、
+    認証情報とHTTPセッション（コネクションプール）を使い回す。
+    アクセストークンは有効期限が切れると認証情報が自動でリフレッシュする。
 
     Args:
         project_id (str): BigQueryのジョブを実行するプロジェクト。
         local (bool): ローカル環境で実行する場合はTrue. Defaults to False.
+        location (str): BigQueryのジョブを実行するロケーション。 Defaults to None.
 
     Returns:
         bigquery.Client
@@ -26,44 +137,199 @@ def __get_client(project_id,
     else:
         credentials_file_path = '{}/{}'.format(AIRFLOW_DAGS_DIR, CREDENTIALS_FILE)
 
-    # サービスアカウント認証
-    credentials = service_account.Credentials.from_service_account_file(
-        credentials_file_path,
-        scopes=["https://www.googleapis.com/auth/cloud-platform"],
-    )
+    key = (project_id, credentials_file_path, location)
+    with __client_lock:
+        client = __clients.get(key)
+        if client is None:
+            # BigQueryクライアント作成
+            client = bigquery.Client(project=project_id,
+                                     credentials=__get_credentials(credentials_file_path),
+                                     location=location)
+            __clients[key] = client
+    return client
+
+
+def __get_bqstorage_client(local=False):
+    """BigQuery Storage Read APIのクライアントインスタンスを取得する。
+    クライアントは認証ファイルをキーにプロセス内でキャッシュする。
+
+    Args:
+        local (bool): ローカル環境で実行する場合はTrue. Defaults to False.
+
+    Returns:
+        bigquery_storage.BigQueryReadClient: ライブラリが利用できない場合はNone
+    """
+    if bigquery_storage is None:
+        logger.warn('google-cloud-bigquery-storageがインストールされていないため、REST APIで結果を取得します。')
+        return None
+
+    if local:
+        credentials_file_path = CREDENTIALS_FILE
+    else:
+        credentials_file_path = '{}/{}'.format(AIRFLOW_DAGS_DIR, CREDENTIALS_FILE)
 
-    # BigQueryクライアント作成
-    client = bigquery.Client(project=project_id, credentials=credentials)
+    with __client_lock:
+        client = __bqstorage_clients.get(credentials_file_path)
+        if client is None:
+            client = bigquery_storage.BigQueryReadClient(
+                credentials=__get_credentials(credentials_file_path))
+            __bqstorage_clients[credentials_file_path] = client
     return client
 
 
-def __set_query_params(query_parameters):
+def __get_credentials(credentials_file_path):
+    """サービスアカウントの認証情報を取得する。
+    認証ファイルはGCS-fuse上にあるため、読み込みは認証ファイル毎に1回のみとする。
+    呼び出し元でロックを取得していること。
+
+    Args:
+        credentials_file_path (str): サービスアカウント認証ファイルのパス
+
+    Returns:
+        google.oauth2.service_account.Credentials
+    """
+    credentials = __credentials.get(credentials_file_path)
+    if credentials is None:
+        # サービスアカウント認証
+        credentials = service_account.Credentials.from_service_account_file(
+            credentials_file_path,
+            scopes=["https://www.googleapis.com/auth/cloud-platform"],
+        )
+        __credentials[credentials_file_path] = credentials
+    return credentials
+
+
+def __set_query_params(query_parameters, query_str=None):
     """query_paramsを設定する
+    型はPythonの型から決める。SQLファイル先頭のコメントに型ヒントがある場合は、型ヒントの型とする。
 
     Args:
         query_parameters (dict)
+        query_str (str): クエリ文字列。型ヒントを読み取る。 Defaults to None.
+
+    Raises:
+        ValueError: クエリパラメータに指定できない型の場合
 
     Returns:
         query_params
     """
+    type_hints = __get_query_param_type_hints(query_str) if query_str is not None else {}
     query_params = []
     for k, v in query_parameters.items():
-        if type(v) == str:
-            query_params.append(bigquery.ScalarQueryParameter(k, 'STRING', v))
-        elif type(v) == int:
-            query_params.append(bigquery.ScalarQueryParameter(k, 'INT64', v))
-        elif type(v) == float:
-            query_params.append(bigquery.ScalarQueryParameter(k, 'FLOAT', v))
-        else:
+        if v is None and k not in type_hints:
+            logger.warn('クエリパラメータ{}の値がNoneで型ヒントがないため、設定しません。'.format(k))
             continue
+        query_params.append(__get_query_param(k, v, type_hints.get(k)))
     return query_params
 
 
+def __get_query_param_type_hints(query_str):
+    """SQLファイル先頭のコメントから、クエリパラメータの型ヒントを取得する。
+    「-- @param 変数名 型」の形式で記載する。配列は「ARRAY<型>」とする。
+
+    Args:
+        query_str (str): クエリ文字列
+
+    Raises:
+        ValueError: 型ヒントの型が不正な場合
+
+    Returns:
+        dict: 変数名と型のdict
+    """
+    type_hints = {}
+    for line in query_str.splitlines():
+        if line.strip() == '':
+            continue
+        if not line.lstrip().startswith('--'):
+            break
+        m = QUERY_PARAMETER_HINT_PATTERN.match(line)
+        if m is None:
+            continue
+        type_hint = m.group(2).upper()
+        array_match = re.match(r'^ARRAY<(\w+)>$', type_hint)
+        if array_match is not None:
+            type_hints[m.group(1)] = 'ARRAY<{}>'.format(__normalize_query_param_type(array_match.group(1)))
+        else:
+            type_hints[m.group(1)] = __normalize_query_param_type(type_hint)
+    return type_hints
+
+
+def __normalize_query_param_type(type_name):
+    type_name = QUERY_PARAMETER_TYPE_ALIASES.get(type_name.upper(), type_name.upper())
+    if type_name not in QUERY_PARAMETER_TYPES:
+        raise ValueError('クエリパラメータの型ヒント{}は指定できません。'.format(type_name))
+    return type_name
+
+
+def __get_query_param(name, value, type_hint=None):
+    """クエリパラメータを作成する。
+
+    Args:
+        name (str): 変数名。配列、構造体の要素の場合はNone
+        value: 値
+        type_hint (str): 型ヒント。Noneの場合はvalueの型から決める。 Defaults to None.
+
+    Raises:
+        ValueError: クエリパラメータに指定できない型の場合
+
+    Returns:
+        ScalarQueryParameter、ArrayQueryParameter、StructQueryParameterのいずれか
+    """
+    if type_hint is not None and type_hint.startswith('ARRAY<'):
+        return bigquery.ArrayQueryParameter(name, type_hint[len('ARRAY<'):-1], value if value is not None else [])
+    if type_hint is not None:
+        return bigquery.ScalarQueryParameter(name, type_hint, value)
+
+    if isinstance(value, (list, tuple)):
+        elements = [v for v in value if v is not None]
+        if not elements:
+            raise ValueError('クエリパラメータ{}は空の配列のため、SQLファイルに型ヒントを記載してください。'.format(name))
+        if isinstance(elements[0], dict):
+            return bigquery.ArrayQueryParameter(name, 'STRUCT', [__get_query_param(None, v) for v in value])
+        return bigquery.ArrayQueryParameter(name, __get_scalar_query_param_type(name, elements[0]), list(value))
+    if isinstance(value, dict):
+        return bigquery.StructQueryParameter(name, *[__get_query_param(k, v) for k, v in value.items()])
+    return bigquery.ScalarQueryParameter(name, __get_scalar_query_param_type(name, value), value)
+
+
+def __get_scalar_query_param_type(name, value):
+    """値の型から、クエリパラメータの型を決める。
+
+    Raises:
+        ValueError: クエリパラメータに指定できない型の場合
+
+    Returns:
+        str: クエリパラメータの型
+    """
+    # boolはintのサブクラス、datetimeはdateのサブクラスのため先に判定する
+    if isinstance(value, bool):
+        return 'BOOL'
+    if isinstance(value, int):
+        return 'INT64'
+    if isinstance(value, float):
+        return 'FLOAT64'
+    if isinstance(value, decimal.Decimal):
+        return 'NUMERIC'
+    if isinstance(value, str):
+        return 'STRING'
+    if isinstance(value, bytes):
+        return 'BYTES'
+    if isinstance(value, datetime.datetime):
+        return 'DATETIME' if value.tzinfo is None else 'TIMESTAMP'
+    if isinstance(value, datetime.date):
+        return 'DATE'
+    if isinstance(value, datetime.time):
+        return 'TIME'
+    raise ValueError('クエリパラメータ{}の型{}は指定できません。'.format(name, type(value).__name__))
+
+
 def __set_query_job_config(client,
                            project_id,
                            destination=None,
                            query_parameters=None,
-                           write_disposition=None):
+                           write_disposition=None,
+                           maximum_bytes_billed=None,
+                           query_str=None):
     """bq query実行時に渡すjob_configを設定する
 
     Raises:
@@ -87,7 +353,7 @@ def __set_query_job_config(client,
 
     # クエリパラメータ
     if query_parameters is not None:
-        job_config.query_parameters = __set_query_params(query_parameters)
+        job_config.query_parameters = __set_query_params(query_parameters, query_str=query_str)
 
     # write_disposition
     if write_disposition == 'WRITE_EMPTY':
@@ -99,6 +365,10 @@ def __set_query_job_config(client,
     else:
         raise ValueError('write_dispositionの値が不正です。')
 
+    # 課金バイト数の上限。超える場合はBigQuery側でもジョブが失敗する
+    if maximum_bytes_billed is not None:
+        job_config.maximum_bytes_billed = maximum_bytes_billed
+
     return job_config
 
 
@@ -153,6 +423,89 @@ def __set_extract_job_config(compression=None,
     return job_config
 
 
+def __set_load_job_config(skip_leading_rows=1,
+                          write_disposition=None,
+                          field_delimiter=',',
+                          quote_character=None,
+                          allow_quoted_newlines=True,
+                          source_format=None,
+                          schema=None,
+                          autodetect=False,
+                          time_partitioning=None,
+                          clustering_fields=None):
+    """bq loadに渡すjob_configを設定する。
+    skip_leading_rows、field_delimiter、quote_character、allow_quoted_newlinesはCSVの場合のみ設定する。
+
+    Raises:
+        ValueError: source_formatが対応していない形式の場合
+
+    Returns:
+        bigquery.LoadJobConfig
+    """
+    if source_format is None:
+        source_format = 'CSV'
+    source_format = source_format.upper()
+    if source_format not in LOAD_SOURCE_FORMATS:
+        raise ValueError('source_formatは{}のいずれかを指定してください。'.format('、'.join(LOAD_SOURCE_FORMATS)))
+
+    job_config = bigquery.LoadJobConfig()
+    job_config.source_format = source_format
+    job_config.write_disposition = write_disposition
+    if source_format == 'CSV':
+        job_config.skip_leading_rows = skip_leading_rows
+        job_config.field_delimiter = field_delimiter
+        job_config.quote_character = quote_character
+        job_config.allow_quoted_newlines = allow_quoted_newlines
+    if source_format == 'AVRO':
+        # DATE、TIMESTAMP等の論理型をBigQueryの型で読み込む
+        job_config.use_avro_logical_types = True
+    if schema is not None:
+        job_config.schema = __get_schema(schema)
+    if autodetect:
+        job_config.autodetect = True
+    if time_partitioning is not None:
+        job_config.time_partitioning = __get_time_partitioning(time_partitioning)
+    if clustering_fields is not None:
+        job_config.clustering_fields = clustering_fields
+    return job_config
+
+
+def __get_schema(schema):
+    """テーブルのスキーマを作成する。
+
+    Args:
+        schema (list(dict) or list(bigquery.SchemaField)): スキーマ。
+            dictの場合はBigQueryのJSONスキーマと同じ書式で指定する。
+            例: [{'name': 'id', 'type': 'INTEGER', 'mode': 'REQUIRED'}, {'name': 'name', 'type': 'STRING'}]
+
+    Returns:
+        list(bigquery.SchemaField)
+    """
+    return [field if isinstance(field, bigquery.SchemaField) else bigquery.SchemaField.from_api_repr(field)
+            for field in schema]
+
+
+def __get_time_partitioning(time_partitioning):
+    """テーブルのパーティショニングの設定を作成する。
+
+    Args:
+        time_partitioning (str or dict): パーティション列名、または以下のキーを持つdict。
+            field (str): パーティション列名。省略した場合は取り込み時間でパーティショニングする。
+            type (str): 'DAY'、'HOUR'、'MONTH'、'YEAR'のいずれか。省略した場合は'DAY'。
+            expiration_ms (int): パーティションの有効期限（ミリ秒）
+
+    Returns:
+        bigquery.TimePartitioning
+    """
+    if isinstance(time_partitioning, bigquery.TimePartitioning):
+        return time_partitioning
+    if isinstance(time_partitioning, str):
+        time_partitioning = {'field': time_partitioning}
+    return bigquery.TimePartitioning(type_=time_partitioning.get('type', 'DAY'),
+                                     field=time_partitioning.get('field'),
+                                     expiration_ms=time_partitioning.get('expiration_ms'))
+
+
 def bq_query(sql,
              project_id=None,
              destination=None,
@@ -162,8 +515,18 @@ def bq_query(sql,
              is_return_result=False,
              return_type='list',
              max_return_records=1000000,
+             page_size=None,
              by_query_str=False,
              location=None,
+             use_bqstorage=False,
+             use_result_cache=False,
+             result_cache_gcs_bucket=None,
+             estimate_cost=False,
+             maximum_bytes_billed=None,
+             retry=None,
+             merge_keys=None,
+             partition_window=None,
+             skip_if_unchanged=False,
              local=False,
              **kwargs):
     """SQLを実行する。
@@ -180,20 +543,70 @@ def bq_query(sql,
         query_parameters (dict): クエリパラメータ。. Defaults to None.
                                     SQLファイルに、「@hoge」「@hoge2」のように変数を設定することで、パラメータを設定できる。
                                     {'hoge': 'value', 'hoge2', 'value2'}のようにdictでパラメータを設定する。
-                                    valueの部分は、str、int、floatのみ設定可能。これ以外の型の場合、
-                                    クエリパラメータには設定されず、無視される。
+                                    valueの型からクエリパラメータの型を決める。bool、int、float、Decimal、str、bytes、
+                                    date(DATE)、datetime(タイムゾーンなしはDATETIME、ありはTIMESTAMP)、time、list(ARRAY)、dict(STRUCT)を設定可能。
+                                    SQLファイル先頭に「-- @param hoge DATE」のように型ヒントを記載した場合は、その型とする。
+                                    これ以外の型の場合はValueError。型ヒントがなく値がNoneの場合は設定されない。
         xcom_parameters (dict): クエリパラメータ。. Defaults to None.
                                     「'task_id' : <タスクID>」と「'key' : <XCOMのキー>」のdist形式で指定で指定する。
                                     XCOMから値を取得してクエリパラメータに追加する。
                                     クエリパラメータに追加するキーは<XCOMのキー>とする。
         write_disposition (str): 保存先テーブルの書き込み方法. Defaults to 'WRITE_EMPTY'.
-                                    'WRITE_EMPTY','WRITE_APPEND','WRITE_TRUNCATE'のいずれか。
+                                    'WRITE_EMPTY','WRITE_APPEND','WRITE_TRUNCATE','MERGE','REPLACE_PARTITIONS'のいずれか。
+                                    'MERGE'の場合、merge_keysが一致する行を更新し、一致しない行を追加する。
+                                    'REPLACE_PARTITIONS'の場合、クエリの結果に含まれるパーティションのみを置き換える。
+                                    いずれも保存先テーブルは作成済みであること。
         is_return_result (bool): Trueの場合、クエリの結果をreturnで返す。. Defaults to False.
-        return_type (str): クエリの結果をreturnで（list, df）返す。. Defaults to list.
-        max_return_records (int): クエリの結果をlistで返す場合の最大レコード数。指定がなければ1000000を設定する。
+        return_type (str): クエリの結果をreturnで返す型。以下のいずれか。. Defaults to list.
+                            list: dictのlist
+                            df: DataFrame
+                            rows: 1行ずつdictを返すジェネレータ。結果はページ単位で取得する。
+                            arrow_batches: ページ単位のpyarrow.RecordBatchのイテレータ
+                            df_chunks: ページ単位のDataFrameのイテレータ
+                            row_iterator: google.cloud.bigquery.table.RowIterator。スキーマを参照する場合に使う。
+                                          use_result_cacheとは併用できない。
+                            rows、arrow_batches、df_chunks、row_iteratorの場合、メモリに保持するのは1ページ分のみとなる。
+        max_return_records (int): クエリの結果をlist、rows、arrow_batches、df_chunks、row_iteratorで返す場合の最大レコード数。
+                                  APIのmax_resultsに設定し、最大レコード数を超える結果は取得しない。
+                                  rows、arrow_batches、df_chunks、row_iteratorの場合、0を指定すると全件を取得する。
+                                  指定がなければ1000000を設定する。
+        page_size (int): クエリの結果を取得する際の1ページあたりのレコード数。
+                         Noneの場合、APIのデフォルト値。 Defaults to None.
         by_query_str (bool): Trueの場合、パラメータsqlをクエリ文字列として扱う。
                             Falseの場合、パラメータsqlをSQLファイルパスとして扱う。 Defaults to False.
         location (str): BigQueryのジョブを実行するロケーション。指定がなければ asia-northeast1. Defaults to None.
+        use_bqstorage (bool): Trueの場合、return_typeがlist、dfの結果をBigQuery Storage Read APIで取得する。
+                              クエリ結果の一時テーブルを複数ストリームで並列に読み込むため、大量データの取得が速い。
+                              listの場合、最大レコード数は取得後に切り詰める。
+                              Storage Read APIが利用できない場合はREST APIで取得する。 Defaults to False.
+        use_result_cache (bool): Trueの場合、クエリの結果をキャッシュし、同じ結果となるクエリはジョブを実行せずに
+                                 キャッシュから返す。is_return_resultがTrue、destinationがNoneの場合のみ有効。
+                                 キャッシュのキーは正規化したSQL、クエリパラメータ、参照テーブルの最終更新日時とする。
+                                 参照テーブルの取得にはdry runを利用する。
+                                 CURRENT_DATE等の関数を含むクエリ、テーブル以外（外部テーブル等）や
+                                 ストリーミングバッファがあるテーブルを参照するクエリはキャッシュしない。
+                                 キャッシュする場合、max_return_recordsは取得後に切り詰める。 Defaults to False.
+        result_cache_gcs_bucket (str): クエリの結果のキャッシュを保存するGCSのバケット名。gs://hogehoge
+                                       Noneの場合、ワーカーのローカルディスクにのみ保存する。 Defaults to None.
+        estimate_cost (bool): Trueの場合、ジョブの実行前にdry runで処理バイト数の見積もりと参照テーブルを取得し、
+                              ログに出力する。Airflowから実行した場合はXCOMのキー「bq_dry_run」にpushする。
+                              Defaults to False.
+        maximum_bytes_billed (int): 課金バイト数の上限。指定した場合はestimate_costに関わらずdry runを行い、
+                                    見積もりが上限を超える場合はジョブを実行せずに例外を発生させる。
+                                    Noneの場合、上限なし。 Defaults to None.
+        retry (int): 一時的なエラーの場合のリトライ回数。指定がなければDEFAULT_RETRY。 Defaults to None.
+                     Airflowから実行した場合、ジョブIDをタスクインスタンスとクエリから決定的に作成し、
+                     タスクのリトライ時も実行中または成功済みのジョブがあれば再投入しない。
+        merge_keys (list(str)): write_dispositionが'MERGE'の場合のキー列名のリスト。キー列はNULLを含まないこと。
+                                Defaults to None.
+        partition_window (tuple): write_dispositionが'MERGE'、'REPLACE_PARTITIONS'の場合に更新するパーティションの範囲。
+                                  (開始, 終了)のtupleで、パーティション列の型の値、または文字列で指定する。
+                                  範囲外のクエリの結果の行は書き込まない。
+                                  Noneの場合、クエリの結果に含まれるパーティションのみを更新する。 Defaults to None.
+        skip_if_unchanged (bool): Trueの場合、dry runで取得した参照テーブルの最終更新日時、SQL、クエリパラメータの
+                                  フィンガープリントが、前回の実行時に保存先テーブルのラベルに記録したものと一致すれば、
+                                  ジョブを実行しない。判定結果と理由はXCOMのキー「bq_skip_if_unchanged」にpushする。
+                                  destinationを指定した場合のみ有効。 Defaults to False.
         local (bool): ローカル環境で実行する場合はTrue. Defaults to False.
     """
     if project_id is None:
@@ -204,18 +617,12 @@ def bq_query(sql,
         location = 'asia-northeast1'
     if max_return_records is None:
         max_return_records = 1000000
+    if use_result_cache and is_return_result and return_type == 'row_iterator':
+        raise ValueError('return_typeがrow_iteratorの場合、use_result_cacheは指定できません。')
 
 
 
-    if by_query_str:
-        # パラメータのクエリ文字列を利用
-        query_str = sql
-    else:
-        if local is False:
-            sql = '{}/{}'.format(AIRFLOW_DAGS_DIR, sql)
-        # SQLファイルを読み込みクエリ文字列を作成
-        with open(sql, encoding='UTF-8') as f:
-            query_str = f.read()
+    query_str = read_query_str(sql, by_query_str=by_query_str, local=local)
 
     # XCOMのキーの数だけ値を取得する
     if xcom_parameters is not None:
@@ -231,32 +638,990 @@ def bq_query(sql,
             query_parameters[xcom_parameter['key']] = value
 
     # クライアント作成
-    client = __get_client(project_id, local=local)
+    client = __get_client(project_id, local=local, location=location)
 
     # BigQueryにクエリを実行、データを取得
+    is_incremental = write_disposition in INCREMENTAL_WRITE_DISPOSITIONS
     job_config = __set_query_job_config(client=client,
                                         project_id=project_id,
                                         destination=destination,
                                         query_parameters=query_parameters,
-                                        write_disposition=write_disposition)
+                                        write_disposition='WRITE_EMPTY' if is_incremental else write_disposition,
+                                        maximum_bytes_billed=maximum_bytes_billed,
+                                        query_str=query_str)
+    job_config.labels = bq_job_ledger.get_job_labels(kwargs, sql_file=None if by_query_str else sql)
 
-    res = client.query(query_str,
-                       job_config=job_config,
-                       location=location)
-    try:
-        res.result()
+    # 参照テーブル、SQL、クエリパラメータが前回の実行から変わっていなければ、ジョブを実行しない
+    fingerprint = None
+    destination_ref = job_config.destination
+    if skip_if_unchanged:
+        if destination_ref is None or is_return_result:
+            raise ValueError('skip_if_unchangedはdestinationを指定し、is_return_resultがFalseの場合のみ指定できます。')
+        is_skip, fingerprint = __check_inputs_unchanged(client, query_str, job_config, location,
+                                                        destination, write_disposition,
+                                                        task_instance=kwargs.get('ti'))
+        if is_skip:
+            return None
+
+    # 差分更新の場合は、クエリの結果を一時テーブルに保存して保存先テーブルを更新するスクリプトに置き換える
+    if is_incremental:
         if is_return_result:
-            df = res.to_dataframe()
-            if return_type == 'list':
-                ls = df.to_dict(orient='records')
-                return ls[:max_return_records]
-            elif return_type == 'df':
-                return df
-        return None
+            raise ValueError('write_dispositionが{}の場合、is_return_resultはFalseとしてください。'.format(write_disposition))
+        query_str = __set_incremental_query(client, query_str, job_config, write_disposition,
+                                            merge_keys=merge_keys,
+                                            partition_window=partition_window)
+
+    # dry runでコストを見積もり、課金バイト数の上限を超える場合はジョブを実行しない
+    dry_run_job = None
+    if estimate_cost or maximum_bytes_billed is not None:
+        dry_run_job = __dry_run_query(client, query_str, job_config, location)
+        __check_estimated_cost(dry_run_job, maximum_bytes_billed, task_instance=kwargs.get('ti'))
+
+    bqstorage_client = None
+    if is_return_result and use_bqstorage:
+        bqstorage_client = __get_bqstorage_client(local=local)
+
+    # クエリの結果のキャッシュを参照
+    result_cache = None
+    cache_key = None
+    if use_result_cache and is_return_result and destination is None:
+        cache_key = __get_result_cache_key(client, query_str, job_config, location, dry_run_job=dry_run_job)
+        if cache_key is not None:
+            result_cache = BqResultCache(gcs_bucket_name=result_cache_gcs_bucket,
+                                         project_id=project_id,
+                                         local=local)
+            table = result_cache.get(cache_key)
+            logger.info('クエリ結果のキャッシュ: {}'.format(result_cache.stats()))
+            if table is not None:
+                return __arrow_to_result(table, return_type, max_return_records, page_size)
+
+    def submit_job(job_id):
+        return client.query(query_str,
+                            job_config=job_config,
+                            job_id=job_id,
+                            location=location)
+
+    job_id_prefix = __get_task_job_id_prefix(kwargs, 'query', query_str, query_parameters, destination)
+    res = __run_job(client, job_id_prefix, submit_job, location, retry,
+                    context=kwargs, sql_file=None if by_query_str else sql)
+    if fingerprint is not None:
+        __set_fingerprint_label(client, destination_ref, fingerprint)
+    try:
+        if not is_return_result:
+            return None
+
+        if result_cache is not None:
+            # 全件を取得してキャッシュに保存
+            table = __to_arrow(res, bqstorage_client=bqstorage_client)
+            result_cache.put(cache_key, table)
+            return __arrow_to_result(table, return_type, max_return_records, page_size)
+
+        if return_type == 'df':
+            return __to_dataframe(res, page_size=page_size, bqstorage_client=bqstorage_client)
+        elif return_type == 'list':
+            df = __to_dataframe(res,
+                                max_results=max_return_records,
+                                page_size=page_size,
+                                bqstorage_client=bqstorage_client)
+            return df.to_dict(orient='records')[:max_return_records]
+
+        # 最大レコード数はAPIに渡し、取得するレコード数を制限する。0の場合は全件を取得する
+        rows = res.result(max_results=max_return_records or None, page_size=page_size)
+        if return_type == 'row_iterator':
+            return rows
+        elif return_type == 'rows':
+            return __iter_rows(rows)
+        elif return_type == 'arrow_batches':
+            return rows.to_arrow_iterable()
+        elif return_type == 'df_chunks':
+            return rows.to_dataframe_iterable()
+        raise ValueError('return_typeの値が不正です。')
     except Exception as e:
         raise e
 
 
+def __set_incremental_query(client, query_str, job_config, write_disposition, merge_keys=None, partition_window=None):
+    """保存先テーブルを差分更新するスクリプトを作成する。
+    クエリの結果を一時テーブルに保存し、トランザクション内で保存先テーブルをMERGE、またはパーティション単位で置き換える。
+    更新するパーティションをパーティション列で絞り込むため、処理バイト数は更新するパーティション分のみとなる。
+    job_configの保存先テーブルと書き込み方法は削除し、partition_windowのクエリパラメータを追加する。
+
+    Args:
+        client (bigquery.Client)
+        query_str (str): クエリ文字列
+        job_config (bigquery.QueryJobConfig): 保存先テーブルを設定したjob_config
+        write_disposition (str): 'MERGE'、'REPLACE_PARTITIONS'のいずれか
+        merge_keys (list(str)): MERGEのキー列名のリスト。 Defaults to None.
+        partition_window (tuple): 更新するパーティションの範囲。 Defaults to None.
+
+    Raises:
+        ValueError: 引数の値に誤りがある場合
+
+    Returns:
+        str: スクリプト
+    """
+    if job_config.destination is None:
+        raise ValueError('write_dispositionが{}の場合、destinationを指定してください。'.format(write_disposition))
+    if '$' in job_config.destination.table_id:
+        raise ValueError('write_dispositionが{}の場合、destinationにパーティションは指定できません。'.format(write_disposition))
+    if write_disposition == 'MERGE' and not merge_keys:
+        raise ValueError('write_dispositionがMERGEの場合、merge_keysを指定してください。')
+
+    table = client.get_table(job_config.destination)
+    table_name = '`{}.{}.{}`'.format(table.project, table.dataset_id, table.table_id)
+    columns = [field.name for field in table.schema]
+    job_config.destination = None
+    job_config.write_disposition = None
+
+    # パーティション列で更新対象を絞り込む条件
+    partition_field = None
+    if table.time_partitioning is not None and table.time_partitioning.field is not None:
+        partition_field = table.schema[columns.index(table.time_partitioning.field)]
+    if write_disposition == 'REPLACE_PARTITIONS' and partition_field is None:
+        raise ValueError('REPLACE_PARTITIONSは列でパーティション分割したテーブルのみ指定できます。')
+
+    script = []
+    partition_condition = None
+    staging_condition = None
+    if partition_field is not None:
+        partition_type = partition_field.field_type
+        partition_unit = table.time_partitioning.type_
+
+        def partition_expr(alias):
+            if partition_type == 'DATE' and partition_unit == 'DAY':
+                return '{}.`{}`'.format(alias, partition_field.name)
+            return '{}_TRUNC({}.`{}`, {})'.format(partition_type, alias, partition_field.name, partition_unit)
+
+        if partition_window is not None:
+            # 文字列でも指定できるよう、パーティション列の型にキャストする
+            job_config.query_parameters = list(job_config.query_parameters) + [
+                __get_query_param('incremental_partition_start', partition_window[0]),
+                __get_query_param('incremental_partition_end', partition_window[1]),
+            ]
+            window_condition = '{0} BETWEEN CAST(@incremental_partition_start AS {1}) AND CAST(@incremental_partition_end AS {1})'
+            partition_condition = window_condition.format(partition_expr('T'), partition_type)
+            # 範囲外の行は保存先テーブルで削除、照合されないため、クエリの結果からも除外する
+            staging_condition = window_condition.format(partition_expr('S'), partition_type)
+        else:
+            script.append('DECLARE {} ARRAY<{}>;'.format(INCREMENTAL_PARTITIONS_VARIABLE, partition_type))
+            partition_condition = '{} IN UNNEST({})'.format(partition_expr('T'), INCREMENTAL_PARTITIONS_VARIABLE)
+
+    script.append('CREATE TEMP TABLE {} AS\n{}\n;'.format(INCREMENTAL_STAGING_TABLE, query_str.strip().rstrip(';')))
+    if partition_field is not None and partition_window is None:
+        script.append('SET {} = (SELECT ARRAY_AGG(DISTINCT {} IGNORE NULLS) FROM {} AS S);'.format(
+            INCREMENTAL_PARTITIONS_VARIABLE, partition_expr('S'), INCREMENTAL_STAGING_TABLE))
+
+    column_list = ', '.join('`{}`'.format(c) for c in columns)
+    staging_table = INCREMENTAL_STAGING_TABLE
+    staging_where = ''
+    if staging_condition is not None:
+        staging_table = '(SELECT * FROM {} AS S WHERE {})'.format(INCREMENTAL_STAGING_TABLE, staging_condition)
+        staging_where = ' AS S WHERE {}'.format(staging_condition)
+    script.append('BEGIN TRANSACTION;')
+    if write_disposition == 'MERGE':
+        conditions = ['T.`{0}` = S.`{0}`'.format(k) for k in merge_keys]
+        if partition_condition is not None:
+            conditions.append(partition_condition)
+        merge = ['MERGE {} AS T'.format(table_name),
+                 'USING {} AS S'.format(staging_table),
+                 'ON {}'.format(' AND '.join(conditions))]
+        update_columns = [c for c in columns if c not in merge_keys]
+        if update_columns:
+            merge.append('WHEN MATCHED THEN UPDATE SET {}'.format(
+                ', '.join('`{0}` = S.`{0}`'.format(c) for c in update_columns)))
+        merge.append('WHEN NOT MATCHED THEN INSERT ({}) VALUES ({})'.format(
+            column_list, ', '.join('S.`{}`'.format(c) for c in columns)))
+        script.append('\n'.join(merge) + ';')
+    else:
+        script.append('DELETE FROM {} AS T WHERE {};'.format(table_name, partition_condition))
+        script.append('INSERT INTO {} ({}) SELECT {} FROM {}{};'.format(
+            table_name, column_list, column_list, INCREMENTAL_STAGING_TABLE, staging_where))
+    script.append('COMMIT TRANSACTION;')
+    return '\n'.join(script)
+
+
+def bq_query_to_file(sql,
+                     local_file,
+                     file_format='CSV',
+                     project_id=None,
+                     query_parameters=None,
+                     xcom_parameters=None,
+                     encoding='utf_8',
+                     encoding_errors='strict',
+                     newline='\n',
+                     field_delimiter=',',
+                     print_header=True,
+                     max_records=None,
+                     page_size=None,
+                     by_query_str=False,
+                     location=None,
+                     use_bqstorage=False,
+                     local=False,
+                     **kwargs):
+    """SQLを実行し、結果をローカルのファイルに出力する。
+    結果はページ単位で取得してファイルに書き込むため、メモリに保持するのは1ページ分のみとなる。
+
+    Args:
+        sql (str): SQLファイルのパス
+        local_file (str): 出力するファイルパス
+        file_format (str): 'CSV'、'CSV_GZIP'、'PARQUET'、'XLSX'のいずれか。 Defaults to 'CSV'.
+                           XLSXの場合、1シートの最大行数を超えると新しいシートに出力する。
+                           日付、時刻の列は型に応じた表示形式とし、TIMESTAMPはUTCで出力する。
+                           文字列は数式、URLとして扱わない。
+        project_id (str): BigQueryのジョブを実行するプロジェクト。指定がなければ jinzaisystem-tool. Defaults to None.
+        query_parameters (dict): クエリパラメータ。書式はbq_queryと同じ。 Defaults to None.
+        xcom_parameters (dict): XCOMから取得するクエリパラメータ。書式はbq_queryと同じ。 Defaults to None.
+        encoding (str): CSVの文字コード。 Defaults to 'utf_8'.
+        encoding_errors (str): CSVの文字コードに変換できない文字の扱い。'strict'、'replace'、'ignore'のいずれか。
+                               Defaults to 'strict'.
+        newline (str): CSVの改行コード。 Defaults to '\n'.
+        field_delimiter (str): CSVの区切り文字。 Defaults to ','.
+        print_header (bool): CSV、XLSXにヘッダを出力するかどうか。XLSXの場合はシートごとに出力する。 Defaults to True.
+        max_records (int): 出力する最大レコード数。Noneの場合、全件。 Defaults to None.
+        page_size (int): 1ページあたりのレコード数。Noneの場合、APIのデフォルト値。 Defaults to None.
+        by_query_str (bool): Trueの場合、パラメータsqlをクエリ文字列として扱う。 Defaults to False.
+        location (str): BigQueryのジョブを実行するロケーション。指定がなければ asia-northeast1. Defaults to None.
+        use_bqstorage (bool): Trueの場合、BigQuery Storage Read APIで取得する。max_recordsを指定した場合は無視する。
+                              Defaults to False.
+        local (bool): ローカル環境で実行する場合はTrue. Defaults to False.
+
+    Raises:
+        ValueError: file_formatが対応していない形式の場合
+
+    Returns:
+        dict: 出力したレコード数、ファイルサイズ、処理時間、スループット(MB/s)、最大メモリ使用量(MB)
+    """
+    file_format = file_format.upper()
+    if file_format not in QUERY_FILE_FORMATS:
+        raise ValueError('file_formatは{}のいずれかを指定してください。'.format('、'.join(QUERY_FILE_FORMATS)))
+
+    start = time.time()
+    rows = bq_query(sql,
+                    project_id=project_id,
+                    query_parameters=query_parameters,
+                    xcom_parameters=xcom_parameters,
+                    is_return_result=True,
+                    return_type='row_iterator',
+                    max_return_records=max_records or 0,
+                    page_size=page_size,
+                    by_query_str=by_query_str,
+                    location=location,
+                    local=local,
+                    **kwargs)
+
+    bqstorage_client = None
+    if use_bqstorage and not max_records:
+        bqstorage_client = __get_bqstorage_client(local=local)
+    batches = rows.to_arrow_iterable(bqstorage_client=bqstorage_client)
+
+    if file_format == 'PARQUET':
+        record_count = __write_parquet(batches, rows.schema, local_file)
+    elif file_format == 'XLSX':
+        record_count = __write_xlsx(batches, rows.schema, local_file, print_header=print_header)
+    else:
+        if file_format == 'CSV_GZIP':
+            f = gzip.open(local_file, 'wt', encoding=encoding, errors=encoding_errors, newline='')
+        else:
+            f = open(local_file, 'w', encoding=encoding, errors=encoding_errors, newline='')
+        with f:
+            writer = csv.writer(f, delimiter=field_delimiter, lineterminator=newline)
+            if print_header:
+                writer.writerow([field.name for field in rows.schema])
+            record_count = 0
+            for batch in batches:
+                writer.writerows(zip(*batch.to_pydict().values()))
+                record_count += batch.num_rows
+
+    elapsed_seconds = time.time() - start
+    file_bytes = os.path.getsize(local_file)
+    result = {
+        'records': record_count,
+        'bytes': file_bytes,
+        'elapsed_seconds': round(elapsed_seconds, 3),
+        'mb_per_second': round(file_bytes / 1024 / 1024 / elapsed_seconds, 3) if elapsed_seconds > 0 else None,
+        # Linuxのru_maxrssはKB単位
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+    logger.info('クエリの結果をファイルに出力しました。{} {}'.format(local_file, result))
+    return result
+
+
+def __write_parquet(batches, schema, local_file):
+    """pyarrow.RecordBatchのイテレータをParquetファイルに書き込む。
+
+    Args:
+        batches (iterator(pyarrow.RecordBatch)): クエリの結果
+        schema (list(bigquery.SchemaField)): クエリの結果のスキーマ。結果が0件の場合に使う。
+        local_file (str): 出力するファイルパス
+
+    Returns:
+        int: 出力したレコード数
+    """
+    writer = None
+    record_count = 0
+    try:
+        for batch in batches:
+            if writer is None:
+                writer = pq.ParquetWriter(local_file, batch.schema)
+            writer.write_table(pa.Table.from_batches([batch]))
+            record_count += batch.num_rows
+    finally:
+        if writer is not None:
+            writer.close()
+
+    # 結果が0件の場合は、スキーマのみのファイルを出力する
+    if writer is None:
+        from google.cloud.bigquery import _pandas_helpers
+        pq.write_table(_pandas_helpers.bq_to_arrow_schema(schema).empty_table(), local_file)
+    return record_count
+
+
+def __write_xlsx(batches, schema, local_file, print_header=True):
+    """pyarrow.RecordBatchのイテレータをXLSXファイルに書き込む。
+    constant_memoryモードで1行ずつ書き込むため、メモリに保持するのは1ページ分と書き込み中の1行のみとなる。
+
+    Args:
+        batches (iterator(pyarrow.RecordBatch)): クエリの結果
+        schema (list(bigquery.SchemaField)): クエリの結果のスキーマ
+        local_file (str): 出力するファイルパス
+        print_header (bool): シートごとにヘッダを出力するかどうか。 Defaults to True.
+
+    Returns:
+        int: 出力したレコード数
+    """
+    workbook = xlsxwriter.Workbook(local_file, {
+        'constant_memory': True,
+        'remove_timezone': True,
+        'strings_to_formulas': False,
+        'strings_to_urls': False,
+        'nan_inf_to_errors': True,
+    })
+    num_formats = {field_type: workbook.add_format({'num_format': num_format})
+                   for field_type, num_format in XLSX_NUM_FORMATS.items()}
+    header = [field.name for field in schema] if print_header else None
+    worksheet = None
+    row_index = XLSX_MAX_ROWS
+    record_count = 0
+    try:
+        for batch in batches:
+            for row in zip(*batch.to_pydict().values()):
+                # 最大行数に達した場合は新しいシートに出力する
+                if row_index >= XLSX_MAX_ROWS:
+                    worksheet = __add_xlsx_worksheet(workbook, schema, num_formats, header)
+                    row_index = 0 if header is None else 1
+                worksheet.write_row(row_index, 0, row)
+                row_index += 1
+            record_count += batch.num_rows
+
+        # 結果が0件の場合は、ヘッダのみのシートを出力する
+        if worksheet is None:
+            __add_xlsx_worksheet(workbook, schema, num_formats, header)
+    finally:
+        workbook.close()
+    return record_count
+
+
+def __add_xlsx_worksheet(workbook, schema, num_formats, header=None):
+    """XLSXファイルにシートを追加し、列の表示形式とヘッダを設定する。
+
+    Args:
+        workbook (xlsxwriter.Workbook)
+        schema (list(bigquery.SchemaField)): クエリの結果のスキーマ
+        num_formats (dict): BigQueryの型と表示形式のdict
+        header (list(str)): ヘッダ。Noneの場合は出力しない。 Defaults to None.
+
+    Returns:
+        xlsxwriter.worksheet.Worksheet
+    """
+    worksheet = workbook.add_worksheet()
+    for i, field in enumerate(schema):
+        if field.field_type in num_formats:
+            worksheet.set_column(i, i, None, num_formats[field.field_type])
+    if header is not None:
+        worksheet.write_row(0, 0, header)
+    return worksheet
+
+
+def get_query_schema(sql,
+                     project_id=None,
+                     query_parameters=None,
+                     by_query_str=False,
+                     location=None,
+                     local=False):
+    """クエリの結果のスキーマをdry runで取得する。dry runのため課金されない。
+
+    Args:
+        sql (str): SQLファイルのパス、またはクエリ文字列
+        project_id (str): BigQueryのジョブを実行するプロジェクト。指定がなければ jinzaisystem-tool. Defaults to None.
+        query_parameters (dict): クエリパラメータ。書式はbq_queryと同じ。 Defaults to None.
+        by_query_str (bool): Trueの場合、パラメータsqlをクエリ文字列として扱う。 Defaults to False.
+        location (str): BigQueryのジョブを実行するロケーション。指定がなければ asia-northeast1. Defaults to None.
+        local (bool): ローカル環境で実行する場合はTrue. Defaults to False.
+
+    Returns:
+        list(bigquery.SchemaField): クエリの結果のスキーマ
+    """
+    if project_id is None:
+        project_id = 'jinzaisystem-tool'
+    if location is None:
+        location = 'asia-northeast1'
+
+    query_str = read_query_str(sql, by_query_str=by_query_str, local=local)
+    client = __get_client(project_id, local=local, location=location)
+    job_config = __set_query_job_config(client=client,
+                                        project_id=project_id,
+                                        query_parameters=query_parameters,
+                                        write_disposition='WRITE_EMPTY',
+                                        query_str=query_str)
+    dry_run_job = __dry_run_query(client, query_str, job_config, location)
+    fields = dry_run_job._properties.get('statistics', {}).get('query', {}).get('schema', {}).get('fields', [])
+    return [bigquery.SchemaField.from_api_repr(field) for field in fields]
+
+
+def read_query_str(sql, by_query_str=False, local=False):
+    """クエリ文字列を取得する。
+
+    Args:
+        sql (str): SQLファイルのパス、またはクエリ文字列
+        by_query_str (bool): Trueの場合、パラメータsqlをクエリ文字列として扱う。 Defaults to False.
+        local (bool): ローカル環境で実行する場合はTrue. Defaults to False.
+
+    Returns:
+        str: クエリ文字列
+    """
+    if by_query_str:
+        # パラメータのクエリ文字列を利用
+        return sql
+
+    if local is False:
+        sql = '{}/{}'.format(AIRFLOW_DAGS_DIR, sql)
+    # SQLファイルを読み込みクエリ文字列を作成
+    with open(sql, encoding='UTF-8') as f:
+        return f.read()
+
+
+def bq_query_many(queries,
+                  project_id=None,
+                  location=None,
+                  max_concurrency=None,
+                  poll_interval=None,
+                  retry=None,
+                  local=False,
+                  **kwargs):
+    """複数のSQLを同時に実行する。
+    同時実行数の上限までジョブを投入し、1つのループで全ジョブの状態を確認する。
+    ジョブが終了する度に次のジョブを投入する。
+    一部のジョブが失敗しても他のジョブは最後まで実行し、全ジョブの結果を返す。
+    ジョブIDはbq_queryと同じく決定的に作成し、タスクのリトライ時も実行中または成功済みのジョブがあれば再投入しない。
+    投入時、または実行中に一時的なエラーとなったジョブは、次のジョブとして再投入する。
+
+    Args:
+        queries (list(dict)): 実行するクエリのリスト。以下のキーを持つdictで指定する。
+                                name (str): 結果のキー。重複不可。省略した場合はリストのインデックス。
+                                sql (str): SQLファイルのパス（必須）
+                                by_query_str (bool): Trueの場合、sqlをクエリ文字列として扱う。
+                                destination (str): 保存先テーブル。書式はbq_queryと同じ。
+                                query_parameters (dict): クエリパラメータ
+                                write_disposition (str): 保存先テーブルの書き込み方法。省略した場合はWRITE_EMPTY。
+                                maximum_bytes_billed (int): 課金バイト数の上限
+        project_id (str): BigQueryのジョブを実行するプロジェクト。指定がなければ jinzaisystem-tool. Defaults to None.
+        location (str): BigQueryのジョブを実行するロケーション。指定がなければ asia-northeast1. Defaults to None.
+        max_concurrency (int): 同時に実行するジョブ数の上限。指定がなければDEFAULT_MAX_CONCURRENCY. Defaults to None.
+        poll_interval (int): ジョブの状態を確認する間隔（秒）。指定がなければDEFAULT_POLL_INTERVAL. Defaults to None.
+        retry (int): 一時的なエラーの場合のクエリ毎のリトライ回数。指定がなければDEFAULT_RETRY。 Defaults to None.
+        local (bool): ローカル環境で実行する場合はTrue. Defaults to False.
+
+    Raises:
+        ValueError: クエリのnameが重複している場合
+        Exception: 1つ以上のジョブが失敗した場合。全ジョブの結果はXCOMのキー「bq_query_many_result」にpushする。
+
+    Returns:
+        dict: クエリのnameをキーに、ジョブID、状態、エラー、統計情報を格納したdict
+    """
+    if project_id is None:
+        project_id = 'jinzaisystem-tool'
+    if location is None:
+        location = 'asia-northeast1'
+    if max_concurrency is None:
+        max_concurrency = DEFAULT_MAX_CONCURRENCY
+    if poll_interval is None:
+        poll_interval = DEFAULT_POLL_INTERVAL
+    if retry is None:
+        retry = DEFAULT_RETRY
+
+    waiting = [(str(query.get('name', i)), query) for i, query in enumerate(queries)]
+    queries_by_name = dict(waiting)
+    if len(queries_by_name) != len(waiting):
+        names = [name for name, _ in waiting]
+        raise ValueError('クエリのnameが重複しています。{}'.format(
+            sorted(set(name for name in names if names.count(name) > 1))))
+
+    # クライアント作成
+    client = __get_client(project_id, local=local, location=location)
+
+    running = {}
+    results = {}
+    attempts = {}
+    poll_errors = {}
+    job_id_prefixes = {}
+    while waiting or running:
+        # 同時実行数の上限までジョブを投入
+        while waiting and len(running) < max_concurrency:
+            name, query = waiting.pop(0)
+            try:
+                running[name] = __submit_many_query(client, name, query, project_id, location, local, kwargs,
+                                                    job_id_prefixes)
+                poll_errors[name] = 0
+            except Exception as e:
+                if __retry_many_query(name, query, e, attempts, retry, waiting):
+                    continue
+                logger.warn('{}: ジョブの投入に失敗しました。詳細({})'.format(name, e))
+                results[name] = {'job_id': None, 'state': 'FAILED', 'error': str(e)}
+
+        if not running:
+            continue
+        time.sleep(poll_interval)
+
+        # 実行中のジョブの状態を確認
+        for name in list(running):
+            job = running[name]
+            query = queries_by_name[name]
+            try:
+                is_done = job.done()
+            except Exception as e:
+                poll_errors[name] += 1
+                logger.warn('{}: ジョブの状態を取得できませんでした（{}/{}回目）。詳細({})'.format(
+                    name, poll_errors[name], MAX_POLL_ERRORS, e))
+                if poll_errors[name] < MAX_POLL_ERRORS:
+                    continue
+                del running[name]
+                results[name] = {'job_id': job.job_id, 'state': 'FAILED',
+                                 'error': 'ジョブの状態を取得できませんでした。詳細({})'.format(e)}
+                continue
+            poll_errors[name] = 0
+            if not is_done:
+                continue
+            del running[name]
+            bq_job_ledger.record(client, job, context=kwargs,
+                                 sql_file=None if query.get('by_query_str', False) else query['sql'])
+            if job.error_result is not None and __retry_many_query(
+                    name, query, Exception(job.error_result.get('message')), attempts, retry, waiting,
+                    reason=job.error_result.get('reason')):
+                continue
+            results[name] = __get_query_job_statistics(job)
+            logger.info('{}: {}'.format(name, results[name]))
+    bq_job_ledger.flush()
+
+    failed = [name for name, result in results.items() if result['state'] != 'DONE']
+    if failed:
+        if 'ti' in kwargs:
+            kwargs['ti'].xcom_push(key='bq_query_many_result', value=results)
+        raise Exception('{}件のクエリが失敗しました。{}'.format(len(failed), failed))
+    return results
+
+
+def __submit_many_query(client, name, query, project_id, location, local, context, job_id_prefixes):
+    """bq_query_manyのクエリのジョブを投入する。実行中または成功済みのジョブがあればそのジョブを返す。
+    ジョブIDのプレフィックスはクエリ毎に1回だけ作成し、リトライ時は同じプレフィックスの次の連番で投入する。
+
+    Args:
+        client (bigquery.Client)
+        name (str): クエリのname
+        query (dict): bq_query_manyのクエリ
+        project_id (str): BigQueryのジョブを実行するプロジェクト
+        location (str): BigQueryのジョブを実行するロケーション
+        local (bool): ローカル環境で実行する場合はTrue
+        context (dict): Airflowのcontext
+        job_id_prefixes (dict): クエリのname毎のジョブIDのプレフィックス
+
+    Returns:
+        bigquery.QueryJob
+    """
+    query_str = read_query_str(query['sql'],
+                               by_query_str=query.get('by_query_str', False),
+                               local=local)
+    job_config = __set_query_job_config(client=client,
+                                        project_id=project_id,
+                                        destination=query.get('destination'),
+                                        query_parameters=query.get('query_parameters'),
+                                        write_disposition=query.get('write_disposition', 'WRITE_EMPTY'),
+                                        maximum_bytes_billed=query.get('maximum_bytes_billed'),
+                                        query_str=query_str)
+    sql_file = None if query.get('by_query_str', False) else query['sql']
+    job_config.labels = bq_job_ledger.get_job_labels(context, sql_file=sql_file)
+
+    def submit_job(job_id):
+        return client.query(query_str,
+                            job_config=job_config,
+                            job_id=job_id,
+                            location=location)
+
+    if name not in job_id_prefixes:
+        job_id_prefixes[name] = __get_task_job_id_prefix(context, 'query_many', name, query_str,
+                                                         query.get('query_parameters'), query.get('destination'))
+    job = __find_or_submit_job(client, job_id_prefixes[name], submit_job, location)
+    logger.info('{}: ジョブID: {}'.format(name, job.job_id))
+    return job
+
+
+def __retry_many_query(name, query, e, attempts, retry, waiting, reason=None):
+    """bq_query_manyのクエリが一時的なエラーの場合、リトライ回数の上限までは待ち行列の最後に戻す。
+
+    Args:
+        name (str): クエリのname
+        query (dict): bq_query_manyのクエリ
+        e (Exception): 発生した例外
+        attempts (dict): クエリのname毎のリトライ回数
+        retry (int): リトライ回数の上限
+        waiting (list): 投入待ちのクエリの待ち行列
+        reason (str): ジョブのエラーの理由。 Defaults to None.
+
+    Returns:
+        bool: リトライする場合はTrue
+    """
+    is_transient = reason in TRANSIENT_ERROR_REASONS if reason is not None else __is_transient_error(e)
+    if not is_transient or attempts.get(name, 0) >= retry:
+        return False
+    attempts[name] = attempts.get(name, 0) + 1
+    logger.warn('{}: 一時的なエラーのため、リトライします（{}/{}回目）。詳細({})'.format(name, attempts[name], retry, e))
+    waiting.append((name, query))
+    return True
+
+
+def __get_query_job_statistics(job):
+    """終了したクエリジョブの状態と統計情報を取得する。
+
+    Args:
+        job (bigquery.QueryJob): 終了したジョブ
+
+    Returns:
+        dict: ジョブID、状態（DONE, FAILED）、エラー、統計情報
+    """
+    elapsed_seconds = None
+    if job.started is not None and job.ended is not None:
+        elapsed_seconds = (job.ended - job.started).total_seconds()
+    return {
+        'job_id': job.job_id,
+        'state': 'FAILED' if job.error_result else 'DONE',
+        'error': job.error_result['message'] if job.error_result else None,
+        'total_bytes_processed': job.total_bytes_processed,
+        'total_bytes_billed': job.total_bytes_billed,
+        'slot_millis': job.slot_millis,
+        'cache_hit': job.cache_hit,
+        'num_dml_affected_rows': job.num_dml_affected_rows,
+        'elapsed_seconds': elapsed_seconds,
+    }
+
+
+def __dry_run_query(client, query_str, job_config, location):
+    """クエリをdry runで実行する。
+
+    Args:
+        client (bigquery.Client)
+        query_str (str): クエリ文字列
+        job_config (bigquery.QueryJobConfig): 実行するクエリのjob_config。クエリパラメータのみ引き継ぐ。
+        location (str): BigQueryのジョブを実行するロケーション
+
+    Returns:
+        bigquery.QueryJob: total_bytes_processed、referenced_tablesを参照できる
+    """
+    dry_run_config = bigquery.QueryJobConfig()
+    dry_run_config.dry_run = True
+    dry_run_config.use_query_cache = False
+    dry_run_config.query_parameters = job_config.query_parameters
+    return client.query(query_str,
+                        job_config=dry_run_config,
+                        location=location)
+
+
+def __check_estimated_cost(dry_run_job, maximum_bytes_billed=None, task_instance=None):
+    """dry runの結果から処理バイト数の見積もりと参照テーブルを出力し、課金バイト数の上限をチェックする。
+
+    Args:
+        dry_run_job (bigquery.QueryJob): dry runのジョブ
+        maximum_bytes_billed (int): 課金バイト数の上限。 Defaults to None.
+        task_instance (TaskInstance): 指定した場合、見積もりをXCOMのキー「bq_dry_run」にpushする。 Defaults to None.
+
+    Raises:
+        BqBytesBilledExceededException: 処理バイト数の見積もりが課金バイト数の上限を超える場合
+    """
+    estimated_bytes = dry_run_job.total_bytes_processed
+    referenced_tables = ['{}.{}.{}'.format(t.project, t.dataset_id, t.table_id)
+                         for t in dry_run_job.referenced_tables]
+    logger.info('処理バイト数の見積もり: {:,} bytes'.format(estimated_bytes))
+    logger.info('参照テーブル: {}'.format(referenced_tables))
+
+    if task_instance is not None:
+        task_instance.xcom_push(key='bq_dry_run', value={
+            'total_bytes_processed': estimated_bytes,
+            'maximum_bytes_billed': maximum_bytes_billed,
+            'referenced_tables': referenced_tables,
+        })
+
+    if maximum_bytes_billed is not None and estimated_bytes > maximum_bytes_billed:
+        raise BqBytesBilledExceededException(
+            '処理バイト数の見積もりが課金バイト数の上限を超えるため、クエリを実行しません。見積もり: {:,} bytes 上限: {:,} bytes'.format(
+                estimated_bytes,
+                maximum_bytes_billed))
+
+
+def __normalize_sql(query_str):
+    """SQLのコメントを除去し、文字列リテラル以外の連続する空白を1つの半角スペースにする。
+
+    Args:
+        query_str (str): クエリ文字列
+
+    Returns:
+        str: 正規化したクエリ文字列
+    """
+    normalized = []
+    quote = None
+    i = 0
+    length = len(query_str)
+    while i < length:
+        c = query_str[i]
+        if quote is not None:
+            # 文字列リテラル、識別子の中はそのまま残す
+            normalized.append(c)
+            if c == '\\' and i + 1 < length:
+                normalized.append(query_str[i + 1])
+                i += 1
+            elif c == quote:
+                quote = None
+        elif c in ('\'', '"', '`'):
+            quote = c
+            normalized.append(c)
+        elif c == '#' or query_str.startswith('--', i):
+            # 行末までのコメント
+            end = query_str.find('\n', i)
+            i = length if end == -1 else end
+            continue
+        elif query_str.startswith('/*', i):
+            # ブロックコメント
+            end = query_str.find('*/', i + 2)
+            i = length if end == -1 else end + 2
+            continue
+        elif c.isspace():
+            if normalized and normalized[-1] != ' ':
+                normalized.append(' ')
+        else:
+            normalized.append(c)
+        i += 1
+    return ''.join(normalized).strip()
+
+
+def __get_result_cache_key(client, query_str, job_config, location, dry_run_job=None):
+    """クエリの結果のキャッシュのキーを作成する。
+
+    Args:
+        client (bigquery.Client)
+        query_str (str): クエリ文字列
+        job_config (bigquery.QueryJobConfig): 実行するクエリのjob_config
+        location (str): BigQueryのジョブを実行するロケーション
+        dry_run_job (bigquery.QueryJob): 実行済みのdry runのジョブ。Noneの場合はdry runを実行する。 Defaults to None.
+
+    Returns:
+        str: キャッシュのキー。キャッシュできないクエリの場合はNone
+    """
+    cache_key, reason = __get_input_fingerprint(client, query_str, job_config, location, dry_run_job=dry_run_job)
+    if cache_key is None:
+        logger.info('{}ため、クエリの結果をキャッシュしません。'.format(reason))
+    return cache_key
+
+
+def __get_input_fingerprint(client, query_str, job_config, location, dry_run_job=None, extra=None):
+    """クエリの入力のフィンガープリントを作成する。
+    正規化したSQL、クエリパラメータ、dry runで取得した参照テーブルの最終更新日時のハッシュ値とする。
+
+    Args:
+        client (bigquery.Client)
+        query_str (str): クエリ文字列
+        job_config (bigquery.QueryJobConfig): 実行するクエリのjob_config
+        location (str): BigQueryのジョブを実行するロケーション
+        dry_run_job (bigquery.QueryJob): 実行済みのdry runのジョブ。Noneの場合はdry runを実行する。 Defaults to None.
+        extra (dict): フィンガープリントに含めるその他の値。 Defaults to None.
+
+    Returns:
+        tuple(str, str): フィンガープリントと、作成できない場合はその理由。
+                         作成できない場合、フィンガープリントはNone
+    """
+    normalized_sql = __normalize_sql(query_str)
+    if NON_DETERMINISTIC_FUNCTION_PATTERN.search(normalized_sql):
+        return None, '実行の度に結果が変わる関数を含む'
+
+    if dry_run_job is None:
+        dry_run_job = __dry_run_query(client, query_str, job_config, location)
+
+    tables = []
+    for table_ref in dry_run_job.referenced_tables:
+        table = client.get_table(table_ref)
+        if table.table_type != 'TABLE' or table.streaming_buffer is not None:
+            return None, '最終更新日時で更新を判定できないテーブル{}を参照する'.format(table.full_table_id)
+        tables.append([table.full_table_id, table.modified.isoformat()])
+
+    key_source = {
+        'sql': normalized_sql,
+        'query_parameters': [p.to_api_repr() for p in job_config.query_parameters],
+        'tables': sorted(tables),
+    }
+    if extra is not None:
+        key_source['extra'] = extra
+    return hashlib.sha256(json.dumps(key_source, sort_keys=True, default=str).encode('UTF-8')).hexdigest(), None
+
+
+def __check_inputs_unchanged(client, query_str, job_config, location, destination, write_disposition,
+                             task_instance=None):
+    """保存先テーブルに記録したフィンガープリントと、今回のクエリの入力のフィンガープリントを比較する。
+    判定結果と理由はログに出力し、XCOMのキー「bq_skip_if_unchanged」にpushする。
+
+    Args:
+        client (bigquery.Client)
+        query_str (str): クエリ文字列
+        job_config (bigquery.QueryJobConfig): 保存先テーブルを設定したjob_config
+        location (str): BigQueryのジョブを実行するロケーション
+        destination (str): 保存先テーブル
+        write_disposition (str): 保存先テーブルの書き込み方法
+        task_instance (TaskInstance): 指定した場合、判定結果をXCOMにpushする。 Defaults to None.
+
+    Returns:
+        tuple(bool, str): ジョブをスキップする場合はTrueと、クエリ実行後に保存先テーブルに記録するフィンガープリント
+    """
+    fingerprint, reason = __get_input_fingerprint(client, query_str, job_config, location,
+                                                  extra={'destination': destination,
+                                                         'write_disposition': write_disposition})
+    if fingerprint is not None:
+        fingerprint = fingerprint[:FINGERPRINT_LABEL_LENGTH]
+        try:
+            table = client.get_table(__get_base_table_ref(client, job_config.destination))
+            stored_fingerprint = table.labels.get(FINGERPRINT_LABEL_KEY)
+        except NotFound:
+            stored_fingerprint = None
+        if stored_fingerprint is None:
+            reason = '保存先テーブルにフィンガープリントが記録されていない'
+        elif stored_fingerprint != fingerprint:
+            reason = 'SQL、クエリパラメータ、または参照テーブルが前回の実行から変更されている'
+
+    is_skip = fingerprint is not None and reason is None
+    if is_skip:
+        reason = 'SQL、クエリパラメータ、参照テーブルが前回の実行から変更されていない'
+    logger.info('ジョブを{}。理由: {} フィンガープリント: {}'.format(
+        'スキップします' if is_skip else '実行します', reason, fingerprint))
+    if task_instance is not None:
+        task_instance.xcom_push(key='bq_skip_if_unchanged', value={
+            'skipped': is_skip,
+            'reason': reason,
+            'fingerprint': fingerprint,
+        })
+    return is_skip, fingerprint
+
+
+def __set_fingerprint_label(client, destination_ref, fingerprint):
+    """保存先テーブルのラベルにフィンガープリントを記録する。
+
+    Args:
+        client (bigquery.Client)
+        destination_ref (bigquery.TableReference): 保存先テーブル
+        fingerprint (str): フィンガープリント
+    """
+    table = client.get_table(__get_base_table_ref(client, destination_ref))
+    table.labels = dict(table.labels, **{FINGERPRINT_LABEL_KEY: fingerprint})
+    client.update_table(table, ['labels'])
+
+
+def __get_base_table_ref(client, table_ref):
+    """パーティションデコレータ（$YYYYMMDD）を除いたテーブルリファレンスを取得する。
+    ラベルはパーティション毎ではなくテーブルに設定するため。
+    """
+    return client.dataset(table_ref.dataset_id, project=table_ref.project).table(table_ref.table_id.split('$')[0])
+
+
+def __to_arrow(res, bqstorage_client=None):
+    """クエリの結果をpyarrow.Tableで全件取得する。
+
+    Args:
+        res (google.cloud.bigquery.job.QueryJob)
+        bqstorage_client (bigquery_storage.BigQueryReadClient): Defaults to None.
+
+    Returns:
+        pyarrow.Table
+    """
+    if bqstorage_client is not None:
+        try:
+            return res.result().to_arrow(bqstorage_client=bqstorage_client)
+        except GoogleAPICallError as e:
+            logger.warn('BigQuery Storage Read APIで取得できないため、REST APIで取得します。詳細({})'.format(e))
+    return res.result().to_arrow(create_bqstorage_client=False)
+
+
+def __arrow_to_result(table, return_type, max_return_records, page_size):
+    """pyarrow.Tableのクエリ結果を、return_typeの型に変換する。
+
+    Args:
+        table (pyarrow.Table): クエリの結果
+        return_type (str): bq_queryのreturn_type
+        max_return_records (int): 最大レコード数。0の場合は全件。return_typeがdfの場合は無視する。
+        page_size (int): rows、arrow_batches、df_chunksの場合の1ページあたりのレコード数
+
+    Returns:
+        return_typeの型のクエリの結果
+    """
+    if return_type == 'df':
+        return table.to_pandas()
+
+    if max_return_records:
+        table = table.slice(0, max_return_records)
+    if return_type == 'list':
+        return table.to_pandas().to_dict(orient='records')
+
+    batches = table.to_batches(max_chunksize=page_size)
+    if return_type == 'rows':
+        return (row for batch in batches for row in batch.to_pylist())
+    elif return_type == 'arrow_batches':
+        return iter(batches)
+    elif return_type == 'df_chunks':
+        return (batch.to_pandas() for batch in batches)
+    raise ValueError('return_typeの値が不正です。')
+
+
+def __to_dataframe(res,
+                   max_results=None,
+                   page_size=None,
+                   bqstorage_client=None):
+    """クエリの結果をDataFrameで取得する。
+    bqstorage_clientが指定されている場合はBigQuery Storage Read APIで取得し、
+    APIが利用できない（権限がない、無効化されている等）場合はREST APIで取得し直す。
+
+    Args:
+        res (google.cloud.bigquery.job.QueryJob)
+        max_results (int): REST APIで取得する最大レコード数。Storage Read APIの場合は無視する。 Defaults to None.
+        page_size (int): REST APIで取得する1ページあたりのレコード数。 Defaults to None.
+        bqstorage_client (bigquery_storage.BigQueryReadClient): Defaults to None.
+
+    Returns:
+        DataFrame
+    """
+    if bqstorage_client is not None:
+        try:
+            return res.result().to_dataframe(bqstorage_client=bqstorage_client)
+        except GoogleAPICallError as e:
+            logger.warn('BigQuery Storage Read APIで取得できないため、REST APIで取得します。詳細({})'.format(e))
+    rows = res.result(max_results=max_results, page_size=page_size)
+    return rows.to_dataframe(create_bqstorage_client=False)
+
+
+def __iter_rows(rows):
+    """クエリの結果をページ単位で取得し、1行ずつdictで返す。
+
+    Args:
+        rows (google.cloud.bigquery.table.RowIterator)
+
+    Yields:
+        dict: 1行分のデータ
+    """
+    for row in rows:
+        yield dict(row.items())
+
+
 def bq_extract(source_project_dataset_table,
                destination_cloud_storage_uris,
                project_id=None,
@@ -264,18 +1629,22 @@ def bq_extract(source_project_dataset_table,
                export_format=None,
                field_delimiter=None,
                print_header=True,
-               location=None):
+               location=None,
+               retry=None,
+               **kwargs):
     """テーブルをGCSに出力する。
 
     Args:
         source_project_dataset_table (str): 出力元BigQueryのプロジェクト、データセット、テーブルの文字列
-        destination_cloud_storage_uris (str): 出力先GCSのURI
+        destination_cloud_storage_uris (str): 出力先GCSのURI。1GBを超える場合は、ファイル名に「*」を含む
+                                              ワイルドカードURIを指定すると、複数ファイルに分割して出力する。
         project_id (str): プロジェクトID。Defaults to None.
         compression (google.cloud.bigquery.job.Compression): 圧縮種別。 Defaults to 'NONE'.
         export_format (google.cloud.bigquery.job.DestinationFormat): 出力フォーマット。 Defaults to 'CSV'.
         field_delimiter (str): ファイル区切り文字。 Defaults to ','.
         print_header (bool): ヘッダを出力するかどうか。 Defaults to True.
         location (str): 出力元BigQueryのデータセットのロケーション。Noneの場合、東京リージョン。 Defaults to None.
+        retry (int): 一時的なエラーの場合のリトライ回数。指定がなければDEFAULT_RETRY。 Defaults to None.
     """
 
     if project_id is None:
@@ -290,7 +1659,7 @@ def bq_extract(source_project_dataset_table,
         location = 'asia-northeast1'
 
     # クライアント作成
-    client = __get_client(project_id)
+    client = __get_client(project_id, location=location)
     # テーブルリファレンス設定
     table_ref = __get_table_ref(client, source_project_dataset_table)
     # ジョブコンフィグ設定
@@ -298,15 +1667,18 @@ def bq_extract(source_project_dataset_table,
                                           export_format=export_format,
                                           field_delimiter=field_delimiter,
                                           print_header=print_header)
-    res = client.extract_table(table_ref,
-                               destination_cloud_storage_uris,
-                               job_config=job_config,
-                               project=project_id,
-                               location=location)
-    try:
-        res.result()
-    except Exception as e:
-        raise e
+    job_config.labels = bq_job_ledger.get_job_labels(kwargs)
+
+    def submit_job(job_id):
+        return client.extract_table(table_ref,
+                                    destination_cloud_storage_uris,
+                                    job_config=job_config,
+                                    job_id=job_id,
+                                    project=project_id,
+                                    location=location)
+
+    job_id_prefix = __get_task_job_id_prefix(kwargs, 'extract', source_project_dataset_table, destination_cloud_storage_uris)
+    __run_job(client, job_id_prefix, submit_job, location, retry, context=kwargs)
 
 
 def bq_load(source_cloud_storage_uris,
@@ -318,19 +1690,100 @@ def bq_load(source_cloud_storage_uris,
             retry=0,
             field_delimiter=',',
             quote_character=None,
-            allow_quoted_newlines=True):
+            allow_quoted_newlines=True,
+            source_format=None,
+            schema=None,
+            autodetect=False,
+            time_partitioning=None,
+            clustering_fields=None,
+            **kwargs):
     """GCSのファイルをBigQueryにロードする
 
     Args:
-        source_cloud_storage_uris (str): 出力元GCSのURI
+        source_cloud_storage_uris (str or list(str)): 出力元GCSのURI。ワイルドカード（gs://bucket/data/*.parquet）、
+                                                     または複数のURIのリストも指定できる。
         destination_project_dataset_table (str): 出力先Bigqueryのジロジェクト、データセット、テーブルの文字列
         project_id (str): プロジェクトID。Defaults to None.
         location (str): 出力元BigQueryのデータセットのロケーション。Noneの場合、東京リージョン。 Defaults to None.
         skip_leading_rows (int): スキップ行数。 Defaults to 1.
         write_disposition (google.cloud.bigquery.job.WriteDisposition): テーブルの書き込みオプション。
                             Noneの場合、WRITE_EMPTY。 Defaults to None.
-        retry (int): リトライ回数。 Defaults to 0.
-        quote_character (str): 区切り文字。Noneの場合、ダブルクォーテーション。 Defaults to None.
+        retry (int): 一時的なエラーの場合のリトライ回数。Noneの場合はDEFAULT_RETRY。 Defaults to 0.
+        field_delimiter (str): ファイル区切り文字。CSVの場合のみ有効。 Defaults to ','.
+        quote_character (str): 区切り文字。Noneの場合、ダブルクォーテーション。CSVの場合のみ有効。 Defaults to None.
+        allow_quoted_newlines (bool): 囲み文字内の改行を許可するかどうか。CSVの場合のみ有効。 Defaults to True.
+        source_format (str): ファイル形式。'CSV'、'NEWLINE_DELIMITED_JSON'、'PARQUET'、'AVRO'、'ORC'のいずれか。
+                             gzip圧縮したCSV、NEWLINE_DELIMITED_JSONはそのまま読み込める。Noneの場合、CSV。 Defaults to None.
+        schema (list(dict)): テーブルのスキーマ。BigQueryのJSONスキーマと同じ書式で指定する。
+                             Noneの場合、既存テーブルのスキーマ、またはファイルのスキーマ（PARQUET、AVRO、ORC）を使う。
+                             Defaults to None.
+        autodetect (bool): CSV、NEWLINE_DELIMITED_JSONのスキーマを自動検出するかどうか。 Defaults to False.
+        time_partitioning (str or dict): パーティション列名、または'field'、'type'、'expiration_ms'をキーに持つdict。
+                                         Defaults to None.
+        clustering_fields (list(str)): クラスタリング列名のリスト。 Defaults to None.
+    """
+    if project_id is None:
+        project_id = 'jinzaisystem-tool'
+    if location is None:
+        location = 'asia-northeast1'
+    if write_disposition is None:
+        write_disposition = 'WRITE_EMPTY'
+
+    # クライアント作成
+    client = __get_client(project_id, local=False, location=location)
+
+    # configの作成
+    bq_config = __set_load_job_config(skip_leading_rows=skip_leading_rows,
+                                      write_disposition=write_disposition,
+                                      field_delimiter=field_delimiter,
+                                      quote_character=quote_character,
+                                      allow_quoted_newlines=allow_quoted_newlines,
+                                      source_format=source_format,
+                                      schema=schema,
+                                      autodetect=autodetect,
+                                      time_partitioning=time_partitioning,
+                                      clustering_fields=clustering_fields)
+    bq_config.labels = bq_job_ledger.get_job_labels(kwargs)
+
+    # BigQueryにロード
+    def submit_job(job_id):
+        return client.load_table_from_uri(source_cloud_storage_uris,
+                                          destination_project_dataset_table,
+                                          job_id=job_id,
+                                          location=location,
+                                          project=project_id,
+                                          job_config=bq_config)
+
+    job_id_prefix = __get_task_job_id_prefix(kwargs, 'load', source_cloud_storage_uris, destination_project_dataset_table)
+    __run_job(client, job_id_prefix, submit_job, location, retry, context=kwargs)
+
+
+def bq_load_file(local_file,
+                 destination_project_dataset_table,
+                 project_id=None,
+                 location=None,
+                 skip_leading_rows=1,
+                 write_disposition=None,
+                 retry=None,
+                 field_delimiter=',',
+                 quote_character=None,
+                 allow_quoted_newlines=True,
+                 source_format=None,
+                 schema=None,
+                 autodetect=False,
+                 time_partitioning=None,
+                 clustering_fields=None,
+                 gcs_archive_uri=None,
+                 **kwargs):
+    """ローカルのファイルを、GCSを経由せずにBigQueryにロードする。
+    CSV、NEWLINE_DELIMITED_JSONは送信時にgzip圧縮する。
+
+    Args:
+        local_file (str): ロードするローカルのファイルパス
+        destination_project_dataset_table (str): 出力先Bigqueryのジロジェクト、データセット、テーブルの文字列
+        gcs_archive_uri (str): ロード後に元のファイルをGCSに保存する場合、保存先のURI。gs://hogehoge/path/file.csv
+                               Noneの場合、GCSには保存しない。 Defaults to None.
+        その他の引数はbq_loadと同じ。
     """
     if project_id is None:
         project_id = 'jinzaisystem-tool'
@@ -340,22 +1793,505 @@ def bq_load(source_cloud_storage_uris,
         write_disposition = 'WRITE_EMPTY'
 
     # クライアント作成
-    client = __get_client(project_id, local=False)
+    client = __get_client(project_id, local=False, location=location)
 
     # configの作成
-    bq_config = bigquery.LoadJobConfig()
-    bq_config.skip_leading_rows = skip_leading_rows
-    bq_config.write_disposition = write_disposition
-    bq_config.field_delimiter = field_delimiter
-    bq_config.quote_character = quote_character
-    bq_config.allow_quoted_newlines = allow_quoted_newlines
+    bq_config = __set_load_job_config(skip_leading_rows=skip_leading_rows,
+                                      write_disposition=write_disposition,
+                                      field_delimiter=field_delimiter,
+                                      quote_character=quote_character,
+                                      allow_quoted_newlines=allow_quoted_newlines,
+                                      source_format=source_format,
+                                      schema=schema,
+                                      autodetect=autodetect,
+                                      time_partitioning=time_partitioning,
+                                      clustering_fields=clustering_fields)
+    bq_config.labels = bq_job_ledger.get_job_labels(kwargs)
+
     # BigQueryにロード
-    res = client.load_table_from_uri(source_cloud_storage_uris,
-                                     destination_project_dataset_table,
-                                     location=location,
-                                     project=project_id,
-                                     job_config=bq_config)
+    # 一時ファイルのパスは実行毎に変わるため、ファイルの内容でジョブを区別する
+    job_id_prefix = __get_task_job_id_prefix(kwargs, 'load_file', __get_file_md5(local_file),
+                                             destination_project_dataset_table)
+    __load_file(client, local_file, destination_project_dataset_table, bq_config,
+                project_id, location, retry, job_id_prefix, context=kwargs)
+
+    # GCSに保存
+    if gcs_archive_uri is not None:
+        __archive_to_gcs(local_file, gcs_archive_uri, project_id)
+
+
+def bq_load_dataframe(data,
+                      destination_project_dataset_table,
+                      project_id=None,
+                      location=None,
+                      write_disposition=None,
+                      retry=None,
+                      schema=None,
+                      time_partitioning=None,
+                      clustering_fields=None,
+                      gcs_archive_uri=None,
+                      **kwargs):
+    """DataFrame、またはpyarrow.Tableを、GCSを経由せずにBigQueryにロードする。
+    Parquetに変換して送信するため、列の型はDataFrameの型を引き継ぐ。
+
+    Args:
+        data (pandas.DataFrame or pyarrow.Table): ロードするデータ
+        destination_project_dataset_table (str): 出力先Bigqueryのジロジェクト、データセット、テーブルの文字列
+        project_id (str): プロジェクトID。Defaults to None.
+        location (str): 出力元BigQueryのデータセットのロケーション。Noneの場合、東京リージョン。 Defaults to None.
+        write_disposition (google.cloud.bigquery.job.WriteDisposition): テーブルの書き込みオプション。
+                            Noneの場合、WRITE_EMPTY。 Defaults to None.
+        retry (int): 一時的なエラーの場合のリトライ回数。指定がなければDEFAULT_RETRY。 Defaults to None.
+        schema (list(dict)): テーブルのスキーマ。Noneの場合、DataFrameの型から作成する。 Defaults to None.
+        time_partitioning (str or dict): パーティション列名、または'field'、'type'、'expiration_ms'をキーに持つdict。
+                                         Defaults to None.
+        clustering_fields (list(str)): クラスタリング列名のリスト。 Defaults to None.
+        gcs_archive_uri (str): ロード後にParquetファイルをGCSに保存する場合、保存先のURI。gs://hogehoge/path/file.parquet
+                               Noneの場合、GCSには保存しない。 Defaults to None.
+    """
+    if not isinstance(data, pa.Table):
+        data = pa.Table.from_pandas(data, preserve_index=False)
+
+    tmp_dir = tempfile.mkdtemp()
+    parquet_file = os.path.join(tmp_dir, '{}.parquet'.format(re.sub(r'[^\w.-]', '_', destination_project_dataset_table)))
     try:
-        res.result()
-    except Exception as e:
-        raise e
+        pq.write_table(data, parquet_file)
+        bq_load_file(parquet_file,
+                     destination_project_dataset_table,
+                     project_id=project_id,
+                     location=location,
+                     write_disposition=write_disposition,
+                     retry=retry,
+                     source_format='PARQUET',
+                     schema=schema,
+                     time_partitioning=time_partitioning,
+                     clustering_fields=clustering_fields,
+                     gcs_archive_uri=gcs_archive_uri,
+                     **kwargs)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def __load_file(client, local_file, destination, job_config, project_id, location, retry, job_id_prefix, context=None):
+    """ローカルのファイルをロードジョブで送信し、終了を待つ。
+
+    Args:
+        client (bigquery.Client)
+        local_file (str): ロードするローカルのファイルパス
+        destination (str): 出力先Bigqueryのジロジェクト、データセット、テーブルの文字列
+        job_config (bigquery.LoadJobConfig)
+        project_id (str): プロジェクトID
+        location (str): BigQueryのジョブを実行するロケーション
+        retry (int): 一時的なエラーの場合のリトライ回数
+        job_id_prefix (str): ジョブIDのプレフィックス
+        context (dict): Airflowのcontext。 Defaults to None.
+    """
+    # 圧縮済みのファイルはそのまま送信する
+    is_compress = job_config.source_format in LOAD_GZIP_SOURCE_FORMATS and not local_file.endswith('.gz')
+    upload_file = __gzip_file(local_file) if is_compress else local_file
+    try:
+        def submit_job(job_id):
+            with open(upload_file, 'rb') as f:
+                return client.load_table_from_file(f,
+                                                   destination,
+                                                   job_id=job_id,
+                                                   location=location,
+                                                   project=project_id,
+                                                   job_config=job_config)
+
+        __run_job(client, job_id_prefix, submit_job, location, retry, context=context)
+    finally:
+        if is_compress:
+            os.remove(upload_file)
+
+
+def __get_file_md5(local_file):
+    """ファイルの内容のMD5を取得する。
+
+    Args:
+        local_file (str): ファイルパス
+
+    Returns:
+        str: MD5の16進文字列
+    """
+    md5 = hashlib.md5()
+    with open(local_file, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            md5.update(chunk)
+    return md5.hexdigest()
+
+
+def __gzip_file(local_file):
+    """ファイルをgzip圧縮した一時ファイルを作成する。
+
+    Args:
+        local_file (str): 圧縮するファイルパス
+
+    Returns:
+        str: 圧縮した一時ファイルのパス。呼び出し元で削除すること。
+    """
+    fd, gzip_file = tempfile.mkstemp(suffix='.gz')
+    with os.fdopen(fd, 'wb') as raw, gzip.GzipFile(fileobj=raw, mode='wb', compresslevel=6) as gz:
+        with open(local_file, 'rb') as f:
+            shutil.copyfileobj(f, gz, 1024 * 1024)
+    return gzip_file
+
+
+def __archive_to_gcs(local_file, gcs_archive_uri, project_id):
+    """ロードしたファイルをGCSに保存する。
+
+    Args:
+        local_file (str): 保存するローカルのファイルパス
+        gcs_archive_uri (str): 保存先のURI。gs://hogehoge/path/file.csv
+        project_id (str): GCSのプロジェクトID
+    """
+    if not gcs_archive_uri.startswith('gs://') or '/' not in gcs_archive_uri[len('gs://'):]:
+        raise ValueError('gcs_archive_uriはgs://バケット名/ファイルパスの形式で指定してください。')
+    bucket_name, file_name = gcs_archive_uri[len('gs://'):].split('/', 1)
+    gcs = CloudStorageClient(project_id=project_id)
+    gcs.upload('gs://{}'.format(bucket_name), local_file, file_name)
+
+
+def get_job_id_prefix(dag_id, task_id, execution_date, generation=0, job_key=None):
+    """Airflowのタスクインスタンスから、決定的なジョブIDのプレフィックスを作成する。
+    同じタスクインスタンスであれば、リスケジュールやリトライで再実行されても同じ値となる。
+
+    Args:
+        dag_id (str): DAG ID
+        task_id (str): タスクID
+        execution_date (datetime): 実行日時
+        generation (int): タスクインスタンスをクリアして再実行した回数。 Defaults to 0.
+        job_key (str): 1タスクで複数のジョブを実行する場合に、ジョブを区別する文字列。 Defaults to None.
+
+    Returns:
+        str: ジョブIDのプレフィックス
+    """
+    key = '{}.{}.{}.{}.{}'.format(dag_id, task_id, execution_date.isoformat(), generation, job_key)
+    return 'airflow_{}_{}_{}'.format(re.sub('[^0-9a-zA-Z_-]', '_', dag_id),
+                                     re.sub('[^0-9a-zA-Z_-]', '_', task_id),
+                                     hashlib.sha256(key.encode('UTF-8')).hexdigest()[:16])
+
+
+def get_task_generation(ti):
+    """タスクインスタンスをクリアして再実行した回数を取得する。
+    クリアした場合はmax_triesが増えるため、max_triesとタスクのリトライ回数の差とする。
+
+    Args:
+        ti (TaskInstance): Airflowのタスクインスタンス
+
+    Returns:
+        int: クリアして再実行した回数
+    """
+    return max(ti.max_tries - ti.task.retries, 0)
+
+
+def get_job_key(*job_keys):
+    """ジョブの内容から、get_job_id_prefixのjob_keyに指定する文字列を作成する。
+    内容が同じであれば同じ値となる。
+
+    Args:
+        job_keys: ジョブの内容（クエリ、パラメータ、出力先等）
+
+    Returns:
+        str: ジョブの内容を表す文字列
+    """
+    return json.dumps(job_keys, sort_keys=True, default=str)
+
+
+def __get_task_job_id_prefix(context, *job_keys):
+    """bq_query、bq_load、bq_extractで投入するジョブIDのプレフィックスを作成する。
+    Airflowのcontextがある場合はタスクインスタンス、ジョブの内容、同じ内容での呼び出し回数から決定的に作成し、
+    ない場合は呼び出し毎に一意な値とする。
+    呼び出し回数はタスクインスタンスの試行ごとに、同じ内容のジョブのみを数える。
+    1タスクで同じ内容のジョブを複数回実行しても別のジョブとなり、リトライで再実行した場合は同じ内容のn回目の呼び出しが
+    同じジョブIDとなる。内容の異なるジョブの呼び出し回数や順番はジョブIDに影響しない。
+
+    Args:
+        context (dict): Airflowのcontext
+        job_keys: ジョブの内容（クエリ、パラメータ、出力先等）
+
+    Returns:
+        str: ジョブIDのプレフィックス
+    """
+    ti = context.get('ti')
+    if ti is None:
+        return 'bq_hook_{}'.format(uuid.uuid4().hex)
+    job_key = get_job_key(*job_keys)
+    ti_key = (ti.dag_id, ti.task_id, ti.execution_date.isoformat(), ti.try_number)
+    with __job_sequence_lock:
+        if ti_key not in __job_sequences:
+            __job_sequences.clear()
+            __job_sequences[ti_key] = {}
+        sequences = __job_sequences[ti_key]
+        sequence = sequences.get(job_key, 0)
+        sequences[job_key] = sequence + 1
+    # タスクインスタンスをクリアした場合のみ新しいジョブとする
+    return get_job_id_prefix(ti.dag_id,
+                             ti.task_id,
+                             ti.execution_date,
+                             generation=get_task_generation(ti),
+                             job_key='{}.{}'.format(job_key, sequence))
+
+
+def __is_transient_error(e):
+    """リトライすべき一時的なエラーかどうか。
+
+    Args:
+        e (Exception): 発生した例外
+
+    Returns:
+        bool: 一時的なエラーの場合はTrue
+    """
+    if isinstance(e, TRANSIENT_API_EXCEPTIONS):
+        return True
+    if isinstance(e, GoogleAPICallError):
+        for error in e.errors or []:
+            if isinstance(error, dict) and error.get('reason') in TRANSIENT_ERROR_REASONS:
+                return True
+        return False
+    # 通信エラー
+    return isinstance(e, (ConnectionError, TimeoutError))
+
+
+def __run_job(client, job_id_prefix, submit_job, location, retry=None, context=None, sql_file=None):
+    """ジョブを投入して終了を待つ。一時的なエラーの場合は、ジッター付きの指数バックオフでリトライする。
+    リトライ時は同じジョブIDのプレフィックスでジョブを探すため、実行中のジョブがあれば再投入せずに終了を待つ。
+    一時的でないエラーの場合はリトライせずに例外を発生させる。
+    Airflowのタスクのプロセスはatexitを実行せずに終了するため、ジョブの統計情報は終了時にテーブルに書き込む。
+
+    Args:
+        client (bigquery.Client)
+        job_id_prefix (str): ジョブIDのプレフィックス
+        submit_job (function): ジョブIDを引数に、ジョブを投入して返す関数
+        location (str): BigQueryのジョブを実行するロケーション
+        retry (int): リトライ回数。指定がなければDEFAULT_RETRY。 Defaults to None.
+        context (dict): Airflowのcontext。ジョブの統計情報の記録に使う。 Defaults to None.
+        sql_file (str): SQLファイルのパス。ジョブの統計情報の記録に使う。 Defaults to None.
+
+    Returns:
+        終了したジョブ
+    """
+    if retry is None:
+        retry = DEFAULT_RETRY
+
+    attempt = 0
+    while True:
+        job = None
+        try:
+            job = __find_or_submit_job(client, job_id_prefix, submit_job, location)
+            job.result()
+            bq_job_ledger.record(client, job, context=context, sql_file=sql_file)
+            bq_job_ledger.flush()
+            return job
+        except Exception as e:
+            # 失敗したジョブも統計情報を記録する
+            if job is not None and job.state == 'DONE':
+                bq_job_ledger.record(client, job, context=context, sql_file=sql_file)
+            if attempt >= retry or not __is_transient_error(e):
+                bq_job_ledger.flush()
+                raise e
+            interval = min(RETRY_BASE_INTERVAL * 2 ** attempt, RETRY_MAX_INTERVAL) * random.uniform(0.5, 1.0)
+            attempt += 1
+            logger.warn('一時的なエラーのため、{:.1f}秒後にリトライします（{}/{}回目）。詳細({})'.format(
+                interval, attempt, retry, e))
+            time.sleep(interval)
+
+
+def __find_or_submit_job(client, job_id_prefix, submit_job, location):
+    """ジョブIDのプレフィックスに連番を付与したジョブを順に確認し、
+    実行中または成功済みのジョブがあればそのジョブを返す。
+    失敗したジョブは飛ばし、存在しない連番のジョブIDでジョブを投入する。
+
+    Args:
+        client (bigquery.Client)
+        job_id_prefix (str): ジョブIDのプレフィックス
+        submit_job (function): ジョブIDを引数に、ジョブを投入して返す関数
+        location (str): BigQueryのジョブを実行するロケーション
+
+    Returns:
+        ジョブ
+    """
+    attempt = 0
+    while True:
+        job_id = '{}_{}'.format(job_id_prefix, attempt)
+        try:
+            job = client.get_job(job_id, location=location)
+        except NotFound:
+            logger.info('ジョブを投入します。ジョブID: {}'.format(job_id))
+            return submit_job(job_id)
+        if job.state != 'DONE' or job.error_result is None:
+            logger.info('投入済みのジョブを利用します。ジョブID: {} 状態: {}'.format(job_id, job.state))
+            return job
+        attempt += 1
+
+
+def submit_query_job(sql,
+                     job_id_prefix,
+                     project_id=None,
+                     destination=None,
+                     query_parameters=None,
+                     write_disposition=None,
+                     maximum_bytes_billed=None,
+                     by_query_str=False,
+                     location=None,
+                     labels=None,
+                     local=False):
+    """クエリのジョブを投入し、終了を待たずにジョブを返す。
+    同じジョブIDのプレフィックスで実行中または成功済みのジョブがある場合は、投入せずにそのジョブを返す。
+    job_id_prefix、labels以外の引数の意味はbq_queryの同名の引数と同じ。
+
+    Args:
+        job_id_prefix (str): ジョブIDのプレフィックス。get_job_id_prefixで作成する。
+        labels (dict): ジョブに設定するラベル。 Defaults to None.
+
+    Returns:
+        bigquery.QueryJob
+    """
+    if project_id is None:
+        project_id = 'jinzaisystem-tool'
+    if write_disposition is None:
+        write_disposition = 'WRITE_EMPTY'
+    if location is None:
+        location = 'asia-northeast1'
+
+    client = __get_client(project_id, local=local, location=location)
+
+    def submit_job(job_id):
+        query_str = read_query_str(sql, by_query_str=by_query_str, local=local)
+        job_config = __set_query_job_config(client=client,
+                                            project_id=project_id,
+                                            destination=destination,
+                                            query_parameters=query_parameters,
+                                            write_disposition=write_disposition,
+                                            maximum_bytes_billed=maximum_bytes_billed,
+                                            query_str=query_str)
+        job_config.labels = labels or {}
+        return client.query(query_str,
+                            job_config=job_config,
+                            job_id=job_id,
+                            location=location)
+
+    return __find_or_submit_job(client, job_id_prefix, submit_job, location)
+
+
+def submit_extract_job(source_project_dataset_table,
+                       destination_cloud_storage_uris,
+                       job_id_prefix,
+                       project_id=None,
+                       compression='NONE',
+                       export_format='CSV',
+                       field_delimiter=',',
+                       print_header=True,
+                       location=None,
+                       labels=None):
+    """テーブルをGCSに出力するジョブを投入し、終了を待たずにジョブを返す。
+    同じジョブIDのプレフィックスで実行中または成功済みのジョブがある場合は、投入せずにそのジョブを返す。
+    job_id_prefix、labels以外の引数の意味はbq_extractの同名の引数と同じ。
+
+    Args:
+        job_id_prefix (str): ジョブIDのプレフィックス。get_job_id_prefixで作成する。
+        labels (dict): ジョブに設定するラベル。 Defaults to None.
+
+    Returns:
+        bigquery.ExtractJob
+    """
+    if project_id is None:
+        project_id = 'jinzaisystem-tool'
+    if location is None:
+        location = 'asia-northeast1'
+
+    client = __get_client(project_id, location=location)
+
+    def submit_job(job_id):
+        job_config = __set_extract_job_config(compression=compression,
+                                              export_format=export_format,
+                                              field_delimiter=field_delimiter,
+                                              print_header=print_header)
+        job_config.labels = labels or {}
+        return client.extract_table(__get_table_ref(client, source_project_dataset_table),
+                                    destination_cloud_storage_uris,
+                                    job_config=job_config,
+                                    job_id=job_id,
+                                    project=project_id,
+                                    location=location)
+
+    return __find_or_submit_job(client, job_id_prefix, submit_job, location)
+
+
+def submit_load_job(source_cloud_storage_uris,
+                    destination_project_dataset_table,
+                    job_id_prefix,
+                    project_id=None,
+                    location=None,
+                    skip_leading_rows=1,
+                    write_disposition=None,
+                    field_delimiter=',',
+                    quote_character=None,
+                    allow_quoted_newlines=True,
+                    source_format=None,
+                    schema=None,
+                    autodetect=False,
+                    time_partitioning=None,
+                    clustering_fields=None,
+                    labels=None):
+    """GCSのファイルをBigQueryにロードするジョブを投入し、終了を待たずにジョブを返す。
+    同じジョブIDのプレフィックスで実行中または成功済みのジョブがある場合は、投入せずにそのジョブを返す。
+    job_id_prefix、labels以外の引数の意味はbq_loadの同名の引数と同じ。
+
+    Args:
+        job_id_prefix (str): ジョブIDのプレフィックス。get_job_id_prefixで作成する。
+        labels (dict): ジョブに設定するラベル。 Defaults to None.
+
+    Returns:
+        bigquery.LoadJob
+    """
+    if project_id is None:
+        project_id = 'jinzaisystem-tool'
+    if location is None:
+        location = 'asia-northeast1'
+    if write_disposition is None:
+        write_disposition = 'WRITE_EMPTY'
+
+    client = __get_client(project_id, location=location)
+
+    def submit_job(job_id):
+        job_config = __set_load_job_config(skip_leading_rows=skip_leading_rows,
+                                           write_disposition=write_disposition,
+                                           field_delimiter=field_delimiter,
+                                           quote_character=quote_character,
+                                           allow_quoted_newlines=allow_quoted_newlines,
+                                           source_format=source_format,
+                                           schema=schema,
+                                           autodetect=autodetect,
+                                           time_partitioning=time_partitioning,
+                                           clustering_fields=clustering_fields)
+        job_config.labels = labels or {}
+        return client.load_table_from_uri(source_cloud_storage_uris,
+                                          destination_project_dataset_table,
+                                          job_id=job_id,
+                                          location=location,
+                                          project=project_id,
+                                          job_config=job_config)
+
+    return __find_or_submit_job(client, job_id_prefix, submit_job, location)
+
+
+def record_job_statistics(job, context=None, sql_file=None, project_id=None, location=None, local=False):
+    """submit_query_job等で投入し、終了したジョブの統計情報を記録する。
+    記録した統計情報はすぐにテーブルに書き込む。
+
+    Args:
+        job: 終了したジョブ
+        context (dict): Airflowのcontext。 Defaults to None.
+        sql_file (str): SQLファイルのパス。 Defaults to None.
+        project_id (str): 統計情報を書き込むクライアントのプロジェクトID。 Defaults to None.
+        location (str): BigQueryのジョブを実行したロケーション。 Defaults to None.
+        local (bool): ローカル環境で実行する場合はTrue. Defaults to False.
+    """
+    if project_id is None:
+        project_id = 'jinzaisystem-tool'
+    if location is None:
+        location = 'asia-northeast1'
+    client = __get_client(project_id, local=local, location=location)
+    bq_job_ledger.record(client, job, context=context, sql_file=sql_file)
+    bq_job_ledger.flush()
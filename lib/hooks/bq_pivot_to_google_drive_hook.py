@@ -1,13 +1,25 @@
 from datetime import datetime, timedelta
 import os
+import re
 import shutil
 
 import pandas as pd
-from retry import retry
+from retry.api import retry_call
 
 import lib.hooks.bq_hook as bq
 from lib.utils import datetime_util
 from lib.utils.google_drive import GoogleDriveClient
+from lib.utils.google_drive_upload import get_gcs_data_bucket, print_upload_progress
+from lib.utils.google_drive_upload_checkpoint import GoogleDriveUploadCheckpoint
+
+# 集計をBigQueryで行う場合に、整数として扱う集計項目の型
+INTEGER_TYPES = ('INTEGER', 'INT64')
+# SQLファイル先頭のコメント（クエリパラメータの型ヒント）
+HEADER_COMMENT_PATTERN = re.compile(r'(?:[ \t]*(?:--[^\n]*)?\n)*')
+# Googleドライブの操作のリトライ回数
+GOOGLE_DRIVE_RETRY_COUNT = 3
+# Googleドライブの操作のリトライ間隔（秒）
+GOOGLE_DRIVE_RETRY_INTERVAL = 10
 
 
 def execute(sql,
@@ -22,6 +34,8 @@ def execute(sql,
             bq_max_return_records=500000,
             file_encoding='utf_8_sig',
             opt_google_drive_file_date_suffix=False,
+            use_bqstorage=False,
+            push_down=False,
             *args,
             **kwargs):
     """BigQueryのデータをピボットテーブルとしてGoogleドライブにファイル出力する。
@@ -40,20 +54,27 @@ def execute(sql,
         file_encoding (str, optional): 出力ファイルの文字コード(SHIFT_JIS,UTF8,UTF8SIGのみ). Defaults to 'utf_8_sig'.
         opt_google_drive_file_date_suffix(boolean, optional):Googleドライブに同名のファイルが既にあった場合、
             作成日が当日であれば上書き、前日以前であれば作成日のサフィックスをつけて退避する。. Defaults to False.
+        use_bqstorage (bool, optional): Trueの場合、クエリの結果をBigQuery Storage Read APIで取得する。 Defaults to False.
+        push_down (bool, optional): Trueの場合、ピボットテーブルのキー毎の集計をBigQueryで行い、集計結果のみを取得する。
+            SQLは単一のSELECT文とすること。bq_max_return_recordsは集計後のレコード数に適用する。
+            出力は生データから集計した場合と同じとなるが、FLOAT64の集計項目は加算順序の違いにより
+            最下位桁が異なる場合がある。 Defaults to False.
     """
 
     # 作業フォルダ設定
     work_dir = '/home/airflow/gcs/data/tmp/script/bq_pivot_to_google_drive_hook/{}_{}'.format(
         google_drive_folder_id,
         file_name_prefix)
-    work_sub_dir = '{}/tmp'.format(work_dir)
 
     # 空の作業フォルダ作成
     __make_empty_local_dir(work_dir)
-    __make_empty_local_dir(work_sub_dir)
 
     # BigQueryのデータを取得し、DataFrameを作成
-    df = __bq_query(project_id, sql, query_parameters, bq_max_return_records)
+    if push_down:
+        df = __bq_query_push_down(project_id, sql, query_parameters, bq_max_return_records,
+                                  pivot_index, pivot_columns, pivot_values, pivot_sort, use_bqstorage)
+    else:
+        df = __bq_query(project_id, sql, query_parameters, bq_max_return_records, use_bqstorage)
 
     # ピボットテーブル作成
     piv_df = __create_pivot_table(df, pivot_index, pivot_columns, pivot_values, pivot_sort)
@@ -71,8 +92,8 @@ def execute(sql,
         google_drive_folder_id,
         output_file_name,
         output_file_path,
-        work_sub_dir,
-        opt_google_drive_file_date_suffix)
+        opt_google_drive_file_date_suffix,
+        project_id)
 
 
 def __make_empty_local_dir(local_dir):
@@ -89,7 +110,7 @@ def __make_empty_local_dir(local_dir):
     os.makedirs(local_dir, exist_ok=True)
 
 
-def __bq_query(project_id, sql, query_parameters, bq_max_return_records):
+def __bq_query(project_id, sql, query_parameters, bq_max_return_records, use_bqstorage=False):
     """除外データのうちSFIDが紐付いたものを元に、SFの事業所オブジェクトを更新する
     更新処理はSFのbulk APIで、UPDATEで行う。
 
@@ -98,6 +119,7 @@ def __bq_query(project_id, sql, query_parameters, bq_max_return_records):
         sql (str): SQLファイルパス
         query_parameters (dict): クエリパラメータ
         bq_max_return_records(int): 最大取得レコード数
+        use_bqstorage(bool): BigQuery Storage Read APIで取得する場合はTrue
 
     Returns:
         DataFrame: クエリ結果
@@ -108,13 +130,96 @@ def __bq_query(project_id, sql, query_parameters, bq_max_return_records):
                                project_id=project_id,
                                query_parameters=query_parameters,
                                is_return_result=True,
-                               max_return_records=bq_max_return_records)
+                               max_return_records=bq_max_return_records,
+                               use_bqstorage=use_bqstorage)
     df = pd.DataFrame.from_records(query_result)
     return df
 
 
+def __bq_query_push_down(project_id,
+                         sql,
+                         query_parameters,
+                         bq_max_return_records,
+                         pivot_index,
+                         pivot_columns,
+                         pivot_values,
+                         pivot_sort,
+                         use_bqstorage=False):
+    """ピボットテーブルのキー（インデックス、ソート、カラム）でGROUP BYするクエリをBigQueryで実行し、
+    キー毎に集計項目の平均を持つDataFrameを作成する。
+    キー毎に1行となるため、このDataFrameからピボットテーブルを作成すると生データから作成した場合と同じ結果となる。
+    平均はSUMとCOUNTから算出する。__create_pivot_tableは整数型の集計項目の平均が全て整数の場合は整数型で出力するため、
+    dry runで取得したスキーマが整数型でNULLを含まない集計項目は、平均が全て整数であれば整数型とする。
+
+    Args:
+        project_id (str): GCPのプロジェクトID
+        sql (str): SQLファイルパス
+        query_parameters (dict): クエリパラメータ
+        bq_max_return_records(int): 最大取得レコード数
+        pivot_index (list): インデックス
+        pivot_columns (list): カラム
+        pivot_values (list): 集計値
+        pivot_sort (list):ソートするカラム
+        use_bqstorage(bool): BigQuery Storage Read APIで取得する場合はTrue
+
+    Returns:
+        DataFrame: キー毎の集計結果
+    """
+    query_str = bq.read_query_str(sql)
+
+    # キーと集計項目（重複は除く）
+    keys = []
+    for key in [index['column'] for index in pivot_index] + [s for s in pivot_sort if s != 'values'] + pivot_columns:
+        if key not in keys:
+            keys.append(key)
+    value_columns = []
+    for value in pivot_values:
+        if value['column'] not in value_columns:
+            value_columns.append(value['column'])
+
+    # dry runで集計項目の型を取得
+    schema = bq.get_query_schema(query_str,
+                                 project_id=project_id,
+                                 query_parameters=query_parameters,
+                                 by_query_str=True)
+    field_types = {field.name: field.field_type for field in schema}
+
+    # クエリパラメータの型ヒントを読み取れるよう、先頭のコメントは集計クエリの先頭にも残す
+    header = HEADER_COMMENT_PATTERN.match(query_str).group(0)
+    select_list = ['`{}`'.format(key) for key in keys]
+    for column in value_columns:
+        select_list.append('SUM(`{0}`) AS `{0}__sum__`'.format(column))
+        select_list.append('COUNT(`{0}`) AS `{0}__count__`'.format(column))
+        select_list.append('COUNTIF(`{0}` IS NULL) AS `{0}__nulls__`'.format(column))
+    push_down_query_str = '{}SELECT\n  {}\nFROM (\n{}\n)\nGROUP BY {}'.format(
+        header,
+        ',\n  '.join(select_list),
+        query_str.strip().rstrip(';'),
+        ', '.join('`{}`'.format(key) for key in keys))
+
+    query_result = bq.bq_query(push_down_query_str,
+                               project_id=project_id,
+                               query_parameters=query_parameters,
+                               is_return_result=True,
+                               max_return_records=bq_max_return_records,
+                               by_query_str=True,
+                               use_bqstorage=use_bqstorage)
+    df = pd.DataFrame.from_records(query_result, columns=[c.split(' AS ')[-1].strip('`') for c in select_list])
+
+    for column in value_columns:
+        mean = df['{}__sum__'.format(column)] / df['{}__count__'.format(column)]
+        if (field_types.get(column) in INTEGER_TYPES
+                and df['{}__nulls__'.format(column)].sum() == 0
+                and mean.notna().all()
+                and (mean == mean.round()).all()):
+            mean = mean.astype('int64')
+        df[column] = mean
+    return df[keys + value_columns]
+
+
 def __create_pivot_table(df, pivot_index, pivot_columns, pivot_values, pivot_sort):
     """DataFrameをもとにピボットテーブルを作成する。
+    集計値の型は集計項目ごとに決める。整数型の集計項目で平均が全て整数の場合はint64、それ以外はfloat64とする。
 
     Args:
         df (DataFrame): 集計元データ
@@ -155,25 +260,37 @@ def __create_pivot_table(df, pivot_index, pivot_columns, pivot_values, pivot_sor
         index_name_list.append('{}__sort__'.format(i))
         sort_name_list.append('{}__sort__'.format(i))
 
-    # 集計項目ごとにピボットテーブルを作成
+    # キー毎の集計項目の平均を、全集計項目まとめて1回のgroupbyで算出する
+    # キーはカテゴリ型とし、groupbyを高速化する
+    value_columns = []
+    for value in pivot_values:
+        if value['column'] not in value_columns:
+            value_columns.append(value['column'])
+    keys = index_list + pivot_columns
+    key_dtypes = {key: df[key].dtype for key in keys}
+    data = df[value_columns].assign(**{key: df[key].astype('category') for key in keys})
+    agged = data.groupby(keys, observed=True, sort=True)[value_columns].mean()
+
+    # 集計項目ごとにピボットテーブルの形に変形
+    index_column_names = index_name_list + ['指標', '__values_sort__']
     for i, value in enumerate(pivot_values):
-        piv = pd.pivot_table(
-            df,
-            index=index_list,
-            columns=pivot_columns,
-            values=[value['column']],
-            fill_value=0)
-        # 集計項目名を列に追加
+        # 集計値がNaNのキーはpd.pivot_tableと同じく除外する
+        values = agged[value['column']].dropna()
+        # 集計値の型はpandasのバージョンによらず、集計項目の型と平均の値から明示的に決める
+        if pd.api.types.is_integer_dtype(df[value['column']]) and (values == values.round()).all():
+            values = values.astype('int64')
+        else:
+            values = values.astype('float64')
+        piv = values.unstack(list(range(len(index_list), len(keys))), fill_value=0).sort_index(axis=1)
+        # 出力用に列名整形。indexとカラムを１行にする。
+        value_column_names = list(piv.columns.get_level_values(0)) if len(pivot_columns) > 1 else list(piv.columns)
         piv.insert(0, '__values_sort__', i)
         piv.insert(0, '指標', value['name'])
-        # 出力用に列名整形。indexとカラムを１行にする。
-        index_column_names = index_name_list.copy()
-        index_column_names.extend(['指標', '__values_sort__'])
         piv.reset_index(inplace=True)
-        value_column_names = [col[1] for col in piv.columns.values]
-        n = len(index_column_names)
-        index_column_names.extend(value_column_names[n:])
-        piv.columns = index_column_names
+        piv.columns = index_column_names + value_column_names
+        # カテゴリ型のキーは元の型に戻す
+        for key, name in zip(index_list, index_name_list):
+            piv[name] = piv[name].astype(key_dtypes[key])
         piv_list.append(piv)
 
     # １つのdfにまとめる
@@ -192,55 +309,81 @@ def __create_pivot_table(df, pivot_index, pivot_columns, pivot_values, pivot_sor
     return ret_df
 
 
-@retry(tries=3)
 def __upload_google_drive(
         google_drive_folder_id,
         upload_file_name,
         upload_file_path,
-        work_sub_dir,
-        opt_google_drive_file_date_suffix):
+        opt_google_drive_file_date_suffix,
+        project_id):
     """Googleドライブにファイルをアップロードする。
     Googleドライブ上に同名のファイルがあった場合、作成日を参照し、
     処理日以前の作成日であれば作成日のサフィックスを付与してリネーム、
-    作成日が処理日の場合は退避せずに上書きでアップロードする。
+    作成日が処理日の場合は削除して、アップロードする。
+    リネーム、削除はメタデータの操作のみで行い、ファイルの内容はダウンロードしない。
+    リトライは認証、検索、リネーム、削除、アップロードの手順ごとに行い、失敗した手順のみを再実行する。
+    アップロードはセッションURIをGCSに保存し、リトライやタスクの再実行では受信済みのバイト位置から再開する。
 
     Args:
         google_drive_folder_id (str): GoogleドライブフォルダID
         upload_file_name (str): アップロードするファイル名
         upload_file_path (str): アップロードするファイルのフルパス
-        work_sub_dir (str): ファイルのリネーム処理を行う作業ディレクトリ
         opt_google_drive_file_date_suffix(boolean, optional):Googleドライブに同名のファイルが既にあった場合、
             作成日が当日であれば上書き、前日以前であれば作成日のサフィックスをつけて退避する。. Defaults to False.
+        project_id (str): チェックポイントを保存するGCSのプロジェクトID
     """
     # Googleドライブ認証
-    client = GoogleDriveClient()
+    client = __retry_call(GoogleDriveClient)
 
     if opt_google_drive_file_date_suffix:
-        try:
-            # アップロードファイルと同名のファイルをGoogleドライブからダウンロード
-            gdrive_files = client.download_files(google_drive_folder_id, upload_file_name, work_sub_dir, query_operator='equals')
+        # アップロードファイルと同名のファイルをGoogleドライブから検索
+        gdrive_files = __retry_call(client.find_files,
+                                    google_drive_folder_id,
+                                    upload_file_name,
+                                    query_operator='equals')
+        if len(gdrive_files) > 0:
             # 同名ファイルの作成日チェック
             created_datetime = datetime.strptime(gdrive_files[0]['createdDate'][:19].replace('T', ' '), '%Y-%m-%d %H:%M:%S') + timedelta(hours=9)
             created_date = created_datetime.date()
             if(created_date == datetime_util.today_jst.date()):
                 # 作成日が処理日の場合は削除される
                 print('Googleドライブ上の本日作成の「{}」を削除します。'.format(upload_file_name))
+                __retry_call(client.delete_file, gdrive_files[0]['id'])
             else:
-                # 作成日が処理日でない場合は、別名で再アップロード
-                client.upload_file(
-                    '{}/{}'.format(work_sub_dir, upload_file_name),
-                    google_drive_folder_id,
-                    upload_file_name.replace('.csv', '_{}.csv'.format(created_date.strftime('%Y%m%d'))))
+                # 作成日が処理日でない場合は、作成日のサフィックスを付与してリネーム
+                __retry_call(client.rename_file,
+                             gdrive_files[0]['id'],
+                             upload_file_name.replace('.csv', '_{}.csv'.format(created_date.strftime('%Y%m%d'))))
                 print('Googleドライブ上の「{}」に作成日のサフィックスを付与します。'.format(upload_file_name))
 
-            # Googleドライブ上の同名ファイルを削除
-            client.delete_file(gdrive_files[0]['id'])
-        except FileNotFoundError:
-            # ファイルがない=新規作成なのでエラーとしない
-            pass
-
     # 作成したファイルをGoogleドライブ上にアップロード
-    client.upload_file(
-        upload_file_path,  # アップロードするファイルのファイルパス
-        google_drive_folder_id,  # アップロード先のGドライブのファイルID
-        upload_file_name)  # アップロードするファイルのファイル名
+    gcs_bucket_name, gcs_folder = get_gcs_data_bucket()
+    checkpoint = GoogleDriveUploadCheckpoint(
+        gcs_bucket_name=gcs_bucket_name,
+        gcs_prefix='{}tmp/script/bq_pivot_to_google_drive_hook/upload_checkpoint'.format(gcs_folder),
+        project_id=project_id)
+    __retry_call(client.upload_file,
+                 upload_file_path,  # アップロードするファイルのファイルパス
+                 google_drive_folder_id,  # アップロード先のGドライブのファイルID
+                 upload_file_name,  # アップロードするファイルのファイル名
+                 callback=print_upload_progress,
+                 checkpoint=checkpoint)
+
+
+
+
+def __retry_call(f, *args, **kwargs):
+    """Googleドライブの操作を、失敗した場合はGOOGLE_DRIVE_RETRY_COUNT回まで実行する。
+
+    Args:
+        f (callable): 実行する関数
+        args: 関数の引数
+        kwargs: 関数のキーワード引数
+
+    Returns:
+        関数の戻り値
+    """
+    return retry_call(f,
+                      fargs=args,
+                      fkwargs=kwargs,
+                      tries=GOOGLE_DRIVE_RETRY_COUNT,
+                      delay=GOOGLE_DRIVE_RETRY_INTERVAL)
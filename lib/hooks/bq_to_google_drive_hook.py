@@ -1,20 +1,28 @@
 """BigQueryからGoogleドライブにファイル連携する
 """
 import os
+import shutil
+import tempfile
 import time
-import xlsxwriter
 
 from airflow.models import Variable
+from google.cloud import exceptions
 
 from lib.hooks import bq_hook
-from lib.utils import file_util, google_drive
-from pprint import pprint
+from lib.logger import logger
+from lib.utils import cloud_storage, file_util, google_drive
+from lib.utils.cloud_storage import CloudStorageClient
+from lib.utils.google_drive_folder_resolver import GoogleDriveFolderResolver
+from lib.utils.google_drive_upload import get_gcs_data_bucket, print_upload_progress
+from lib.utils.google_drive_upload_checkpoint import GoogleDriveUploadCheckpoint
 
 
 # リトライ回数
 RETRY_COUNT = 3
 # リトライ間隔（秒）
 RETRY_INTERVAL = 10
+# 分割して出力するフォーマット（圧縮なしの場合のみ）
+SHARDED_EXPORT_FORMATS = ('CSV', 'NEWLINE_DELIMITED_JSON')
 
 
 def execute(source_project_dataset_table,
@@ -28,9 +36,12 @@ def execute(source_project_dataset_table,
             file_encoding=None,
             file_newline=None,
             location=None,
+            download_max_workers=None,
             *args,
             **kwargs):
     """BigQueryのテーブルをそのままGoogleドライブに出力する
+    圧縮なしのCSV、NEWLINE_DELIMITED_JSONの場合は、1GBを超えるテーブルも出力できるよう
+    ワイルドカードURIで分割して出力し、並列にダウンロードして結合する。
 
     Args:
         source_project_dataset_table (str): 出力元BigQueryのプロジェクト、データセット、テーブルの文字列
@@ -44,7 +55,43 @@ def execute(source_project_dataset_table,
         file_encoding (str): 出力ファイルの文字コード(SHIFT_JIS,UTF8,UTF8SIGのみ)
         file_newline (str): 出力ファイルの改行コード(CRLF,LFのみ)
         location (str): 出力元BigQueryのデータセットのロケーション。Noneの場合、東京リージョン。 Defaults to None.
+        download_max_workers (int): 分割ファイルのダウンロードの同時リクエスト数。
+                                    指定がなければcloud_storage.DOWNLOAD_MAX_WORKERS。 Defaults to None.
     """
+    if download_max_workers is None:
+        download_max_workers = cloud_storage.DOWNLOAD_MAX_WORKERS
+
+    # ファイルの文字コード、改行コード
+    to_file_encoding = file_util.ENCODING_SHIFT_JIS
+    to_file_newline = file_util.NEWLINE_WINDOWS
+    if file_encoding == 'UTF8':
+        to_file_encoding = file_util.ENCODING_UTF_8
+    elif file_encoding == 'UTF8SIG':
+        to_file_encoding = file_util.ENCODING_UTF_8_SIG
+    if file_newline == 'LF':
+        to_file_newline = file_util.NEWLINE_UNIX
+
+    if compression == 'NONE' and export_format in SHARDED_EXPORT_FORMATS:
+        upload_file = __extract_sharded(source_project_dataset_table,
+                                        file_name,
+                                        project_id,
+                                        export_format,
+                                        field_delimiter,
+                                        print_header,
+                                        to_file_encoding,
+                                        to_file_newline,
+                                        location,
+                                        download_max_workers)
+        try:
+            # Googleドライブのフォルダにアップロード
+            print('== [START] Googleドライブのフォルダにアップロード ==')
+            gdrive_client = __create_gdrive_client()
+            __upload_file(gdrive_client, upload_file, folder_id, file_name, project_id)
+            print('== [END] Googleドライブのフォルダにアップロード ==')
+        finally:
+            shutil.rmtree(os.path.dirname(upload_file), ignore_errors=True)
+        return
+
     # GCSのURIとローカルファイル名設定
     gcs_uri = '{}/tmp/script/bq_to_google_drive/{}'.format(Variable.get('gcs_data_folder'),
                                                            file_name)
@@ -68,15 +115,6 @@ def execute(source_project_dataset_table,
         # 変換せず、変数名のみ変更
         upload_file = local_file
     else:
-        to_file_encoding = file_util.ENCODING_SHIFT_JIS
-        to_file_newline = file_util.NEWLINE_WINDOWS
-        if file_encoding == 'UTF8':
-            to_file_encoding = file_util.ENCODING_UTF_8
-        elif file_encoding == 'UTF8SIG':
-            to_file_encoding = file_util.ENCODING_UTF_8_SIG
-
-        if file_newline == 'LF':
-            to_file_newline = file_util.NEWLINE_UNIX
         print('== [START] 文字コード、改行コードを変換 ==')
         file_util.encode_file(local_file,
                               upload_file,
@@ -89,14 +127,94 @@ def execute(source_project_dataset_table,
 
     # Googleドライブのフォルダにアップロード
     print('== [START] Googleドライブのフォルダにアップロード ==')
-    gdrive_client = google_drive.GoogleDriveClient()
-    gdrive_client.upload_file(upload_file, folder_id, file_name)
+    gdrive_client = __create_gdrive_client()
+    __upload_file(gdrive_client, upload_file, folder_id, file_name, project_id)
     print('== [END] Googleドライブのフォルダにアップロード ==')
 
     # GCSの一時ファイルを削除
     os.remove(upload_file)
 
 
+def __extract_sharded(source_project_dataset_table,
+                      file_name,
+                      project_id,
+                      export_format,
+                      field_delimiter,
+                      print_header,
+                      to_file_encoding,
+                      to_file_newline,
+                      location,
+                      download_max_workers):
+    """テーブルをワイルドカードURIで分割してGCSに出力し、分割ファイルを並列にダウンロードして結合する。
+    GCS-fuseを経由せずにダウンロードし、結合と同時に文字コード、改行コードを変換する。
+    GCS上の分割ファイルは、成否に関わらず削除する。
+
+    Returns:
+        str: 結合したローカルファイルのパス。呼び出し元で親ディレクトリごと削除すること。
+    """
+    bucket_name, folder = get_gcs_data_bucket()
+    shard_prefix = '{}tmp/script/bq_to_google_drive/{}/shard_'.format(folder, file_name)
+    gcs = CloudStorageClient(project_id=project_id)
+
+    # 前回失敗時の分割ファイルが残っていると結合されてしまうため、先に削除する
+    __delete_gcs_files(gcs, bucket_name, gcs.list_files(bucket_name, shard_prefix))
+
+    work_dir = tempfile.mkdtemp(prefix='bq_to_google_drive_')
+    shard_files = []
+    try:
+        # BigQueryのテーブルをGCSに分割して出力
+        print('== [START] BigQueryのテーブルをGCSに出力 ==')
+        bq_hook.bq_extract(
+            source_project_dataset_table=source_project_dataset_table,
+            destination_cloud_storage_uris='{}/{}*'.format(bucket_name, shard_prefix),
+            project_id=project_id,
+            compression='NONE',
+            export_format=export_format,
+            field_delimiter=field_delimiter,
+            print_header=print_header,
+            location=location)
+        shard_files = gcs.list_files(bucket_name, shard_prefix)
+        print('== [END] BigQueryのテーブルをGCSに出力 == 分割数: {}'.format(len(shard_files)))
+
+        # 分割ファイルを並列にダウンロード
+        print('== [START] 分割ファイルをダウンロード ==')
+        local_shard_files = ['{}/{}'.format(work_dir, f.split('/')[-1]) for f in shard_files]
+        gcs.download_parallel(bucket_name, shard_files, local_shard_files, max_workers=download_max_workers)
+        print('== [END] 分割ファイルをダウンロード ==')
+
+        # ファイル名順に結合し、同時に文字コード、改行コードを変換
+        print('== [START] 分割ファイルを結合、文字コード、改行コードを変換 ==')
+        upload_file = '{}/{}'.format(work_dir, file_name)
+        file_util.merge_files(local_shard_files,
+                              upload_file,
+                              skip_header=export_format == 'CSV' and print_header,
+                              to_file_encoding=to_file_encoding,
+                              to_file_newline=to_file_newline,
+                              encoding_error_option=file_util.ENCODING_ERROR_REPLACE)
+        for local_shard_file in local_shard_files:
+            os.remove(local_shard_file)
+        print('== [END] 分割ファイルを結合、文字コード、改行コードを変換 ==')
+    except Exception:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        raise
+    finally:
+        # GCSの分割ファイルを削除。削除の失敗で処理結果や元の例外を上書きしない
+        try:
+            __delete_gcs_files(gcs, bucket_name, shard_files or gcs.list_files(bucket_name, shard_prefix))
+        except Exception as e:
+            logger.warn('GCSの分割ファイルを削除できませんでした。詳細({})'.format(e))
+    return upload_file
+
+
+
+def __delete_gcs_files(gcs, bucket_name, file_names):
+    for file_name in file_names:
+        try:
+            gcs.delete(bucket_name, file_name)
+        except exceptions.NotFound:
+            pass
+
+
 def execute_sql(sql,
                 file_name,
                 folder_id,
@@ -111,6 +229,7 @@ def execute_sql(sql,
                 upload_format='CSV',
                 query_parameters=None,
                 xcom_parameters=None,
+                use_bqstorage=False,
                 local=False,
                 *args,
                 **kwargs):
@@ -134,36 +253,25 @@ def execute_sql(sql,
                         None の場合、東京リージョン。 Defaults to None.
         upload_format (str): アップロードフォーマット（CSV, XLSX）。
                              XLSXの場合file_encoding はSHIFT_JIS、file_newline はCRLF固定となる、file_name の拡張子には.xlsxを付けること。
+                             XLSXの場合、1シートの最大行数（1048576行）を超えると新しいシートに出力する。
                              Defaults to 'CSV'.
         query_parameters (dict): クエリパラメータ。. Defaults to None.
                                  SQLファイルに、「@hoge」「@hoge2」のように変数を設定することで、パラメータを設定できる。
                                  {'hoge': 'value', 'hoge2', 'value2'}のようにdictでパラメータを設定する。
-                                 valueの部分は、str、int、floatのみ設定可能。これ以外の型の場合、
-                                 クエリパラメータには設定されず、無視される。
+                                 valueの型からクエリパラメータの型を決める。bool、int、float、Decimal、str、bytes、
+                                 date(DATE)、datetime(タイムゾーンなしはDATETIME、ありはTIMESTAMP)、time、list(ARRAY)、dict(STRUCT)を設定可能。
+                                 SQLファイル先頭に「-- @param hoge DATE」のように型ヒントを記載した場合は、その型とする。
+                                 これ以外の型の場合はValueError。型ヒントがなく値がNoneの場合は設定されない。
         xcom_parameters (dict): クエリパラメータ。. Defaults to None.
                                 「'task_id' : <タスクID>」と「'key' : <XCOMのキー>」のdist形式で指定で指定する。
                                 XCOMから値を取得してクエリパラメータに追加する。
                                 クエリパラメータに追加するキーは<XCOMのキー>とする。
+        use_bqstorage (bool): Trueの場合、クエリの結果をBigQuery Storage Read APIで取得する。 Defaults to False.
         local (bool): ローカル環境で実行する場合はTrue. Defaults to False.
     """
     # GCSのローカルファイル名設定
     local_file = '/home/airflow/gcs/data/tmp/script/bq_to_google_drive/{}'.format(file_name)
 
-    print('== [START] BigQueryに対してクエリを発行 ==')
-    try:
-        df = bq_hook.bq_query(
-            sql=sql,
-            project_id=project_id,
-            query_parameters=query_parameters,
-            xcom_parameters=xcom_parameters,
-            is_return_result=True,
-            return_type='df',
-            location=location,
-            local=local)
-    except Exception as e:
-        raise ValueError('クエリの実行に失敗しました。詳細({})'.format(e))
-    print('== [END] BigQueryに対してクエリを発行 ==')
-
     try:
         # GCSに出力
         if upload_format == 'CSV':
@@ -180,24 +288,44 @@ def execute_sql(sql,
                 prm_file_newline = '\n'
             else:
                 prm_file_newline = '\r\n'
-            df.to_csv(path_or_buf=local_file, sep=field_delimiter, index=False, header=print_header, encoding=prm_file_encoding, line_terminator=prm_file_newline)
+            # クエリの結果をページ単位でファイルに書き込む
+            try:
+                bq_hook.bq_query_to_file(
+                    sql=sql,
+                    local_file=local_file,
+                    file_format='CSV',
+                    project_id=project_id,
+                    query_parameters=query_parameters,
+                    xcom_parameters=xcom_parameters,
+                    encoding=prm_file_encoding,
+                    newline=prm_file_newline,
+                    field_delimiter=field_delimiter,
+                    print_header=print_header,
+                    location=location,
+                    use_bqstorage=use_bqstorage,
+                    local=local,
+                    **kwargs)
+            except Exception as e:
+                raise ValueError('クエリの実行に失敗しました。詳細({})'.format(e))
             print('== [END] CSV出力 ==')
         elif upload_format == 'XLSX':
             print('== [START] Excel出力 ==')
-            # xlsxwriterを使用してExcelファイルを作成（df.to_excel()だとサイズが大きい場合にメモリエラーとなりデーモン化（⇒突然死）してしまう）
-            workbook = xlsxwriter.Workbook(local_file, {'constant_memory': True})
-            worksheet = workbook.add_worksheet()
-            # 行数だけ繰り返す
-            for index_row, row_data in enumerate(df.itertuples(name=None)):
-                # ヘッダ行を飛ばす
-                if index_row == 0 and print_header:
-                    continue
-                for index_column, data in enumerate(row_data):
-                    # index列を飛ばす
-                    if index_column == 0:
-                        continue
-                    worksheet.write(index_row, index_column - 1, data)
-            workbook.close()
+            # クエリの結果をページ単位でファイルに書き込む
+            try:
+                bq_hook.bq_query_to_file(
+                    sql=sql,
+                    local_file=local_file,
+                    file_format='XLSX',
+                    project_id=project_id,
+                    query_parameters=query_parameters,
+                    xcom_parameters=xcom_parameters,
+                    print_header=print_header,
+                    location=location,
+                    use_bqstorage=use_bqstorage,
+                    local=local,
+                    **kwargs)
+            except Exception as e:
+                raise ValueError('クエリの実行に失敗しました。詳細({})'.format(e))
             print('== [END] Excel出力 ==')
         else:
             raise ValueError('upload_formatパラメータにはCSVまたは、XLSXを指定してください。')
@@ -207,44 +335,23 @@ def execute_sql(sql,
         print('== [END] Googleドライブのクライアントオブジェクトを生成・取得 ==')
 
         print('== [START] 出力先GoogleドライブのフォルダIDを取得 ==')
-        if folder_id is None:
-            # アップロードパスをフォルダ名のリストに整形（ツリー）
-            folder_name = upload_path.split('/')
-            pprint(folder_name)
-            hierarchy_max = len(folder_name)
-            hierarchy = 0
-            target_id = parent_folder_id
-            while hierarchy_max != 0:
-                print('folder_name[' + str(hierarchy) + ']: ' + folder_name[hierarchy])
-                if folder_name[hierarchy] != '':
-                    # Googleドライブの指定フォルダID内に存在するフォルダの一覧を取得
-                    folder_list = __list_folder(gdrive_client, target_id)
-                    # 対象フォルダを探す
-                    find = False
-                    for folder in folder_list:
-                        print("folder['title']: " + folder['title'])
-                        if folder['title'] == folder_name[hierarchy]:
-                            find = True
-                            target_id = folder['id']
-                            print('target_id: ' + target_id)
-                            break
-                    if not find:
-                        # 存在しない場合は作成する
-                        target_id = __create_folder(gdrive_client, target_id, folder_name[hierarchy])
-                        print('target_id(create): ' + target_id)
-                hierarchy = hierarchy + 1
-                if hierarchy < hierarchy_max:
-                    continue
-                else:
-                    folder_id = target_id
-                    break
+        if folder_id is None and parent_folder_id is not None and upload_path is not None:
+            # フォルダパスをフォルダIDに解決する。存在しないフォルダは作成する
+            gcs_bucket_name, gcs_folder = get_gcs_data_bucket()
+            resolver = GoogleDriveFolderResolver(
+                gdrive_client,
+                gcs_bucket_name=gcs_bucket_name,
+                gcs_prefix='{}tmp/script/bq_to_google_drive/folder_cache'.format(gcs_folder),
+                project_id=project_id,
+                local=local)
+            folder_id = resolver.resolve(parent_folder_id, upload_path)
         if folder_id is None:
             raise ValueError('パラメータfolder_idを指定しない場合、parent_folder_id、upload_pathの指定は必須です。')
         print('出力先GoogleドライブのフォルダID： ' + folder_id)
         print('== [END] 出力先GoogleドライブのフォルダIDを取得 ==')
 
         print('== [START] Googleドライブのフォルダにアップロード ==')
-        __upload_file(gdrive_client, local_file, folder_id, file_name)
+        __upload_file(gdrive_client, local_file, folder_id, file_name, project_id, local=local)
         print('== [END] Googleドライブのフォルダにアップロード ==')
     finally:
         # GCSの一時ファイルを削除
@@ -272,52 +379,25 @@ def __create_gdrive_client():
     return gdrive_client
 
 
-def __list_folder(gdrive_client, target_id):
-    print('★ __list_folder() START ★')
-
-    count = 0
-    while True:
-        try:
-            # Googleドライブの指定フォルダID内に存在するフォルダの一覧を取得
-            folder_list = gdrive_client.list_folder(target_id)
-            break
-        except Exception as e:
-            count = count + 1
-            if count > RETRY_COUNT:
-                raise e
-            time.sleep(RETRY_INTERVAL)
-
-    print('★ __list_folder() END ★')
-    return folder_list
-
-
-def __create_folder(gdrive_client, parent_folder_id, folder_name):
-    print('★ __create_folder() START ★')
-
-    count = 0
-    while True:
-        try:
-            # Googleドライブの指定フォルダID下にフォルダを作成
-            folder_id = gdrive_client.create_folder(parent_folder_id, folder_name)
-            break
-        except Exception as e:
-            count = count + 1
-            if count > RETRY_COUNT:
-                raise e
-            time.sleep(RETRY_INTERVAL)
-
-    print('★ __create_folder() END ★')
-    return folder_id
-
-
-def __upload_file(gdrive_client, upload_file, folder_id, file_name):
+def __upload_file(gdrive_client, upload_file, folder_id, file_name, project_id, local=False):
     print('★ __upload_file() START ★')
 
+    # 失敗したアップロードをリトライやタスクの再実行で再開できるよう、セッションURIをGCSにも保存する
+    gcs_bucket_name, gcs_folder = get_gcs_data_bucket()
+    checkpoint = GoogleDriveUploadCheckpoint(
+        gcs_bucket_name=gcs_bucket_name,
+        gcs_prefix='{}tmp/script/bq_to_google_drive/upload_checkpoint'.format(gcs_folder),
+        project_id=project_id,
+        local=local)
     count = 0
     while True:
         try:
             # Googleドライブの指定フォルダID下にファイルをアップロード
-            file_id = gdrive_client.upload_file(upload_file, folder_id, file_name)
+            file_id = gdrive_client.upload_file(upload_file,
+                                                folder_id,
+                                                file_name,
+                                                callback=print_upload_progress,
+                                                checkpoint=checkpoint)
             break
         except Exception as e:
             count = count + 1
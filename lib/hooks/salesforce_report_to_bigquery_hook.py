@@ -3,7 +3,6 @@
 import re
 
 from lib.utils.salesforce import SalesforceClient
-from lib.utils.cloud_storage import CloudStorageClient
 from lib.hooks import bq_hook as bq
 
 
@@ -15,6 +14,7 @@ def execute(sf_report_id,
             write_disposition='WRITE_TRUNCATE',
             location='asia-northeast1',
             allow_no_record=False,
+            gcs_archive=False,
             **kwargs):
     """SFのレポートを取得し、BigQueryにロードする。
 
@@ -29,6 +29,7 @@ def execute(sf_report_id,
                                                                         'WRITE_EMPTY','WRITE_APPEND','WRITE_TRUNCATE'のいずれか。
         location (str): 出力元BigQueryのデータセットのロケーション。 Defaults to asis-northeast1.
         allow_no_record (bool, optional): SFレポートの結果が0件の場合、Trueなら何もせずに正常終了、Falseならエラー. Defaults to False.
+        gcs_archive (bool, optional): Trueの場合、ロードしたCSVファイルをgs://{project_id}-sf-reportに保存する. Defaults to False.
     """
     # 引数チェック destination_dataset_table
     if re.match('.*\\..*', destination_dataset_table):
@@ -61,17 +62,16 @@ def execute(sf_report_id,
             # 異常終了
             raise Exception('取得したレポートの結果が0件でした。')
 
-    # GCSクライアントのインスタンス生成
-    gcs_bucket_name = 'gs://{}-sf-report'.format(project_id)
-    cs = CloudStorageClient(project_id=project_id)
+    # GCSに保存する場合の保存先
+    gcs_archive_uri = None
+    if gcs_archive:
+        gcs_archive_uri = 'gs://{}-sf-report/{}'.format(project_id, gcs_file_path)
 
-    # ローカルファイルをGCSにアップロード
-    cs.upload(gcs_bucket_name, local_csv_file, gcs_file_path)
-
-    # BigQueryにロードする
-    bq.bq_load('{}/{}'.format(gcs_bucket_name, gcs_file_path),
-               bq_table,
-               project_id=project_id,
-               location=location,
-               write_disposition=write_disposition,
-               retry=3)
+    # GCSを経由せずにBigQueryにロードする
+    bq.bq_load_file(local_csv_file,
+                    bq_table,
+                    project_id=project_id,
+                    location=location,
+                    write_disposition=write_disposition,
+                    retry=3,
+                    gcs_archive_uri=gcs_archive_uri)
@@ -0,0 +1,276 @@
+"""BigQueryのジョブを投入し、終了をリスケジュールモードで待つOperatorクラス群
+
+BqQueryOperator等のPythonOperatorは、ジョブの終了までワーカーのスロットを占有する。
+このモジュールのOperatorはジョブを投入した後スロットを解放し、poke_interval毎にジョブの状態を確認する。
+ジョブIDはDAG ID、タスクID、実行日時と、ジョブの内容（クエリ、パラメータ、出力先等）から決定的に作成するため、
+リスケジュールやリトライで再実行されても、実行中または成功済みのジョブがあれば再投入しない。
+SQLファイルやパラメータを変更した場合は、別のジョブとして投入する。
+ジョブが失敗した場合はタスクを失敗とし、リトライ時に新しいジョブIDでジョブを投入する。
+"""
+import abc
+
+from airflow.exceptions import AirflowException
+from airflow.models import Variable
+from airflow.sensors.base_sensor_operator import BaseSensorOperator
+from airflow.utils.decorators import apply_defaults
+
+from lib.hooks import bq_hook
+from lib.utils import bq_job_ledger
+
+
+class BqAsyncJobOperator(BaseSensorOperator, metaclass=abc.ABCMeta):
+    """BigQueryのジョブを投入し、終了を待つOperatorの基底クラス
+    サブクラスでget_job_keyとsubmit_jobを実装する。
+    """
+
+    @apply_defaults
+    def __init__(
+            self,
+            project_id=None,
+            location=None,
+            mode='reschedule',
+            poke_interval=60,
+            *args,
+            **kwargs):
+        """初期化
+
+        Args:
+            project_id (str): BigQueryのジョブを実行するプロジェクト。Noneの場合はAirflowのプロジェクトIDを設定. Defaults to None.
+            location (str): BigQueryのジョブを実行するロケーション。指定がなければ asia-northeast1. Defaults to None.
+            mode (str): 'reschedule'の場合、ジョブの状態確認の間はワーカーのスロットを解放する。 Defaults to 'reschedule'.
+            poke_interval (int): ジョブの状態を確認する間隔（秒）。 Defaults to 60.
+        """
+        super(BqAsyncJobOperator, self).__init__(mode=mode,
+                                                 poke_interval=poke_interval,
+                                                 *args,
+                                                 **kwargs)
+        # プロジェクトIDがNoneの場合はAirflowのプロジェクトIDを設定
+        if project_id is None:
+            project_id = Variable.get('project_id')
+        self.project_id = project_id
+        self.location = location
+
+    @abc.abstractmethod
+    def get_job_key(self):
+        """ジョブIDのプレフィックスに含める、ジョブの内容を表す文字列を作成する。
+        bq_hookのbq_query、bq_load、bq_extractと同じ内容から作成する。
+
+        Returns:
+            str: ジョブの内容を表す文字列
+        """
+
+    @abc.abstractmethod
+    def submit_job(self, job_id_prefix, labels=None):
+        """ジョブを投入する。投入済みのジョブがある場合はそのジョブを返す。
+
+        Args:
+            job_id_prefix (str): ジョブIDのプレフィックス
+            labels (dict): ジョブに設定するラベル。 Defaults to None.
+
+        Returns:
+            ジョブ
+        """
+
+    def poke(self, context):
+        """ジョブを投入、または投入済みのジョブの状態を確認する。
+
+        Args:
+            context (dict): Airflowのcontext
+
+        Raises:
+            AirflowException: ジョブが失敗した場合
+
+        Returns:
+            bool: ジョブが成功した場合はTrue
+        """
+        # タスクインスタンスをクリアした場合、またはジョブの内容を変更した場合のみ新しいジョブとする
+        ti = context['ti']
+        job_id_prefix = bq_hook.get_job_id_prefix(self.dag_id,
+                                                  self.task_id,
+                                                  context['execution_date'],
+                                                  generation=bq_hook.get_task_generation(ti),
+                                                  job_key=self.get_job_key())
+        sql_file = getattr(self, 'sql', None)
+        job = self.submit_job(job_id_prefix, labels=bq_job_ledger.get_job_labels(context, sql_file=sql_file))
+        self.log.info('ジョブID: %s 状態: %s', job.job_id, job.state)
+        if job.state != 'DONE':
+            return False
+        bq_hook.record_job_statistics(job,
+                                      context=context,
+                                      sql_file=sql_file,
+                                      project_id=self.project_id,
+                                      location=self.location)
+        if job.error_result is not None:
+            raise AirflowException('ジョブが失敗しました。ジョブID: {} 詳細({})'.format(job.job_id, job.error_result))
+        ti.xcom_push(key='job_id', value=job.job_id)
+        return True
+
+
+class BqQueryAsyncOperator(BqAsyncJobOperator):
+
+    template_fields = ('sql', 'destination', 'query_parameters')
+    ui_color = '#B2DDFF'
+    @apply_defaults
+    def __init__(
+            self,
+            sql,
+            destination=None,
+            query_parameters=None,
+            write_disposition='WRITE_EMPTY',
+            maximum_bytes_billed=None,
+            *args,
+            **kwargs):
+        """BigQueryのクエリを投入し、終了をリスケジュールモードで待つOperator
+
+        Args:
+            sql (str): SQLファイルのパス。AirflowのDAGフォルダからの相対パスで指定する。
+            destination (str): 保存先テーブル。書式はBqQueryOperatorと同じ。. Defaults to None.
+            query_parameters (dict): クエリパラメータ。. Defaults to None.
+            write_disposition (str): 保存先テーブルの書き込み方法. Defaults to 'WRITE_EMPTY'.
+                                     'WRITE_EMPTY','WRITE_APPEND','WRITE_TRUNCATE'のいずれか。
+            maximum_bytes_billed (int): 課金バイト数の上限。Noneの場合、上限なし。 Defaults to None.
+        """
+        super(BqQueryAsyncOperator, self).__init__(*args, **kwargs)
+        self.sql = sql
+        self.destination = destination
+        self.query_parameters = query_parameters
+        self.write_disposition = write_disposition
+        self.maximum_bytes_billed = maximum_bytes_billed
+
+    def get_job_key(self):
+        return bq_hook.get_job_key('query',
+                                   bq_hook.read_query_str(self.sql),
+                                   self.query_parameters,
+                                   self.destination)
+
+    def submit_job(self, job_id_prefix, labels=None):
+        return bq_hook.submit_query_job(self.sql,
+                                        job_id_prefix,
+                                        project_id=self.project_id,
+                                        destination=self.destination,
+                                        query_parameters=self.query_parameters,
+                                        write_disposition=self.write_disposition,
+                                        maximum_bytes_billed=self.maximum_bytes_billed,
+                                        location=self.location,
+                                        labels=labels)
+
+
+class BqLoadAsyncOperator(BqAsyncJobOperator):
+
+    template_fields = ('source_cloud_storage_uris', 'destination_project_dataset_table')
+    ui_color = '#6DC1FF'
+    @apply_defaults
+    def __init__(
+            self,
+            source_cloud_storage_uris,
+            destination_project_dataset_table,
+            skip_leading_rows=1,
+            write_disposition=None,
+            field_delimiter=',',
+            quote_character=None,
+            source_format=None,
+            schema=None,
+            autodetect=False,
+            time_partitioning=None,
+            clustering_fields=None,
+            *args,
+            **kwargs):
+        """GCSのファイルをBigQueryにロードするジョブを投入し、終了をリスケジュールモードで待つOperator
+
+        Args:
+            source_cloud_storage_uris (str or list(str)): 出力元GCSのURI。ワイルドカード、またはURIのリストも指定できる。
+            destination_project_dataset_table (str): 出力先Bigqueryのジロジェクト、データセット、テーブルの文字列
+            skip_leading_rows (int): スキップ行数。 Defaults to 1.
+            write_disposition (google.cloud.bigquery.job.WriteDisposition): テーブルの書き込みオプション。
+                              Noneの場合、WRITE_EMPTY。 Defaults to None.
+            field_delimiter (str): ファイル区切り文字。 Defaults to ','.
+            quote_character (str): 区切り文字。Noneの場合、ダブルクォーテーション。 Defaults to None.
+            source_format (str): ファイル形式。'CSV'、'NEWLINE_DELIMITED_JSON'、'PARQUET'、'AVRO'、'ORC'のいずれか。
+                                 Noneの場合、CSV。 Defaults to None.
+            schema (list(dict)): テーブルのスキーマ。BigQueryのJSONスキーマと同じ書式で指定する。 Defaults to None.
+            autodetect (bool): CSV、NEWLINE_DELIMITED_JSONのスキーマを自動検出するかどうか。 Defaults to False.
+            time_partitioning (str or dict): パーティション列名、または'field'、'type'、'expiration_ms'をキーに持つdict。
+                                             Defaults to None.
+            clustering_fields (list(str)): クラスタリング列名のリスト。 Defaults to None.
+        """
+        super(BqLoadAsyncOperator, self).__init__(*args, **kwargs)
+        self.source_cloud_storage_uris = source_cloud_storage_uris
+        self.destination_project_dataset_table = destination_project_dataset_table
+        self.skip_leading_rows = skip_leading_rows
+        self.write_disposition = write_disposition
+        self.field_delimiter = field_delimiter
+        self.quote_character = quote_character
+        self.source_format = source_format
+        self.schema = schema
+        self.autodetect = autodetect
+        self.time_partitioning = time_partitioning
+        self.clustering_fields = clustering_fields
+
+    def get_job_key(self):
+        return bq_hook.get_job_key('load', self.source_cloud_storage_uris, self.destination_project_dataset_table)
+
+    def submit_job(self, job_id_prefix, labels=None):
+        return bq_hook.submit_load_job(self.source_cloud_storage_uris,
+                                       self.destination_project_dataset_table,
+                                       job_id_prefix,
+                                       project_id=self.project_id,
+                                       location=self.location,
+                                       skip_leading_rows=self.skip_leading_rows,
+                                       write_disposition=self.write_disposition,
+                                       field_delimiter=self.field_delimiter,
+                                       quote_character=self.quote_character,
+                                       source_format=self.source_format,
+                                       schema=self.schema,
+                                       autodetect=self.autodetect,
+                                       time_partitioning=self.time_partitioning,
+                                       clustering_fields=self.clustering_fields,
+                                       labels=labels)
+
+
+class BqExtractAsyncOperator(BqAsyncJobOperator):
+
+    template_fields = ('source_project_dataset_table', 'destination_cloud_storage_uris')
+    ui_color = '#D6F9FF'
+    @apply_defaults
+    def __init__(
+            self,
+            source_project_dataset_table,
+            destination_cloud_storage_uris,
+            compression='NONE',
+            export_format='CSV',
+            field_delimiter=',',
+            print_header=True,
+            *args,
+            **kwargs):
+        """BigQueryのテーブルをGCSに出力するジョブを投入し、終了をリスケジュールモードで待つOperator
+
+        Args:
+            source_project_dataset_table (str): 出力元BigQueryのプロジェクト、データセット、テーブルの文字列
+            destination_cloud_storage_uris (str): 出力先GCSのURI
+            compression (google.cloud.bigquery.job.Compression): 圧縮種別。 Defaults to 'NONE'.
+            export_format (google.cloud.bigquery.job.DestinationFormat): 出力フォーマット。 Defaults to 'CSV'.
+            field_delimiter (str): ファイル区切り文字。 Defaults to ','.
+            print_header (bool): ヘッダを出力するかどうか。 Defaults to True.
+        """
+        super(BqExtractAsyncOperator, self).__init__(*args, **kwargs)
+        self.source_project_dataset_table = source_project_dataset_table
+        self.destination_cloud_storage_uris = destination_cloud_storage_uris
+        self.compression = compression
+        self.export_format = export_format
+        self.field_delimiter = field_delimiter
+        self.print_header = print_header
+
+    def get_job_key(self):
+        return bq_hook.get_job_key('extract', self.source_project_dataset_table, self.destination_cloud_storage_uris)
+
+    def submit_job(self, job_id_prefix, labels=None):
+        return bq_hook.submit_extract_job(self.source_project_dataset_table,
+                                          self.destination_cloud_storage_uris,
+                                          job_id_prefix,
+                                          project_id=self.project_id,
+                                          compression=self.compression,
+                                          export_format=self.export_format,
+                                          field_delimiter=self.field_delimiter,
+                                          print_header=self.print_header,
+                                          location=self.location,
+                                          labels=labels)
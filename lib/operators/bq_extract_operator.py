@@ -56,5 +56,6 @@ class BqExtractOperator(PythonOperator):
 
         super(BqExtractOperator, self).__init__(python_callable=python_callable,
                                                 op_kwargs=op_kwargs,
+                                                provide_context=True,
                                                 *args,
                                                 **kwargs)
@@ -23,20 +23,33 @@ class BqLoadOperator(PythonOperator):
             retry=0,
             field_delimiter=',',
             quote_character=None,
+            source_format=None,
+            schema=None,
+            autodetect=False,
+            time_partitioning=None,
+            clustering_fields=None,
             *args,
             **kwargs):
         """GCSのファイルをBigQueryにロードするOperator
 
         Args:
-            source_cloud_storage_uris (str): 出力元GCSのURI
+            source_cloud_storage_uris (str or list(str)): 出力元GCSのURI。ワイルドカード、またはURIのリストも指定できる。
             destination_project_dataset_table (str): 出力先Bigqueryのジロジェクト、データセット、テーブルの文字列
             project_id (str): プロジェクトID。Defaults to None.
             location (str): 出力元BigQueryのデータセットのロケーション。Noneの場合、東京リージョン。 Defaults to None.
             skip_leading_rows (int): スキップ行数。 Defaults to 1.
             write_disposition (google.cloud.bigquery.job.WriteDisposition): テーブルの書き込みオプション。
                               Noneの場合、WRITE_EMPTY。 Defaults to None.
-            retry (int): リトライ回数。 Defaults to 0.
-            quote_character (str): 区切り文字。Noneの場合、ダブルクォーテーション。 Defaults to None.
+            retry (int): 一時的なエラーの場合のリトライ回数。Noneの場合は3回。 Defaults to 0.
+            field_delimiter (str): ファイル区切り文字。CSVの場合のみ有効。 Defaults to ','.
+            quote_character (str): 区切り文字。Noneの場合、ダブルクォーテーション。CSVの場合のみ有効。 Defaults to None.
+            source_format (str): ファイル形式。'CSV'、'NEWLINE_DELIMITED_JSON'、'PARQUET'、'AVRO'、'ORC'のいずれか。
+                                 gzip圧縮したCSV、NEWLINE_DELIMITED_JSONはそのまま読み込める。Noneの場合、CSV。 Defaults to None.
+            schema (list(dict)): テーブルのスキーマ。BigQueryのJSONスキーマと同じ書式で指定する。 Defaults to None.
+            autodetect (bool): CSV、NEWLINE_DELIMITED_JSONのスキーマを自動検出するかどうか。 Defaults to False.
+            time_partitioning (str or dict): パーティション列名、または'field'、'type'、'expiration_ms'をキーに持つdict。
+                                             Defaults to None.
+            clustering_fields (list(str)): クラスタリング列名のリスト。 Defaults to None.
         """
         python_callable = bq_hook.bq_load
 
@@ -53,11 +66,17 @@ class BqLoadOperator(PythonOperator):
             'write_disposition': write_disposition,
             'retry': retry,
             'field_delimiter': field_delimiter,
-            'quote_character': quote_character
+            'quote_character': quote_character,
+            'source_format': source_format,
+            'schema': schema,
+            'autodetect': autodetect,
+            'time_partitioning': time_partitioning,
+            'clustering_fields': clustering_fields,
         }
 
         super(BqLoadOperator, self).__init__(python_callable=python_callable,
                                              op_kwargs=op_kwargs,
+                                             provide_context=True,
                                              *args,
                                              **kwargs)
                                              
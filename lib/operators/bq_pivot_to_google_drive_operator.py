@@ -25,6 +25,8 @@ class BqPivotToGoogleDriveOperator(PythonOperator):
             bq_max_return_records=500000,
             file_encoding='utf_8_sig',
             opt_google_drive_file_date_suffix=False,
+            use_bqstorage=False,
+            push_down=False,
             *args,
             **kwargs):
         """BigQueryのデータをピボットテーブルとしてGoogleドライブにファイル出力する。
@@ -46,6 +48,9 @@ class BqPivotToGoogleDriveOperator(PythonOperator):
             file_encoding (str, optional): 出力ファイルの文字コード(SHIFT_JIS,UTF8,UTF8SIGのみ). Defaults to 'utf_8_sig'.
             opt_google_drive_file_date_suffix(boolean, optional):Googleドライブに同名のファイルが既にあった場合、
                 作成日が当日であれば上書き、前日以前であれば作成日のサフィックスをつけて退避する。. Defaults to False.
+            use_bqstorage (bool, optional): Trueの場合、クエリの結果をBigQuery Storage Read APIで取得する。 Defaults to False.
+            push_down (bool, optional): Trueの場合、ピボットテーブルのキー毎の集計をBigQueryで行い、集計結果のみを取得する。
+                SQLは単一のSELECT文とすること。bq_max_return_recordsは集計後のレコード数に適用する。 Defaults to False.
 
         Example:
             インデックスとなる項目（GROUP BYされる項目）
@@ -83,6 +88,8 @@ class BqPivotToGoogleDriveOperator(PythonOperator):
             'bq_max_return_records': bq_max_return_records,
             'file_encoding': file_encoding,
             'opt_google_drive_file_date_suffix': opt_google_drive_file_date_suffix,
+            'use_bqstorage': use_bqstorage,
+            'push_down': push_down,
         }
 
         super(BqPivotToGoogleDriveOperator, self).__init__(python_callable=python_callable,
@@ -0,0 +1,70 @@
+"""複数のBigQueryのクエリを1タスクで同時に実行する。
+"""
+from airflow.models import Variable
+from airflow.operators.python_operator import PythonOperator
+from airflow.utils.decorators import apply_defaults
+
+from lib.hooks import bq_hook
+
+
+class BqQueryManyOperator(PythonOperator):
+
+    ui_color = '#B2DDFF'
+    @apply_defaults
+    def __init__(
+            self,
+            queries,
+            project_id=None,
+            location=None,
+            max_concurrency=None,
+            poll_interval=None,
+            retry=None,
+            *args,
+            **kwargs):
+        """複数のBigQueryのクエリを同時に実行するOperator
+        一部のクエリが失敗しても他のクエリは最後まで実行し、タスクは失敗とする。
+        全クエリの結果は、成功時はreturn_value、失敗時はキー「bq_query_many_result」でXCOMにpushする。
+
+        Args:
+            queries (list(dict)): 実行するクエリのリスト。以下のキーを持つdictで指定する。
+                                  name (str): 結果のキー。重複不可。省略した場合はリストのインデックス。
+                                  sql (str): SQLファイルのパス（必須）
+                                  destination (str): 保存先テーブル。書式はBqQueryOperatorと同じ。
+                                  query_parameters (dict): クエリパラメータ
+                                  write_disposition (str): 保存先テーブルの書き込み方法。省略した場合はWRITE_EMPTY。
+                                  maximum_bytes_billed (int): 課金バイト数の上限
+            project_id (str): BigQueryのジョブを実行するプロジェクト。Noneの場合はAirflowのプロジェクトIDを設定. Defaults to None.
+            location (str): BigQueryのジョブを実行するロケーション。指定がなければ asia-northeast1. Defaults to None.
+            max_concurrency (int): 同時に実行するジョブ数の上限。指定がなければ5. Defaults to None.
+            poll_interval (int): ジョブの状態を確認する間隔（秒）。指定がなければ5. Defaults to None.
+            retry (int): 一時的なエラーの場合のクエリ毎のリトライ回数。指定がなければ3. Defaults to None.
+
+        Example:
+            queries=[
+                {'name': 'order', 'sql': 'sample/sql/order.sql', 'destination': 'summary.order',
+                 'write_disposition': 'WRITE_TRUNCATE'},
+                {'name': 'job_offer', 'sql': 'sample/sql/job_offer.sql', 'destination': 'summary.job_offer',
+                 'write_disposition': 'WRITE_TRUNCATE'},
+            ]
+        """
+
+        python_callable = bq_hook.bq_query_many
+
+        # プロジェクトIDがNoneの場合はAirflowのプロジェクトIDを設定
+        if project_id is None:
+            project_id = Variable.get('project_id')
+
+        op_kwargs = {
+            'queries': queries,
+            'project_id': project_id,
+            'location': location,
+            'max_concurrency': max_concurrency,
+            'poll_interval': poll_interval,
+            'retry': retry,
+        }
+
+        super(BqQueryManyOperator, self).__init__(python_callable=python_callable,
+                                                  op_kwargs=op_kwargs,
+                                                  provide_context=True,
+                                                  *args,
+                                                  **kwargs)
@@ -23,6 +23,11 @@ class BqQueryOperator(PythonOperator):
             is_return_result=False,
             max_return_records=None,
             location=None,
+            estimate_cost=False,
+            maximum_bytes_billed=None,
+            merge_keys=None,
+            partition_window=None,
+            skip_if_unchanged=False,
             *args,
             **kwargs):
         """BigQueryのクエリを実行するOperator
@@ -39,17 +44,31 @@ class BqQueryOperator(PythonOperator):
             query_parameters (dict): クエリパラメータ。. Defaults to None.
                                      SQLファイルに、「@hoge」「@hoge2」のように変数を設定することで、パラメータを設定できる。
                                      {'hoge': 'value', 'hoge2', 'value2'}のようにdictでパラメータを設定する。
-                                     valueの部分は、str、int、floatのみ設定可能。これ以外の型の場合、
-                                     クエリパラメータには設定されず、無視される。
+                                     valueの型からクエリパラメータの型を決める。bool、int、float、Decimal、str、bytes、
+                                     date(DATE)、datetime(タイムゾーンなしはDATETIME、ありはTIMESTAMP)、time、list(ARRAY)、dict(STRUCT)を設定可能。
+                                     SQLファイル先頭に「-- @param hoge DATE」のように型ヒントを記載した場合は、その型とする。
+                                     これ以外の型の場合はValueError。型ヒントがなく値がNoneの場合は設定されない。
             xcom_parameters (dict): クエリパラメータ。. Defaults to None.
                                     「'task_id' : <タスクID>」と「'key' : <XCOMのキー>」のdist形式で指定で指定する。
                                     XCOMから値を取得してクエリパラメータに追加する。
                                     クエリパラメータに追加するキーは<XCOMのキー>とする。
             write_disposition (google.cloud.bigquery.job.WriteDisposition): 保存先テーブルの書き込み方法. Defaults to 'WRITE_EMPTY'.
-                                                                            'WRITE_EMPTY','WRITE_APPEND','WRITE_TRUNCATE'のいずれか。
+                                                                            'WRITE_EMPTY','WRITE_APPEND','WRITE_TRUNCATE','MERGE','REPLACE_PARTITIONS'のいずれか。
+                                                                            'MERGE'、'REPLACE_PARTITIONS'は保存先テーブルを差分更新する。
             is_return_result (bool): Trueの場合、クエリの結果をlistで返す。. Defaults to False.
             max_return_records (int): クエリの結果をlistで返す場合の最大レコード数。指定がなければ1000を設定する。
             location (str): BigQueryのジョブを実行するロケーション。指定がなければ asia-northeast1. Defaults to None.
+            estimate_cost (bool): Trueの場合、ジョブの実行前にdry runで処理バイト数の見積もりと参照テーブルを取得し、
+                                  XCOMのキー「bq_dry_run」にpushする。 Defaults to False.
+            maximum_bytes_billed (int): 課金バイト数の上限。見積もりが上限を超える場合はジョブを実行せずに失敗する。
+                                        DAG全体に設定する場合はdefault_argsに指定する。
+                                        Noneの場合、上限なし。 Defaults to None.
+            merge_keys (list(str)): write_dispositionが'MERGE'の場合のキー列名のリスト。 Defaults to None.
+            partition_window (tuple): 差分更新するパーティションの範囲。(開始, 終了)のtupleで指定する。
+                                      Noneの場合、クエリの結果に含まれるパーティションのみを更新する。 Defaults to None.
+            skip_if_unchanged (bool): Trueの場合、参照テーブル、SQL、クエリパラメータが前回の実行から変わっていなければ、
+                                      ジョブを実行しない。判定結果と理由はXCOMのキー「bq_skip_if_unchanged」にpushする。
+                                      destinationを指定した場合のみ有効。 Defaults to False.
         """
 
         python_callable = bq_hook.bq_query
@@ -68,6 +87,11 @@ class BqQueryOperator(PythonOperator):
             'is_return_result': is_return_result,
             'max_return_records': max_return_records,
             'location': location,
+            'estimate_cost': estimate_cost,
+            'maximum_bytes_billed': maximum_bytes_billed,
+            'merge_keys': merge_keys,
+            'partition_window': partition_window,
+            'skip_if_unchanged': skip_if_unchanged,
         }
 
         super(BqQueryOperator, self).__init__(python_callable=python_callable,
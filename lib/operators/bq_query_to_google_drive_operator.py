@@ -27,6 +27,7 @@ class BqQueryToGoogleDriveOperator(PythonOperator):
             upload_format='CSV',
             query_parameters=None,
             xcom_parameters=None,
+            use_bqstorage=False,
             local=False,
             *args,
             **kwargs):
@@ -50,16 +51,20 @@ class BqQueryToGoogleDriveOperator(PythonOperator):
                             None の場合、東京リージョン。 Defaults to None.
             upload_format (str): アップロードフォーマット（CSV, XLSX）。
                                  XLSXの場合file_encoding はSHIFT_JIS、file_newline はCRLF固定となる、file_name の拡張子には.xlsxを付けること。
+                                 XLSXの場合、1シートの最大行数（1048576行）を超えると新しいシートに出力する。
                                  Defaults to 'CSV'.
             query_parameters (dict): クエリパラメータ。. Defaults to None.
                                      SQLファイルに、「@hoge」「@hoge2」のように変数を設定することで、パラメータを設定できる。
                                      {'hoge': 'value', 'hoge2', 'value2'}のようにdictでパラメータを設定する。
-                                     valueの部分は、str、int、floatのみ設定可能。これ以外の型の場合、
-                                     クエリパラメータには設定されず、無視される。
+                                     valueの型からクエリパラメータの型を決める。bool、int、float、Decimal、str、bytes、
+                                     date(DATE)、datetime(タイムゾーンなしはDATETIME、ありはTIMESTAMP)、time、list(ARRAY)、dict(STRUCT)を設定可能。
+                                     SQLファイル先頭に「-- @param hoge DATE」のように型ヒントを記載した場合は、その型とする。
+                                     これ以外の型の場合はValueError。型ヒントがなく値がNoneの場合は設定されない。
             xcom_parameters (dict): クエリパラメータ。. Defaults to None.
                                     「'task_id' : <タスクID>」と「'key' : <XCOMのキー>」のdist形式で指定で指定する。
                                     XCOMから値を取得してクエリパラメータに追加する。
                                     クエリパラメータに追加するキーは<XCOMのキー>とする。
+            use_bqstorage (bool): Trueの場合、クエリの結果をBigQuery Storage Read APIで取得する。 Defaults to False.
             local (bool): ローカル環境で実行する場合はTrue. Defaults to False.
         """
 
@@ -84,6 +89,7 @@ class BqQueryToGoogleDriveOperator(PythonOperator):
             'upload_format': upload_format,
             'query_parameters': query_parameters,
             'xcom_parameters': xcom_parameters,
+            'use_bqstorage': use_bqstorage,
             'local': local
         }
 
@@ -21,6 +21,7 @@ class SalesforceReportToBigqueryOperator(PythonOperator):
             write_disposition='WRITE_TRUNCATE',
             location='asia-northeast1',
             allow_no_record=False,
+            gcs_archive=False,
             *args,
             **kwargs):
         """SFのレポートを取得し、BigQueryにロードするOperator
@@ -36,6 +37,7 @@ class SalesforceReportToBigqueryOperator(PythonOperator):
                                                                             'WRITE_EMPTY','WRITE_APPEND','WRITE_TRUNCATE'のいずれか。
             location (str): 出力元BigQueryのデータセットのロケーション。 Defaults to asis-northeast1.
             allow_no_record (bool, optional): SFレポートの結果が0件の場合、Trueなら何もせずに正常終了、Falseならエラー. Defaults to False.
+            gcs_archive (bool, optional): Trueの場合、ロードしたCSVファイルをGCSに保存する. Defaults to False.
         """
 
         python_callable = sfr.execute
@@ -53,6 +55,7 @@ class SalesforceReportToBigqueryOperator(PythonOperator):
             'write_disposition': write_disposition,
             'location': location,
             'allow_no_record': allow_no_record,
+            'gcs_archive': gcs_archive,
         }
 
         super(SalesforceReportToBigqueryOperator, self).__init__(python_callable=python_callable,
@@ -0,0 +1,195 @@
+"""BigQueryのジョブの統計情報を記録するモジュール
+
+lib.hooks.bq_hookから投入したジョブの統計情報（処理バイト数、スロット時間、キャッシュヒット、ステージ毎の時間等）を
+プロセス内のバッファに保持し、まとめてジョブを実行したプロジェクトのLEDGER_TABLE_IDにストリーミング挿入する。
+バッファはFLUSH_SIZE件、またはバッファへの追加からFLUSH_INTERVAL秒経過した時に書き込む。
+Airflowのタスクのプロセスはos._exitで終了しatexitが実行されないため、
+bq_hookはジョブの終了を待つ処理の最後にflushを呼ぶ。
+統計情報の記録に失敗してもタスクは失敗させない。
+テーブルの作成SQL、集計SQLは common/sql/bq/ 配下にある。
+"""
+import atexit
+import datetime
+import json
+import re
+import threading
+import time
+
+from lib.logger import logger
+
+# 統計情報を記録するテーブル（データセットID.テーブルID）。プロジェクトは書き込むクライアントのプロジェクトとする
+LEDGER_TABLE_ID = 'bq_job_ledger.job_statistics'
+# バッファの件数がこの値に達したら書き込む
+FLUSH_SIZE = 100
+# バッファへの最初の追加からこの秒数が経過したら書き込む
+FLUSH_INTERVAL = 60
+# ジョブのラベルの値の最大文字数
+LABEL_MAX_LENGTH = 63
+
+# 書き込み前の統計情報。（書き込みに使うBigQueryクライアント、テーブル、統計情報）のlist
+__buffer = []
+# バッファに最初に追加した時刻
+__buffered_at = None
+__lock = threading.Lock()
+
+
+def get_job_labels(context=None, sql_file=None):
+    """ジョブに設定するラベルを作成する。
+    ラベルの値は英小文字、数字、アンダースコア、ハイフンのみのため、それ以外の文字はアンダースコアに置き換える。
+
+    Args:
+        context (dict): Airflowのcontext。 Defaults to None.
+        sql_file (str): SQLファイルのパス。 Defaults to None.
+
+    Returns:
+        dict: ラベル
+    """
+    labels = {}
+    ti = context.get('ti') if context else None
+    if ti is not None:
+        labels['dag_id'] = __to_label_value(ti.dag_id)
+        labels['task_id'] = __to_label_value(ti.task_id)
+    if sql_file is not None:
+        labels['sql_file'] = __to_label_value(sql_file.split('/')[-1])
+    return labels
+
+
+def __to_label_value(value):
+    return re.sub(r'[^a-z0-9_-]', '_', str(value).lower())[:LABEL_MAX_LENGTH]
+
+
+def get_ledger_table(project_id):
+    """統計情報を記録するテーブルを取得する。
+
+    Args:
+        project_id (str): プロジェクトID
+
+    Returns:
+        str: 「プロジェクトID.データセットID.テーブルID」
+    """
+    return '{}.{}'.format(project_id, LEDGER_TABLE_ID)
+
+
+def record(client, job, context=None, sql_file=None, table=None):
+    """終了したジョブの統計情報をバッファに追加する。
+
+    Args:
+        client (bigquery.Client): 書き込みに使うBigQueryクライアント
+        job: 終了したジョブ（QueryJob、LoadJob、ExtractJob）
+        context (dict): Airflowのcontext。 Defaults to None.
+        sql_file (str): SQLファイルのパス。 Defaults to None.
+        table (str): 記録するテーブル。「プロジェクトID.データセットID.テーブルID」の形式。
+                     Noneの場合、clientのプロジェクトのLEDGER_TABLE_ID。 Defaults to None.
+    """
+    global __buffered_at
+    if table is None:
+        table = get_ledger_table(client.project)
+    try:
+        row = get_job_statistics(job, context=context, sql_file=sql_file)
+    except Exception as e:
+        logger.warn('ジョブの統計情報を取得できませんでした。ジョブID: {} 詳細({})'.format(job.job_id, e))
+        return
+
+    with __lock:
+        if not __buffer:
+            __buffered_at = time.time()
+        __buffer.append((client, table, row))
+        is_flush = len(__buffer) >= FLUSH_SIZE or time.time() - __buffered_at >= FLUSH_INTERVAL
+    if is_flush:
+        flush()
+
+
+def flush():
+    """バッファの統計情報をテーブルに書き込む。
+    """
+    global __buffer, __buffered_at
+    with __lock:
+        entries, __buffer = __buffer, []
+        __buffered_at = None
+
+    # テーブル毎にまとめて書き込む
+    clients = {}
+    rows_by_table = {}
+    for client, table, row in entries:
+        clients.setdefault(table, client)
+        rows_by_table.setdefault(table, []).append(row)
+    for table, rows in rows_by_table.items():
+        try:
+            errors = clients[table].insert_rows_json(table, rows)
+            if errors:
+                logger.warn('ジョブの統計情報の一部を記録できませんでした。詳細({})'.format(errors))
+        except Exception as e:
+            logger.warn('ジョブの統計情報を記録できませんでした。{}件 詳細({})'.format(len(rows), e))
+
+
+def get_job_statistics(job, context=None, sql_file=None):
+    """終了したジョブの統計情報を、統計情報を記録するテーブルの1行として取得する。
+
+    Args:
+        job: 終了したジョブ（QueryJob、LoadJob、ExtractJob）
+        context (dict): Airflowのcontext。 Defaults to None.
+        sql_file (str): SQLファイルのパス。 Defaults to None.
+
+    Returns:
+        dict: 統計情報
+    """
+    ti = context.get('ti') if context else None
+    statistics = job._properties.get('statistics', {})
+    row = {
+        'job_id': job.job_id,
+        'job_type': job.job_type,
+        'project_id': job.project,
+        'location': job.location,
+        'state': 'FAILED' if job.error_result else job.state,
+        'error': job.error_result.get('message') if job.error_result else None,
+        'dag_id': ti.dag_id if ti is not None else None,
+        'task_id': ti.task_id if ti is not None else None,
+        'execution_date': ti.execution_date.isoformat() if ti is not None else None,
+        'sql_file': sql_file,
+        'creation_time': __to_iso(job.created),
+        'start_time': __to_iso(job.started),
+        'end_time': __to_iso(job.ended),
+        'elapsed_ms': __get_elapsed_ms(job.started, job.ended),
+        'total_bytes_processed': None,
+        'total_bytes_billed': None,
+        'slot_ms': int(statistics['totalSlotMs']) if 'totalSlotMs' in statistics else None,
+        'cache_hit': None,
+        'rows_written': None,
+        'stages': None,
+        'recorded_at': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+    }
+
+    if job.job_type == 'query':
+        query_plan = job.query_plan
+        row['total_bytes_processed'] = job.total_bytes_processed
+        row['total_bytes_billed'] = job.total_bytes_billed
+        row['cache_hit'] = job.cache_hit
+        # DMLの場合は更新行数、それ以外は最終ステージの出力行数
+        if job.num_dml_affected_rows is not None:
+            row['rows_written'] = job.num_dml_affected_rows
+        elif query_plan:
+            row['rows_written'] = query_plan[-1].records_written
+        row['stages'] = json.dumps([{
+            'name': stage.name,
+            'elapsed_ms': __get_elapsed_ms(stage.start, stage.end),
+            'slot_ms': stage.slot_ms,
+            'records_read': stage.records_read,
+            'records_written': stage.records_written,
+        } for stage in query_plan])
+    elif job.job_type == 'load':
+        row['rows_written'] = job.output_rows
+    return row
+
+
+def __to_iso(value):
+    return value.isoformat() if value is not None else None
+
+
+def __get_elapsed_ms(start, end):
+    if start is None or end is None:
+        return None
+    return int((end - start).total_seconds() * 1000)
+
+
+# Airflow以外のプロセス終了時にバッファの残りを書き込む
+atexit.register(flush)
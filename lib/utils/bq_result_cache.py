@@ -0,0 +1,215 @@
+"""BigQueryのクエリ結果をParquetファイルとしてキャッシュするモジュール
+
+キャッシュのキーは呼び出し元（lib.hooks.bq_hook）で、
+正規化したSQL、型付きクエリパラメータ、参照テーブルの最終更新日時から作成する。
+ローカルディスクをキャッシュ先とし、GCSのバケットを指定した場合はGCSにも保存して
+ワーカー間で共有する。
+ローカルディスクのキャッシュは合計バイト数の上限を超えると、最終参照日時が古いものから削除する。
+GCS上のキャッシュは削除しないため、バケットのライフサイクルルールで削除すること。
+"""
+import fcntl
+import json
+import os
+import time
+
+import pyarrow.parquet as pq
+
+from lib.logger import logger
+from lib.utils.cloud_storage import CloudStorageClient
+
+# ローカルのキャッシュディレクトリ
+DEFAULT_CACHE_DIR = '/var/tmp/bq_result_cache'
+# ローカルのキャッシュの合計バイト数の上限
+DEFAULT_MAX_BYTES = 2 * 1024 * 1024 * 1024
+# GCS上のキャッシュの保存先フォルダ
+DEFAULT_GCS_PREFIX = 'bq_result_cache'
+# キャッシュの管理情報ファイル
+INDEX_FILE_NAME = 'index.json'
+# キャッシュファイルの拡張子
+CACHE_FILE_EXTENSION = '.parquet'
+
+
+class BqResultCache:
+
+    def __init__(self,
+                 cache_dir=DEFAULT_CACHE_DIR,
+                 max_bytes=DEFAULT_MAX_BYTES,
+                 gcs_bucket_name=None,
+                 gcs_prefix=DEFAULT_GCS_PREFIX,
+                 project_id=None,
+                 local=False):
+        """BigQueryのクエリ結果のキャッシュ
+
+        Args:
+            cache_dir (str): ローカルのキャッシュディレクトリ。 Defaults to DEFAULT_CACHE_DIR.
+            max_bytes (int): ローカルのキャッシュの合計バイト数の上限。 Defaults to DEFAULT_MAX_BYTES.
+            gcs_bucket_name (str): キャッシュを保存するGCSのバケット名。gs://hogehoge
+                                   Noneの場合、GCSには保存しない。 Defaults to None.
+            gcs_prefix (str): GCS上のキャッシュの保存先フォルダ。 Defaults to DEFAULT_GCS_PREFIX.
+            project_id (str): GCSのプロジェクトID。 Defaults to None.
+            local (bool): ローカル開発環境かどうか。 Defaults to False.
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.gcs_bucket_name = gcs_bucket_name
+        self.gcs_prefix = gcs_prefix
+        self.project_id = project_id
+        self.local = local
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def get(self, key):
+        """キャッシュを取得する。
+        ローカルにない場合、GCSのバケットが指定されていればGCSから取得する。
+
+        Args:
+            key (str): キャッシュのキー
+
+        Returns:
+            pyarrow.Table: キャッシュがない場合はNone
+        """
+        local_file = self.__get_local_file(key)
+        with self.__lock_index() as index:
+            if key in index['entries'] and os.path.exists(local_file):
+                index['entries'][key]['last_access'] = time.time()
+                index['hits'] += 1
+                self.hits += 1
+                logger.info('クエリ結果のキャッシュを利用します。キー: {}'.format(key))
+                return pq.read_table(local_file)
+
+        if self.gcs_bucket_name is not None and self.__download_from_gcs(key, local_file):
+            with self.__lock_index() as index:
+                self.__add_entry(index, key, local_file)
+                index['hits'] += 1
+                self.hits += 1
+            logger.info('GCS上のクエリ結果のキャッシュを利用します。キー: {}'.format(key))
+            return pq.read_table(local_file)
+
+        with self.__lock_index() as index:
+            index['misses'] += 1
+            self.misses += 1
+        return None
+
+    def put(self, key, table):
+        """キャッシュを保存する。
+
+        Args:
+            key (str): キャッシュのキー
+            table (pyarrow.Table): クエリ結果
+        """
+        local_file = self.__get_local_file(key)
+        tmp_file = '{}.{}.tmp'.format(local_file, os.getpid())
+        pq.write_table(table, tmp_file)
+        os.replace(tmp_file, local_file)
+
+        with self.__lock_index() as index:
+            self.__add_entry(index, key, local_file)
+            self.__evict(index)
+
+        if self.gcs_bucket_name is not None:
+            try:
+                gcs = CloudStorageClient(project_id=self.project_id, local=self.local)
+                gcs.upload(self.gcs_bucket_name, local_file, self.__get_gcs_file(key))
+            except Exception as e:
+                # GCSへの保存に失敗してもクエリ結果は返せるため、エラーとしない
+                logger.warn('クエリ結果のキャッシュをGCSに保存できませんでした。詳細({})'.format(e))
+
+    def stats(self):
+        """キャッシュのヒット数、ミス数、合計バイト数を取得する。
+
+        Returns:
+            dict: このインスタンスのヒット数、ミス数と、ローカルのキャッシュ全体の累計
+        """
+        with self.__lock_index() as index:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'total_hits': index['hits'],
+                'total_misses': index['misses'],
+                'total_bytes': sum(e['size'] for e in index['entries'].values()),
+            }
+
+    def __get_local_file(self, key):
+        return '{}/{}{}'.format(self.cache_dir, key, CACHE_FILE_EXTENSION)
+
+    def __get_gcs_file(self, key):
+        return '{}/{}{}'.format(self.gcs_prefix, key, CACHE_FILE_EXTENSION)
+
+    def __download_from_gcs(self, key, local_file):
+        """GCS上のキャッシュをローカルにダウンロードする。
+
+        Returns:
+            bool: ダウンロードできた場合はTrue
+        """
+        try:
+            gcs = CloudStorageClient(project_id=self.project_id, local=self.local)
+            if not gcs.exists(self.gcs_bucket_name, self.__get_gcs_file(key)):
+                return False
+            tmp_file = '{}.{}.tmp'.format(local_file, os.getpid())
+            gcs.download(self.gcs_bucket_name, self.__get_gcs_file(key), tmp_file)
+            os.replace(tmp_file, local_file)
+            return True
+        except Exception as e:
+            logger.warn('GCS上のクエリ結果のキャッシュを取得できませんでした。詳細({})'.format(e))
+            return False
+
+    def __add_entry(self, index, key, local_file):
+        index['entries'][key] = {
+            'size': os.path.getsize(local_file),
+            'last_access': time.time(),
+        }
+
+    def __evict(self, index):
+        """最終参照日時が古い順に、合計バイト数が上限以下になるまでキャッシュを削除する。
+
+        Args:
+            index (dict): キャッシュの管理情報
+        """
+        entries = index['entries']
+        total_bytes = sum(e['size'] for e in entries.values())
+        for key in sorted(entries, key=lambda k: entries[k]['last_access']):
+            if total_bytes <= self.max_bytes:
+                break
+            total_bytes -= entries[key]['size']
+            del entries[key]
+            try:
+                os.remove(self.__get_local_file(key))
+            except FileNotFoundError:
+                pass
+            logger.info('クエリ結果のキャッシュを削除しました。キー: {}'.format(key))
+
+    def __lock_index(self):
+        return _IndexLock('{}/{}'.format(self.cache_dir, INDEX_FILE_NAME))
+
+
+class _IndexLock:
+    """キャッシュの管理情報ファイルを排他ロックして読み書きするコンテキストマネージャ
+    同じワーカー上の複数プロセスから同時に更新されるため、ファイルロックで排他制御する。
+    """
+
+    def __init__(self, index_file):
+        self.index_file = index_file
+        self.lock_file = None
+        self.index = None
+
+    def __enter__(self):
+        self.lock_file = open('{}.lock'.format(self.index_file), 'w')
+        fcntl.flock(self.lock_file, fcntl.LOCK_EX)
+        try:
+            with open(self.index_file, encoding='UTF-8') as f:
+                self.index = json.load(f)
+        except (FileNotFoundError, ValueError):
+            self.index = {'hits': 0, 'misses': 0, 'entries': {}}
+        return self.index
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            if exc_type is None:
+                tmp_file = '{}.tmp'.format(self.index_file)
+                with open(tmp_file, 'w', encoding='UTF-8') as f:
+                    json.dump(self.index, f)
+                os.replace(tmp_file, self.index_file)
+        finally:
+            fcntl.flock(self.lock_file, fcntl.LOCK_UN)
+            self.lock_file.close()
@@ -8,7 +8,7 @@ from google.cloud import bigquery
 from google.oauth2.service_account import Credentials
 import pandas as pd
 
-from lib.utils import datetime_util, cloud_storage
+from lib.utils import datetime_util
 
 
 class CloudIamManager:
@@ -139,20 +139,19 @@ class CloudIamManager:
                 return_list.append(dic)
         return return_list
 
-    def bq_load(self, uri, table_id):
-        """BigQueryにdictのlistをロードする
+    def bq_load(self, local_file, table_id):
+        """BigQueryにローカルのCSVファイルを、GCSを経由せずにロードする
 
         Args:
-            dict_list (list(dict)): ロードするデータ。
+            local_file (str): ロードするCSVファイルのパス。
             table_id (str): ロード先BigQueryのテーブルID。作成済み、取り込み時間分割テーブルであること。
         """
-
-        # configの作成 関数が存在しない。
-        print(uri)
-        job = self.common_bq_client.load_table_from_uri(source_uris=uri,
-                                                        destination='iam.{}${}'.format(table_id,
-                                                                                 self.partitiontime),
-                                                        job_config=self.bq_config)
+        print(local_file)
+        with open(local_file, 'rb') as f:
+            job = self.common_bq_client.load_table_from_file(f,
+                                                             destination='iam.{}${}'.format(table_id,
+                                                                                      self.partitiontime),
+                                                             job_config=self.bq_config)
         job.result()
         print('ロードジョブ結果：{}'.format(job.state))
 
@@ -185,11 +184,5 @@ def load_iam(table_id):
     df = pd.DataFrame(record)
     df.to_csv(local_file, columns=record[0].keys(), index=False)
 
-    # # GCSにアップロード
-    backet = 'gs://common-jinzaisystem-tool-bq-load'
-    gcs_file_name = '{}_{}.json'.format(table_id, manager.partitiontime)
-    gcs = cloud_storage.CloudStorageClient(project_id='common-jinzaisystem-tool')
-    gcs.upload(backet, local_file, gcs_file_name)
-
     # # BigQueryにロード
-    manager.bq_load('{}/{}'.format(backet, gcs_file_name), table_id)
+    manager.bq_load(local_file, table_id)
@@ -1,4 +1,5 @@
 import time
+from concurrent.futures import ThreadPoolExecutor
 from google.cloud import storage, exceptions
 from google.oauth2 import service_account
 from lib.errors import exception
@@ -11,6 +12,10 @@ AIRFLOW_DAGS_DIR = '/home/airflow/gcs/dags'
 LOCK_FILE_EXTENSION = '.lock'
 # 排他ロックの取得を試行する間隔（秒）
 LOCK_GET_INTERVAL = 5
+# 並列ダウンロードで1リクエストで取得するバイト数
+DOWNLOAD_CHUNK_SIZE = 64 * 1024 * 1024
+# 並列ダウンロードの同時リクエスト数
+DOWNLOAD_MAX_WORKERS = 8
 
 
 class CloudStorageClient:
@@ -74,6 +79,64 @@ class CloudStorageClient:
         blob = storage.Blob(file_name, bucket)
         blob.download_to_filename(local_download_filepath)
 
+    def download_parallel(self,
+                          bucket_name,
+                          file_names,
+                          local_download_filepaths,
+                          chunk_size=DOWNLOAD_CHUNK_SIZE,
+                          max_workers=DOWNLOAD_MAX_WORKERS):
+        """GCSの複数のファイルを、chunk_size毎の範囲リクエストに分割して並列にダウンロードする。
+        各範囲はローカルファイルの同じ位置に書き込むため、ダウンロード後の結合は不要。
+
+        Args:
+            bucket_name (str): バケット名。gs://hogehoge
+            file_names (list(str)): GCS上のファイル名のリスト
+            local_download_filepaths (list(str)): ローカルのファイルパスのリスト。file_namesと同じ順序で指定する。
+            chunk_size (int): 1リクエストで取得するバイト数。 Defaults to DOWNLOAD_CHUNK_SIZE.
+            max_workers (int): 同時リクエスト数。 Defaults to DOWNLOAD_MAX_WORKERS.
+        Raises:
+            ValueError: file_namesとlocal_download_filepathsの件数が異なる
+            google.cloud.exceptions.NotFound: 指定ファイルが見つからなかった
+        """
+        if len(file_names) != len(local_download_filepaths):
+            raise ValueError('file_namesとlocal_download_filepathsの件数が異なります。')
+
+        bucket = self.client.get_bucket(bucket_name.replace('gs://', ''))
+        ranges = []
+        for file_name, local_file in zip(file_names, local_download_filepaths):
+            blob = bucket.get_blob(file_name)
+            if blob is None:
+                raise exceptions.NotFound('ファイルが見つかりません。ファイル名={}'.format(file_name))
+            # 書き込み先のファイルを先に作成し、各範囲をその位置に書き込む
+            with open(local_file, 'wb') as f:
+                f.truncate(blob.size)
+            for start in range(0, blob.size, chunk_size):
+                ranges.append((blob, local_file, start, min(start + chunk_size, blob.size) - 1))
+
+        def download_range(blob, local_file, start, end):
+            with open(local_file, 'r+b') as f:
+                f.seek(start)
+                blob.download_to_file(f, start=start, end=end)
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(download_range, *r) for r in ranges]
+            for future in futures:
+                future.result()
+
+    def list_files(self,
+                   bucket_name,
+                   prefix):
+        """指定したプレフィックスで始まるGCSのファイル名を、名前順に取得する。
+
+        Args:
+            bucket_name (str): バケット名。gs://hogehoge
+            prefix (str): GCS上のファイル名のプレフィックス
+        Returns:
+            list(str): GCS上のファイル名のリスト
+        """
+        bucket = self.client.get_bucket(bucket_name.replace('gs://', ''))
+        return sorted(blob.name for blob in bucket.list_blobs(prefix=prefix))
+
     def upload(self,
                bucket_name,
                local_upload_filepath,
@@ -127,16 +190,18 @@ class CloudStorageClient:
     def get_file_lock(self,
                       bucket_name,
                       file_full_name,
-                      local_work_path,
+                      local_work_path=None,
                       time_up_sec=0):
         """指定ファイルに対する排他ロックを取得する（取得できるまで待ち続ける）。
+           ロックファイルはGCS上に存在しない場合のみ作成する（if_generation_match=0）ため、
+           複数のプロセスが同時に取得しようとしても、ロックを取得できるのは1つのプロセスのみとなる。
            ロックする期間はできるだけ短い実装を心掛けること。
            ※取得した排他ロックはrelease_file_lock()をコールしてプロセス終了前に必ず解除してください。
 
         Args:
             bucket_name (str): バケット名。gs://hogehoge
             file_full_name (str): 排他ロックを取得したいファイル名（バケット下のフォルダ名も含む）AUTO/fuga.txt
-            local_work_path (str): 作業用のローカルフォルダ（末尾に'/'まで含むこと）
+            local_work_path (str): 未使用。互換性のために残している。 Defaults to None.
             time_up_sec (int): 取得を諦める目安秒数（0以下の場合は無限に待ち続ける）
         Raises:
             lib.errors.exception.GcsFileLockException: 指定時間内に排他ロックの取得に失敗
@@ -149,35 +214,22 @@ class CloudStorageClient:
         # 現在のリトライ回数
         retry_count = 0
 
-        # 排他ロック用のファイル名
-        file_name = file_full_name
-        file_name_list = file_full_name.split('/')
-        if len(file_name_list) > 1:
-            file_name = file_name_list[len(file_name_list) - 1]
-
-        # ローカルの排他ロック用ファイル
-        local_lock_file = local_work_path + file_name + LOCK_FILE_EXTENSION
         # GCSの排他ロック用ファイル
         gcs_lock_file = file_full_name + LOCK_FILE_EXTENSION
         # 排他ロックが取得できるまで繰り返す
         while True:
             try:
-                # 排他制御用ロックファイルをダウンロード
-                self.download(bucket_name, gcs_lock_file, local_lock_file)
-            except Exception:
-                print('排他制御用ロックファイルが見つからなかった。')
-                try:
-                    # ローカルにロックファイルを作成
-                    with open(local_lock_file, "w"):
-                        pass
-                    # ロックファイルをGCSへアップロード
-                    self.upload(bucket_name, local_lock_file, gcs_lock_file)
-                except Exception:
-                    # ロックファイルのアップロードに失敗したので抜けない
-                    print('ロックファイルのアップロードに失敗。retry_count={}'.format(retry_count))
-                else:
-                    # 排他ロックが取得できたので抜ける
-                    break
+                # ロックファイルが存在しない場合のみ作成する
+                bucket = self.client.get_bucket(bucket_name.replace('gs://', ''))
+                bucket.blob(gcs_lock_file).upload_from_string('', if_generation_match=0)
+            except exceptions.PreconditionFailed:
+                print('排他ロックは他のプロセスが取得しています。retry_count={}'.format(retry_count))
+            except Exception as e:
+                # ロックファイルのアップロードに失敗したので抜けない
+                print('ロックファイルのアップロードに失敗。retry_count={} 詳細({})'.format(retry_count, e))
+            else:
+                # 排他ロックが取得できたので抜ける
+                break
             # リトライ回数を加算
             retry_count += 1
             if retry_max != 0 and retry_count > retry_max:
@@ -43,3 +43,33 @@ def encode_file(from_file_path,
                 # 出力ファイルがUTF-8の場合
                 for row in from_file:
                     to_file.write(row)
+
+
+def merge_files(from_file_paths,
+                to_file_path,
+                skip_header=False,
+                from_file_encoding=ENCODING_UTF_8,
+                to_file_encoding=ENCODING_SHIFT_JIS,
+                to_file_newline=NEWLINE_WINDOWS,
+                encoding_error_option=ENCODING_ERROR_REPLACE):
+    """複数のファイルを順に結合し、文字コード、改行コードを変換して1ファイルに出力する。
+    変換はencode_fileと同じで、結合と同時に行うため、ファイルの読み書きは1回で済む。
+
+    Args:
+        from_file_paths (list(str)): 結合前ファイルパスのリスト。この順序で結合する。
+        to_file_path (str): 結合後ファイルパス
+        skip_header (bool): Trueの場合、2ファイル目以降の1行目（ヘッダ）を出力しない。 Defaults to False.
+        from_file_encoding (str): 結合前ファイルの文字コード Defaults to ENCODING_UTF_8.
+        to_file_encoding (str): 結合後ファイルの文字コード Defaults to ENCODING_SHIFT_JIS.
+        to_file_newline (str): 結合後ファイルの改行コード. Defaults to NEWLINE_WINDOWS.
+        encoding_error_option (str): エンコードエラー発生時、"ignore"指定で無視、
+                                     "replace"指定で「?」に置換する。 Defaults to ENCODING_ERROR_REPLACE.
+    """
+    with open(to_file_path, 'w', encoding=to_file_encoding, errors=encoding_error_option,
+              newline=to_file_newline) as to_file:
+        for i, from_file_path in enumerate(from_file_paths):
+            with open(from_file_path, 'r', encoding=from_file_encoding, newline='') as from_file:
+                if skip_header and i > 0:
+                    next(from_file, None)
+                for row in from_file:
+                    to_file.write(row)
@@ -4,15 +4,92 @@ lib.utils.pydrive_bug_fixにライブラリを書き換えたモジュールを
 
 GoogleAPIのクレデンシャルファイルは、ローカルで実行するときは、以下のファイル名とする。
 config/google_drive.json
+
+認証済みのGoogleDriveオブジェクトはクレデンシャルファイルごとにプロセス内で共有し、
+GoogleDriveClientを何度作成しても、クレデンシャルファイルの読み込み、認証は最初の1回のみ行う。
+アクセストークンの期限切れ時の更新も1スレッドのみが行い、他のスレッドは更新後のトークンを使う。
+HTTPの接続はスレッドごとに作成するため、複数のスレッドから同時に利用できる。
 """
 import re
+import threading
+import time
 
 from airflow.models import Variable
 from googleapiclient.errors import HttpError
 
-from lib.utils.pydrive_bug_fix.auth import GoogleAuth
+from lib.utils.pydrive_bug_fix.auth import GoogleAuth, RefreshError
 from lib.utils.pydrive_bug_fix.drive import GoogleDrive
-from lib.utils.pydrive_bug_fix.files import FileNotDownloadableError
+from lib.logger import logger
+from lib.utils.pydrive_bug_fix.files import (DEFAULT_UPLOAD_CHUNK_SIZE,
+                                             ApiRequestError,
+                                             FileNotDownloadableError)
+
+# 1回のバッチリクエストにまとめる操作の最大数（Drive APIの上限は100）
+BATCH_SIZE = 100
+# バッチリクエストで失敗した操作の再送回数
+BATCH_RETRY_COUNT = 3
+# バッチリクエストの再送間隔（秒）。再送ごとに2倍にする
+BATCH_RETRY_INTERVAL = 2
+# 再送するHTTPステータス
+BATCH_RETRY_STATUSES = (429, 500, 502, 503, 504)
+# 再送するHTTPステータス403のエラー理由
+BATCH_RETRY_REASONS = ('rateLimitExceeded', 'userRateLimitExceeded')
+
+# 認証済みのGoogleDriveオブジェクト。キーはクレデンシャルファイル
+_drive_pool = {}
+_drive_pool_lock = threading.Lock()
+
+
+def get_shared_drive(credentials_file):
+    """クレデンシャルファイルの認証済みGoogleDriveオブジェクトを取得する。
+    プロセス内で未作成の場合のみ作成し、アクセストークンが期限切れの場合は更新する。
+
+    Args:
+        credentials_file (str): GoogleAPIのクレデンシャルファイル
+
+    Raises:
+        RefreshError: アクセストークンの更新に失敗した
+
+    Returns:
+        GoogleDrive: GoogleDriveオブジェクト
+    """
+    with _drive_pool_lock:
+        drive = _drive_pool.get(credentials_file)
+        if drive is None:
+            gauth = GoogleAuth()
+            gauth.LoadCredentialsFile(credentials_file)
+            if gauth.credentials is None:
+                # 認証済みファイルがない場合
+                gauth.CommandLineAuth()
+                # 認証情報をローカルに保存
+                gauth.SaveCredentialsFile(credentials_file)
+            # 認証情報が期限切れの場合は更新して保存
+            gauth.RefreshIfExpired(credentials_file)
+            gauth.Authorize()
+            drive = GoogleDrive(gauth)
+            _drive_pool[credentials_file] = drive
+            return drive
+
+    try:
+        drive.auth.RefreshIfExpired(credentials_file)
+    except RefreshError:
+        # 次回の呼び出しでクレデンシャルファイルから認証し直すため、共有を解除する
+        clear_shared_drive(credentials_file)
+        raise
+    return drive
+
+
+def clear_shared_drive(credentials_file=None):
+    """共有しているGoogleDriveオブジェクトを破棄する。
+
+    Args:
+        credentials_file (str): 破棄するクレデンシャルファイル。Noneの場合は全て破棄する。 Defaults to None.
+    """
+    with _drive_pool_lock:
+        if credentials_file is None:
+            _drive_pool.clear()
+        else:
+            _drive_pool.pop(credentials_file, None)
 
 
 class GoogleDriveClient:
@@ -32,7 +109,7 @@ class GoogleDriveClient:
             self.includeTeamDriveItems = False
 
     def __get_drive_instance(self):
-        """認証処理
+        """認証処理。認証済みのGoogleDriveオブジェクトはプロセス内で共有する。
 
         Returns:
             GoogleDrive: GoogleDriveオブジェクト
@@ -41,22 +118,7 @@ class GoogleDriveClient:
             GOOGLE_API_CREDENTIALS_FILE = 'config/google_drive.json'
         else:
             GOOGLE_API_CREDENTIALS_FILE = Variable.get('google_drive_api_credentials_file')
-        gauth = GoogleAuth()
-        gauth.LoadCredentialsFile(GOOGLE_API_CREDENTIALS_FILE)
-        if gauth.credentials is None or gauth.access_token_expired:
-            if gauth.credentials is None:
-                # 認証済みファイルがない場合
-                gauth.CommandLineAuth()
-            elif gauth.access_token_expired:
-                # 認証情報が期限切れの場合
-                gauth.Refresh()
-            # 認証情報をローカルに保存
-            gauth.SaveCredentialsFile(GOOGLE_API_CREDENTIALS_FILE)
-        else:
-            # 認証情報が再利用可能な場合
-            gauth.Authorize()
-        drive = GoogleDrive(gauth)
-        return drive
+        return get_shared_drive(GOOGLE_API_CREDENTIALS_FILE)
 
     def __get_file_list(self,
                         folder_id,
@@ -94,7 +156,7 @@ class GoogleDriveClient:
             'q': '"{}" in parents and trashed=false and title {} "{}"'.format(
                 folder_id,
                 qp,
-                file_name),
+                file_name.replace('\\', '\\\\').replace('"', '\\"')),
             'corpus': 'DEFAULT',
             'supportsTeamDrives': self.supportsTeamDrives,
             'includeTeamDriveItems': self.includeTeamDriveItems,
@@ -114,6 +176,46 @@ class GoogleDriveClient:
                 folder_id))
         return file_list
 
+    def find_files(self,
+                   folder_id,
+                   file_name,
+                   max_number_of_file=30,
+                   query_operator='equals'):
+        """Googleドライブの指定フォルダID内にあるファイルのメタデータを取得する。ファイルはダウンロードしない。
+
+        Args:
+            folder_id (str): GoogleドライブのフォルダID
+            file_name (str): Googleドライブのファイル名
+            max_number_of_file (int): 最大取得ファイル数. Defaults to 30.
+            query_operator (str, optional): 部分一致か完全一致か。以下の値のいずれか。. Defaults to 'equals'.
+                contains: 部分一致。The content of one string is present in the other.
+                equals: 完全一致。The content of a string or boolean is equal to the other.
+
+        Raises:
+            ValueError: 引数のフォルダIDが誤っている
+            googleapiclient.errors import HttpError: その他HTTP Error
+
+        Returns:
+            list: Googleドライブファイルリスト。ファイルが存在しない場合は空のリスト。
+        """
+        try:
+            return self.__get_file_list(folder_id, file_name, max_number_of_file, query_operator)
+        except FileNotFoundError:
+            return []
+
+    def rename_file(self,
+                    file_id,
+                    new_file_name):
+        """ファイル名を変更する。メタデータのみを更新するため、ファイルの内容は転送しない。
+
+        Args:
+            file_id (str): GoogleドライブのファイルID
+            new_file_name (str): 変更後のファイル名
+        """
+        f = self.drive.CreateFile({'id': file_id})
+        f['title'] = new_file_name
+        f.Upload(param={'supportsTeamDrives': True})
+
     def download_files(self, folder_id,
                        file_name,
                        output_file_dir,
@@ -183,16 +285,13 @@ class GoogleDriveClient:
         for target_file in file_list:
             print(target_file['id'])
             print(target_file['title'])
-            # Googleドライブのファイルを移動
-            f = self.drive.CreateFile({'id': target_file['id'],
-                                       'parents': [{'id': from_folder_id}]})
-
-            f.FetchMetadata()
-            f['parents'] = [{'id': to_folder_id}]
-            try:
-                f.Upload(param={'supportsTeamDrives': self.supportsTeamDrives})
-            except Exception as e:
-                raise ValueError('移動先のフォルダIDが不正です。フォルダID:{} 詳細({})'.format(to_folder_id, e))
+        # Googleドライブのファイルをバッチリクエストでまとめて移動
+        results = self.batch_move_files([target_file['id'] for target_file in file_list],
+                                        from_folder_id,
+                                        to_folder_id)
+        errors = {file_id: result['error'] for file_id, result in results.items() if result['error'] is not None}
+        if errors:
+            raise ValueError('移動先のフォルダIDが不正です。フォルダID:{} 詳細({})'.format(to_folder_id, errors))
 
     def move_file(self,
                   file_id,
@@ -222,20 +321,74 @@ class GoogleDriveClient:
     def upload_file(self,
                     local_file_path,
                     folder_id,
-                    upload_file_name):
+                    upload_file_name,
+                    chunksize=DEFAULT_UPLOAD_CHUNK_SIZE,
+                    callback=None,
+                    checkpoint=None):
         """ローカルのファイルをGoogleドライブにアップロードする。
+        チャンクごとに送信するレジューム可能なアップロードとし、
+        checkpointを指定した場合はセッションURIを保存して、失敗後の再実行では受信済みの位置から再開する。
 
         Args:
             local_file_path (str): ローカルのファイルパス
             folder_id (str): Googleドライブのアップロード先のフォルダID
             upload_file_name (str): アップロードファイル名
+            chunksize (int): 1リクエストで送信するバイト数。256KBの倍数。 Defaults to DEFAULT_UPLOAD_CHUNK_SIZE.
+            callback (callable): チャンクの送信ごとに、送信済みバイト数と合計バイト数を引数に呼び出す関数。
+                                 Defaults to None.
+            checkpoint (GoogleDriveUploadCheckpoint): セッションURIの保存先。
+                                                      Noneの場合、失敗したアップロードは再開しない。 Defaults to None.
         Returns:
             str: 作成したファイルのID
         """
+        key = None
+        resumable_uri = None
+        if checkpoint is not None:
+            key = checkpoint.get_key(local_file_path, folder_id, upload_file_name)
+            resumable_uri = checkpoint.get(key)
+            if resumable_uri is not None:
+                logger.info('中断したアップロードを再開します。ファイル名: {}'.format(upload_file_name))
+
+        def session_callback(uri):
+            if checkpoint is not None:
+                checkpoint.put(key, uri)
+
+        try:
+            f = self.__upload_resumable(local_file_path, folder_id, upload_file_name,
+                                        chunksize, callback, resumable_uri, session_callback)
+        except ApiRequestError as e:
+            # セッションの有効期限切れ等で再開できない場合は、最初からアップロードする
+            if resumable_uri is None or getattr(e.args[0], 'resp', None) is None \
+                    or e.args[0].resp.status not in (404, 410):
+                raise e
+            logger.warn('中断したアップロードを再開できないため、最初からアップロードします。詳細({})'.format(e))
+            checkpoint.delete(key)
+            f = self.__upload_resumable(local_file_path, folder_id, upload_file_name,
+                                        chunksize, callback, None, session_callback)
+
+        if checkpoint is not None:
+            checkpoint.delete(key)
+        return f['id']
+
+    def __upload_resumable(self,
+                           local_file_path,
+                           folder_id,
+                           upload_file_name,
+                           chunksize,
+                           callback,
+                           resumable_uri,
+                           session_callback):
         f = self.drive.CreateFile({'title': upload_file_name, 'parents': [{'id': folder_id}]})
         f.SetContentFile(local_file_path)
-        f.Upload(param={'supportsTeamDrives': True})
-        return f['id']
+        try:
+            f.UploadResumable(param={'supportsTeamDrives': True},
+                              chunksize=chunksize,
+                              callback=callback,
+                              resumable_uri=resumable_uri,
+                              session_callback=session_callback)
+        finally:
+            f.content.close()
+        return f
 
     def create_folder(self,
                       parents_id,
@@ -284,6 +437,26 @@ class GoogleDriveClient:
                                  'includeTeamDriveItems': True}).GetList()
         return f
 
+    def find_folders(self,
+                     parent_folder_id,
+                     folder_name):
+        """Googleドライブの指定フォルダID内にある、フォルダ名が完全一致するフォルダの一覧を返却する。
+
+        Args:
+            parent_folder_id (str): 親フォルダのフォルダID
+            folder_name (str): フォルダ名
+        Returns:
+            list: フォルダの一覧。作成日の昇順。
+        """
+        f = self.drive.ListFile({'q': "'{}' in parents and title = '{}' and mimeType = 'application/vnd.google-apps.folder' and trashed=false".format(
+                                     parent_folder_id,
+                                     folder_name.replace('\\', '\\\\').replace("'", "\\'")),
+                                 'orderBy': 'createdDate',
+                                 'corpus': 'DEFAULT',
+                                 'supportsTeamDrives': True,
+                                 'includeTeamDriveItems': True}).GetList()
+        return f
+
     def delete_file(self,
                       file_id):
         """ファイルを削除する。
@@ -295,3 +468,160 @@ class GoogleDriveClient:
         """
         f = self.drive.CreateFile({'id': file_id})
         f.Trash(param={'supportsTeamDrives': True})
+
+    def delete_files(self,
+                     file_ids):
+        """複数のファイルを、バッチリクエストでまとめて削除（ゴミ箱に移動）する。
+
+        Args:
+            file_ids (list(str)): GoogleドライブのファイルIDのリスト
+
+        Returns:
+            dict: ファイルIDごとの結果。batch_executeと同じ。
+        """
+        service = self.drive.auth.service
+        return self.batch_execute({
+            file_id: lambda file_id=file_id: service.files().trash(
+                fileId=file_id,
+                supportsTeamDrives=self.supportsTeamDrives)
+            for file_id in file_ids})
+
+    def batch_move_files(self,
+                         file_ids,
+                         from_folder_id,
+                         to_folder_id):
+        """複数のファイルを、バッチリクエストでまとめて移動する。
+
+        Args:
+            file_ids (list(str)): GoogleドライブのファイルIDのリスト
+            from_folder_id (str): 移動元のフォルダID
+            to_folder_id (str): 移動先のフォルダID
+
+        Returns:
+            dict: ファイルIDごとの結果。batch_executeと同じ。
+        """
+        service = self.drive.auth.service
+        return self.batch_execute({
+            file_id: lambda file_id=file_id: service.files().patch(
+                fileId=file_id,
+                body={},
+                addParents=to_folder_id,
+                removeParents=from_folder_id,
+                supportsTeamDrives=self.supportsTeamDrives)
+            for file_id in file_ids})
+
+    def batch_rename_files(self,
+                           new_file_names):
+        """複数のファイルの名前を、バッチリクエストでまとめて変更する。
+
+        Args:
+            new_file_names (dict): ファイルIDをキー、変更後のファイル名を値とするdict
+
+        Returns:
+            dict: ファイルIDごとの結果。batch_executeと同じ。
+        """
+        service = self.drive.auth.service
+        return self.batch_execute({
+            file_id: lambda file_id=file_id, title=title: service.files().patch(
+                fileId=file_id,
+                body={'title': title},
+                supportsTeamDrives=self.supportsTeamDrives)
+            for file_id, title in new_file_names.items()})
+
+    def batch_insert_permissions(self,
+                                 file_ids,
+                                 permission,
+                                 send_notification_emails=False):
+        """複数のファイルに、バッチリクエストでまとめて権限を付与する。
+
+        Args:
+            file_ids (list(str)): GoogleドライブのファイルIDのリスト
+            permission (dict): 付与する権限。例: {'type': 'user', 'role': 'reader', 'value': 'hoge@example.com'}
+            send_notification_emails (bool): 権限を付与したユーザーに通知メールを送るかどうか。 Defaults to False.
+
+        Returns:
+            dict: ファイルIDごとの結果。batch_executeと同じ。
+        """
+        service = self.drive.auth.service
+        return self.batch_execute({
+            file_id: lambda file_id=file_id: service.permissions().insert(
+                fileId=file_id,
+                body=permission,
+                sendNotificationEmails=send_notification_emails,
+                supportsTeamDrives=self.supportsTeamDrives)
+            for file_id in file_ids})
+
+    def batch_execute(self,
+                      requests,
+                      batch_size=BATCH_SIZE,
+                      retry_count=BATCH_RETRY_COUNT,
+                      retry_interval=BATCH_RETRY_INTERVAL):
+        """Drive APIのリクエストを、batch_size件ずつ1回のバッチリクエストにまとめて実行する。
+        レート制限、サーバーエラーで失敗したリクエストのみ、retry_count回まで再送する。
+
+        Args:
+            requests (dict): キーと、Drive APIのリクエスト（HttpRequest）を作成する引数なしの関数のdict
+                             再送時はリクエストを作り直すため、関数で指定する。
+            batch_size (int): 1回のバッチリクエストにまとめるリクエスト数（100以下）。 Defaults to BATCH_SIZE.
+            retry_count (int): 失敗したリクエストの再送回数。 Defaults to BATCH_RETRY_COUNT.
+            retry_interval (int): 再送間隔（秒）。再送ごとに2倍にする。 Defaults to BATCH_RETRY_INTERVAL.
+
+        Returns:
+            dict: キーごとの結果。以下のキーを持つdict。
+                  response (dict): 成功した場合のレスポンス。失敗した場合はNone
+                  error (googleapiclient.errors.HttpError): 失敗した場合のエラー。成功した場合はNone
+        """
+        if batch_size > BATCH_SIZE:
+            raise ValueError('引数:batch_sizeは{}以下を指定してください。'.format(BATCH_SIZE))
+        results = {}
+        pending = list(requests.keys())
+        for attempt in range(retry_count + 1):
+            if attempt > 0:
+                print('失敗した{}件のリクエストを再送します。'.format(len(pending)))
+                time.sleep(retry_interval * 2 ** (attempt - 1))
+            for i in range(0, len(pending), batch_size):
+                self.__execute_batch(requests, pending[i:i + batch_size], results)
+            pending = [key for key in pending
+                       if results[key]['error'] is not None and self.__is_retriable(results[key]['error'])]
+            if not pending:
+                break
+        return results
+
+    def __execute_batch(self, requests, keys, results):
+        """1回のバッチリクエストを実行し、結果をresultsに設定する。
+
+        Args:
+            requests (dict): キーと、Drive APIのリクエストを作成する関数のdict
+            keys (list): 実行するリクエストのキー
+            results (dict): キーごとの結果
+        """
+        def callback(request_id, response, exception):
+            key = keys[int(request_id)]
+            results[key] = {'response': response, 'error': exception}
+
+        batch = self.drive.auth.service.new_batch_http_request(callback=callback)
+        for i, key in enumerate(keys):
+            batch.add(requests[key](), request_id=str(i))
+        try:
+            batch.execute(http=self.drive.auth.Get_Http_Object())
+        except HttpError as e:
+            # バッチリクエスト自体が失敗した場合は、結果のない全リクエストを失敗とする
+            for key in keys:
+                if key not in results or results[key]['error'] is not None:
+                    results[key] = {'response': None, 'error': e}
+
+    def __is_retriable(self, error):
+        """再送するエラーかどうか判定する。
+
+        Args:
+            error (Exception): エラー
+
+        Returns:
+            bool: 再送する場合はTrue
+        """
+        if not isinstance(error, HttpError):
+            return False
+        status = error.resp.status
+        if status in BATCH_RETRY_STATUSES:
+            return True
+        return status == 403 and any(reason in str(error.content) for reason in BATCH_RETRY_REASONS)
@@ -0,0 +1,251 @@
+"""Googleドライブのフォルダパスを、フォルダIDに解決するモジュール
+
+親フォルダIDと「/」区切りのフォルダパスから、階層ごとにフォルダ名が完全一致するフォルダを検索し、
+存在しない場合は作成する。
+解決したフォルダIDはローカルディスクのキャッシュファイルに有効期限付きで保存し、
+GCSのバケットを指定した場合はGCSにも保存してワーカー間で共有する。
+フォルダの作成はGCS上のロックファイル（CloudStorageClient.get_file_lock）で排他制御し、
+並列に実行したタスクが同じフォルダを重複して作成しないようにする。
+ロックファイルは存在しない場合のみ作成する条件付きのアップロードのため、同時にロックを取得できるタスクは1つのみとなる。
+"""
+import fcntl
+import hashlib
+import json
+import os
+import time
+
+from retry.api import retry_call
+
+from lib.logger import logger
+from lib.utils.cloud_storage import CloudStorageClient
+
+# ローカルのキャッシュファイル
+DEFAULT_CACHE_FILE = '/var/tmp/google_drive_folder_cache/folders.json'
+# キャッシュの有効期限（秒）
+DEFAULT_TTL = 24 * 60 * 60
+# GCS上のキャッシュ、ロックファイルの保存先フォルダ
+DEFAULT_GCS_PREFIX = 'google_drive_folder_cache'
+# フォルダ作成のロックの取得を諦める秒数
+LOCK_TIME_UP_SEC = 300
+# Googleドライブの操作のリトライ回数
+RETRY_COUNT = 3
+# Googleドライブの操作のリトライ間隔（秒）。リトライごとに2倍にする
+RETRY_INTERVAL = 5
+
+
+class GoogleDriveFolderResolver:
+
+    def __init__(self,
+                 gdrive_client,
+                 cache_file=DEFAULT_CACHE_FILE,
+                 ttl=DEFAULT_TTL,
+                 gcs_bucket_name=None,
+                 gcs_prefix=DEFAULT_GCS_PREFIX,
+                 project_id=None,
+                 local=False):
+        """Googleドライブのフォルダパスのリゾルバ
+
+        Args:
+            gdrive_client (GoogleDriveClient): Googleドライブのクライアント
+            cache_file (str): ローカルのキャッシュファイル。 Defaults to DEFAULT_CACHE_FILE.
+            ttl (int): キャッシュの有効期限（秒）。 Defaults to DEFAULT_TTL.
+            gcs_bucket_name (str): キャッシュ、ロックファイルを保存するGCSのバケット名。gs://hogehoge
+                                   Noneの場合、GCSには保存せず、フォルダ作成の排他制御も行わない。 Defaults to None.
+            gcs_prefix (str): GCS上のキャッシュ、ロックファイルの保存先フォルダ。 Defaults to DEFAULT_GCS_PREFIX.
+            project_id (str): GCSのプロジェクトID。 Defaults to None.
+            local (bool): ローカル開発環境かどうか。 Defaults to False.
+        """
+        self.gdrive_client = gdrive_client
+        self.cache_file = cache_file
+        self.ttl = ttl
+        self.gcs_bucket_name = gcs_bucket_name
+        self.gcs_prefix = gcs_prefix
+        self.project_id = project_id
+        self.local = local
+        self.gcs = None
+        self.is_gcs_cache_loaded = False
+        os.makedirs(os.path.dirname(self.cache_file), exist_ok=True)
+
+    def resolve(self, parent_folder_id, upload_path):
+        """フォルダパスのフォルダIDを取得する。存在しないフォルダは作成する。
+
+        Args:
+            parent_folder_id (str): 親フォルダのフォルダID
+            upload_path (str): parent_folder_id 以下のフォルダパス（'/'区切りで指定）
+
+        Returns:
+            str: フォルダID。upload_pathが空の場合はparent_folder_id
+        """
+        folder_names = [name for name in upload_path.split('/') if name != '']
+        folder_id = parent_folder_id
+        resolved = {}
+        for i, folder_name in enumerate(folder_names):
+            key = '{}/{}'.format(parent_folder_id, '/'.join(folder_names[:i + 1]))
+            cached_folder_id = self.__get_cache(key)
+            if cached_folder_id is not None:
+                folder_id = cached_folder_id
+                continue
+            folder_id = self.__find_or_create_folder(folder_id, folder_name)
+            resolved[key] = folder_id
+
+        if resolved:
+            self.__put_cache(resolved)
+        logger.info('フォルダパス「{}」のフォルダID: {}'.format(upload_path, folder_id))
+        return folder_id
+
+    def __find_or_create_folder(self, parent_folder_id, folder_name):
+        """親フォルダ内のフォルダを検索し、存在しない場合は作成する。
+
+        Args:
+            parent_folder_id (str): 親フォルダのフォルダID
+            folder_name (str): フォルダ名
+
+        Returns:
+            str: フォルダID
+        """
+        folders = self.__retry_call(self.gdrive_client.find_folders, parent_folder_id, folder_name)
+        if folders:
+            return folders[0]['id']
+
+        if self.gcs_bucket_name is None:
+            return self.__retry_call(self.gdrive_client.create_folder, parent_folder_id, folder_name)
+
+        # 並列に実行したタスクが同じフォルダを作成しないよう、ロックを取得して再度検索してから作成する
+        lock_file = '{}/locks/{}'.format(
+            self.gcs_prefix,
+            hashlib.sha256('{}/{}'.format(parent_folder_id, folder_name).encode('UTF-8')).hexdigest())
+        gcs = self.__get_gcs()
+        gcs.get_file_lock(self.gcs_bucket_name,
+                          lock_file,
+                          '{}/'.format(os.path.dirname(self.cache_file)),
+                          time_up_sec=LOCK_TIME_UP_SEC)
+        try:
+            folders = self.__retry_call(self.gdrive_client.find_folders, parent_folder_id, folder_name)
+            if folders:
+                return folders[0]['id']
+            logger.info('フォルダ「{}」を作成します。親フォルダID: {}'.format(folder_name, parent_folder_id))
+            return self.__retry_call(self.gdrive_client.create_folder, parent_folder_id, folder_name)
+        finally:
+            gcs.release_file_lock(self.gcs_bucket_name, lock_file)
+
+    def __get_cache(self, key):
+        """キャッシュからフォルダIDを取得する。
+        ローカルにない場合、GCSのバケットが指定されていれば最初の1回のみGCSのキャッシュを取り込む。
+
+        Args:
+            key (str): 親フォルダIDとフォルダパス
+
+        Returns:
+            str: フォルダID。キャッシュがない、または有効期限切れの場合はNone
+        """
+        with _CacheLock(self.cache_file) as cache:
+            entry = cache.get(key)
+        if entry is not None and entry['expires'] > time.time():
+            return entry['id']
+
+        if self.gcs_bucket_name is None or self.is_gcs_cache_loaded:
+            return None
+        self.is_gcs_cache_loaded = True
+        gcs_cache = self.__download_gcs_cache()
+        with _CacheLock(self.cache_file) as cache:
+            for k, e in gcs_cache.items():
+                if k not in cache or cache[k]['expires'] < e['expires']:
+                    cache[k] = e
+            entry = cache.get(key)
+        if entry is not None and entry['expires'] > time.time():
+            return entry['id']
+        return None
+
+    def __put_cache(self, resolved):
+        """解決したフォルダIDをキャッシュに保存する。有効期限切れのものは削除する。
+
+        Args:
+            resolved (dict): 親フォルダIDとフォルダパス、フォルダIDのdict
+        """
+        now = time.time()
+        with _CacheLock(self.cache_file) as cache:
+            for key, folder_id in resolved.items():
+                cache[key] = {'id': folder_id, 'expires': now + self.ttl}
+            for key in [k for k, e in cache.items() if e['expires'] <= now]:
+                del cache[key]
+            entries = dict(cache)
+
+        if self.gcs_bucket_name is None:
+            return
+        try:
+            tmp_file = '{}.{}.upload'.format(self.cache_file, os.getpid())
+            with open(tmp_file, 'w', encoding='UTF-8') as f:
+                json.dump(entries, f)
+            try:
+                self.__get_gcs().upload(self.gcs_bucket_name, tmp_file, self.__get_gcs_cache_file())
+            finally:
+                os.remove(tmp_file)
+        except Exception as e:
+            # GCSへの保存に失敗してもフォルダIDは解決済みのため、エラーとしない
+            logger.warn('フォルダIDのキャッシュをGCSに保存できませんでした。詳細({})'.format(e))
+
+    def __download_gcs_cache(self):
+        """GCS上のキャッシュを取得する。
+
+        Returns:
+            dict: キャッシュ。取得できない場合は空のdict
+        """
+        tmp_file = '{}.{}.download'.format(self.cache_file, os.getpid())
+        try:
+            gcs = self.__get_gcs()
+            if not gcs.exists(self.gcs_bucket_name, self.__get_gcs_cache_file()):
+                return {}
+            gcs.download(self.gcs_bucket_name, self.__get_gcs_cache_file(), tmp_file)
+            with open(tmp_file, encoding='UTF-8') as f:
+                return json.load(f)
+        except Exception as e:
+            logger.warn('GCS上のフォルダIDのキャッシュを取得できませんでした。詳細({})'.format(e))
+            return {}
+        finally:
+            if os.path.exists(tmp_file):
+                os.remove(tmp_file)
+
+    def __get_gcs_cache_file(self):
+        return '{}/{}'.format(self.gcs_prefix, os.path.basename(self.cache_file))
+
+    def __get_gcs(self):
+        if self.gcs is None:
+            self.gcs = CloudStorageClient(project_id=self.project_id, local=self.local)
+        return self.gcs
+
+    def __retry_call(self, f, *args):
+        return retry_call(f, fargs=args, tries=RETRY_COUNT, delay=RETRY_INTERVAL, backoff=2)
+
+
+class _CacheLock:
+    """キャッシュファイルを排他ロックして読み書きするコンテキストマネージャ
+    同じワーカー上の複数プロセスから同時に更新されるため、ファイルロックで排他制御する。
+    """
+
+    def __init__(self, cache_file):
+        self.cache_file = cache_file
+        self.lock_file = None
+        self.cache = None
+        self.original = None
+
+    def __enter__(self):
+        self.lock_file = open('{}.lock'.format(self.cache_file), 'w')
+        fcntl.flock(self.lock_file, fcntl.LOCK_EX)
+        try:
+            with open(self.cache_file, encoding='UTF-8') as f:
+                self.cache = json.load(f)
+        except (FileNotFoundError, ValueError):
+            self.cache = {}
+        self.original = dict(self.cache)
+        return self.cache
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            if exc_type is None and self.cache != self.original:
+                tmp_file = '{}.tmp'.format(self.cache_file)
+                with open(tmp_file, 'w', encoding='UTF-8') as f:
+                    json.dump(self.cache, f)
+                os.replace(tmp_file, self.cache_file)
+        finally:
+            fcntl.flock(self.lock_file, fcntl.LOCK_UN)
+            self.lock_file.close()
@@ -0,0 +1,23 @@
+"""GoogleドライブへのアップロードでBigQuery関連のフックが共通で使う処理
+"""
+from airflow.models import Variable
+
+
+def get_gcs_data_bucket():
+    """Airflowの変数gcs_data_folder（gs://バケット名/フォルダ）を、バケット名とフォルダに分割する。
+
+    Returns:
+        tuple: バケット名（gs://バケット名）、フォルダ（末尾に'/'を含む。フォルダがない場合は空文字）
+    """
+    bucket_name, _, folder = Variable.get('gcs_data_folder').replace('gs://', '').partition('/')
+    return 'gs://{}'.format(bucket_name), folder.rstrip('/') + '/' if folder else ''
+
+
+def print_upload_progress(uploaded_bytes, total_bytes):
+    """アップロードの進捗を出力する。GoogleDriveClient.upload_fileのcallbackに指定する。
+
+    Args:
+        uploaded_bytes (int): アップロード済みのバイト数
+        total_bytes (int): ファイルのバイト数
+    """
+    print('アップロード済み: {:,} / {:,} バイト'.format(uploaded_bytes, total_bytes))
@@ -0,0 +1,160 @@
+"""Googleドライブへのレジューム可能なアップロードのセッションURIを保存するモジュール
+
+アップロードが途中で失敗した場合、保存したセッションURIを使って
+サーバーが受信済みのバイト位置から再開する。
+キーはローカルファイルの内容のMD5、アップロード先のフォルダID、ファイル名から作成するため、
+リトライでファイルを作り直しても内容が同じであれば再開でき、内容が異なれば最初からアップロードする。
+ローカルディスクを保存先とし、GCSのバケットを指定した場合はGCSにも保存して
+別のワーカーで実行したリトライからも再開できるようにする。
+セッションURIの有効期限は1週間のため、それより古いものは利用しない。
+"""
+import hashlib
+import json
+import os
+import time
+
+from lib.logger import logger
+from lib.utils.cloud_storage import CloudStorageClient
+
+# ローカルのチェックポイントの保存先ディレクトリ
+DEFAULT_CHECKPOINT_DIR = '/var/tmp/google_drive_upload_checkpoint'
+# GCS上のチェックポイントの保存先フォルダ
+DEFAULT_GCS_PREFIX = 'google_drive_upload_checkpoint'
+# セッションURIの有効期限（秒）。Googleドライブの有効期限1週間より短くする
+SESSION_TTL = 6 * 24 * 60 * 60
+# キーの作成でファイルを読み込むサイズ
+READ_CHUNK_SIZE = 8 * 1024 * 1024
+
+
+class GoogleDriveUploadCheckpoint:
+
+    def __init__(self,
+                 checkpoint_dir=DEFAULT_CHECKPOINT_DIR,
+                 gcs_bucket_name=None,
+                 gcs_prefix=DEFAULT_GCS_PREFIX,
+                 project_id=None,
+                 local=False):
+        """レジューム可能なアップロードのチェックポイント
+
+        Args:
+            checkpoint_dir (str): ローカルのチェックポイントの保存先ディレクトリ。 Defaults to DEFAULT_CHECKPOINT_DIR.
+            gcs_bucket_name (str): チェックポイントを保存するGCSのバケット名。gs://hogehoge
+                                   Noneの場合、GCSには保存しない。 Defaults to None.
+            gcs_prefix (str): GCS上のチェックポイントの保存先フォルダ。 Defaults to DEFAULT_GCS_PREFIX.
+            project_id (str): GCSのプロジェクトID。 Defaults to None.
+            local (bool): ローカル開発環境かどうか。 Defaults to False.
+        """
+        self.checkpoint_dir = checkpoint_dir
+        self.gcs_bucket_name = gcs_bucket_name
+        self.gcs_prefix = gcs_prefix
+        self.project_id = project_id
+        self.local = local
+        os.makedirs(self.checkpoint_dir, exist_ok=True)
+
+    def get_key(self, local_file_path, folder_id, upload_file_name):
+        """チェックポイントのキーを作成する。
+
+        Args:
+            local_file_path (str): ローカルのファイルパス
+            folder_id (str): Googleドライブのアップロード先のフォルダID
+            upload_file_name (str): アップロードファイル名
+
+        Returns:
+            str: キー
+        """
+        md5 = hashlib.md5()
+        with open(local_file_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(READ_CHUNK_SIZE), b''):
+                md5.update(chunk)
+        return hashlib.sha256('{}/{}/{}'.format(md5.hexdigest(), folder_id, upload_file_name)
+                              .encode('UTF-8')).hexdigest()
+
+    def get(self, key):
+        """保存したセッションURIを取得する。
+        ローカルにない場合、GCSのバケットが指定されていればGCSから取得する。
+
+        Args:
+            key (str): キー
+
+        Returns:
+            str: セッションURI。ない、または有効期限切れの場合はNone
+        """
+        checkpoint = self.__read(self.__get_local_file(key))
+        if checkpoint is None and self.gcs_bucket_name is not None:
+            checkpoint = self.__download_from_gcs(key)
+        if checkpoint is None or checkpoint['expires'] <= time.time():
+            return None
+        return checkpoint['uri']
+
+    def put(self, key, uri):
+        """セッションURIを保存する。
+
+        Args:
+            key (str): キー
+            uri (str): セッションURI
+        """
+        local_file = self.__get_local_file(key)
+        tmp_file = '{}.{}.tmp'.format(local_file, os.getpid())
+        with open(tmp_file, 'w', encoding='UTF-8') as f:
+            json.dump({'uri': uri, 'expires': time.time() + SESSION_TTL}, f)
+        os.replace(tmp_file, local_file)
+
+        if self.gcs_bucket_name is not None:
+            try:
+                gcs = CloudStorageClient(project_id=self.project_id, local=self.local)
+                gcs.upload(self.gcs_bucket_name, local_file, self.__get_gcs_file(key))
+            except Exception as e:
+                # GCSへの保存に失敗してもアップロードは続けられるため、エラーとしない
+                logger.warn('アップロードのチェックポイントをGCSに保存できませんでした。詳細({})'.format(e))
+
+    def delete(self, key):
+        """セッションURIを削除する。
+
+        Args:
+            key (str): キー
+        """
+        try:
+            os.remove(self.__get_local_file(key))
+        except FileNotFoundError:
+            pass
+
+        if self.gcs_bucket_name is not None:
+            try:
+                gcs = CloudStorageClient(project_id=self.project_id, local=self.local)
+                if gcs.exists(self.gcs_bucket_name, self.__get_gcs_file(key)):
+                    gcs.delete(self.gcs_bucket_name, self.__get_gcs_file(key))
+            except Exception as e:
+                logger.warn('GCS上のアップロードのチェックポイントを削除できませんでした。詳細({})'.format(e))
+
+    def __get_local_file(self, key):
+        return '{}/{}.json'.format(self.checkpoint_dir, key)
+
+    def __get_gcs_file(self, key):
+        return '{}/{}.json'.format(self.gcs_prefix, key)
+
+    def __read(self, file_path):
+        try:
+            with open(file_path, encoding='UTF-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def __download_from_gcs(self, key):
+        """GCS上のチェックポイントを取得する。
+
+        Returns:
+            dict: チェックポイント。取得できない場合はNone
+        """
+        tmp_file = '{}.{}.download'.format(self.__get_local_file(key), os.getpid())
+        try:
+            gcs = CloudStorageClient(project_id=self.project_id, local=self.local)
+            if not gcs.exists(self.gcs_bucket_name, self.__get_gcs_file(key)):
+                return None
+            gcs.download(self.gcs_bucket_name, self.__get_gcs_file(key), tmp_file)
+            return self.__read(tmp_file)
+        except Exception as e:
+            logger.warn('GCS上のアップロードのチェックポイントを取得できませんでした。詳細({})'.format(e))
+            return None
+        finally:
+            if os.path.exists(tmp_file):
+                os.remove(tmp_file)
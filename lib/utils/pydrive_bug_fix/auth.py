@@ -1,4 +1,5 @@
 import socket
+import threading
 import webbrowser
 from lib.utils import httplib2_0_15_0
 import oauth2client.clientsecrets as clientsecrets
@@ -73,6 +74,9 @@ def LoadAuth(decoratee):
     if self.auth.access_token_expired:
       if getattr(self, 'auth_method', False) == 'service':
         self.auth.ServiceAuth()
+      elif self.auth.credentials is not None and \
+              self.auth.credentials.refresh_token is not None:
+        self.auth.RefreshIfExpired()
       else:
         self.auth.LocalWebserverAuth()
 
@@ -89,7 +93,7 @@ def LoadAuth(decoratee):
       self.http = kwargs["param"]["http"]
       del kwargs["param"]["http"]
 
-    else:  # If HTTP object not specified, each call creates new HTTP object.
+    else:  # If HTTP object not specified, each thread reuses its own one.
       self.http = self.auth.Get_Http_Object()
 
     return decoratee(self, *args, **kwargs)
@@ -183,6 +187,8 @@ class GoogleAuth(ApiAttributeMixin, object):
     :type settings_file: str.
     """
     self.http_timeout=http_timeout
+    self._refresh_lock = threading.Lock()
+    self._thread_local = threading.local()
     ApiAttributeMixin.__init__(self)
     self.client_config = {}
     try:
@@ -498,6 +504,38 @@ class GoogleAuth(ApiAttributeMixin, object):
     except AccessTokenRefreshError as error:
       raise RefreshError('Access token refresh failed: %s' % error)
 
+  def RefreshIfExpired(self, credentials_file=None):
+    """Refreshes the access_token only if it is expired.
+
+    Safe to call from many threads sharing this instance: only the first
+    caller refreshes, the others wait and reuse the new token. Credentials
+    loaded from a file are written back by oauth2client itself on refresh,
+    so credentials_file is written only when they have no storage yet.
+
+    :param credentials_file: file to save refreshed credentials to.
+    :type credentials_file: str.
+    :returns: bool -- True if the access token was refreshed.
+    :raises: RefreshError
+    """
+    if not self.access_token_expired:
+      return False
+    with self._refresh_lock:
+      if not self.access_token_expired:
+        return False
+      if self.credentials is None:
+        raise RefreshError('No credential to refresh.')
+      if self.credentials.refresh_token is None:
+        raise RefreshError('No refresh_token found.'
+                           'Please set access_type of OAuth to offline.')
+      try:
+        self.credentials.refresh(
+            httplib2_0_15_0.Http(timeout=self.http_timeout))
+      except AccessTokenRefreshError as error:
+        raise RefreshError('Access token refresh failed: %s' % error)
+      if credentials_file is not None and self.credentials.store is None:
+        self.SaveCredentialsFile(credentials_file)
+      return True
+
   def GetAuthUrl(self):
     """Creates authentication url where user visits to grant access.
 
@@ -545,11 +583,18 @@ class GoogleAuth(ApiAttributeMixin, object):
     self.service = build('drive', 'v2', http=self.http, cache_discovery=False)
 
   def Get_Http_Object(self):
-    """Create and authorize an httplib2.Http object. Necessary for
-    thread-safety.
+    """Get an authorized httplib2.Http object for the calling thread.
+
+    httplib2.Http is not thread-safe, so each thread gets its own one. It
+    is created once per thread and credentials, and reused afterwards to
+    keep connections alive.
     :return: The http object to be used in each call.
     :rtype: httplib2.Http
     """
-    http = httplib2_0_15_0.Http(timeout=self.http_timeout)
-    http = self.credentials.authorize(http)
-    return http
+    local = self._thread_local
+    if getattr(local, 'http', None) is None or \
+            local.credentials is not self.credentials:
+      http = httplib2_0_15_0.Http(timeout=self.http_timeout)
+      local.http = self.credentials.authorize(http)
+      local.credentials = self.credentials
+    return local.http
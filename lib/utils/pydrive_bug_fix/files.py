@@ -1,5 +1,7 @@
+import hashlib
 import io
 import mimetypes
+import os
 
 from apiclient import errors
 from apiclient.http import MediaIoBaseUpload
@@ -12,6 +14,10 @@ from .apiattr import ApiResourceList
 from .auth import LoadAuth
 
 BLOCK_SIZE = 1024
+# Size of each ranged request when streaming file content.
+DEFAULT_CHUNK_SIZE = 8 * 1024 * 1024
+# Size of each chunk of a resumable upload. Must be a multiple of 256 KB.
+DEFAULT_UPLOAD_CHUNK_SIZE = 32 * 1024 * 1024
 # Usage: MIME_TYPE_TO_BOM['<Google Drive mime type>']['<download mimetype>'].
 MIME_TYPE_TO_BOM = {
   'application/vnd.google-apps.document': {
@@ -31,6 +37,10 @@ class FileNotDownloadableError(RuntimeError):
   """Error trying to download file that is not downloadable."""
 
 
+class ChecksumMismatchError(IOError):
+  """Error when downloaded content does not match md5Checksum of the file."""
+
+
 def LoadMetadata(decoratee):
   """Decorator to check if the file has metadata and fetches it if not.
 
@@ -193,24 +203,120 @@ class GoogleDriveFile(ApiAttributeMixin, ApiResource):
       self.FetchContent(mimetype, remove_bom)
     return self.content.getvalue().decode(encoding)
 
-  def GetContentFile(self, filename, mimetype=None, remove_bom=False):
+  def GetContentFile(self, filename, mimetype=None, remove_bom=False,
+                     chunksize=DEFAULT_CHUNK_SIZE, resume=False):
     """Save content of this file as a local file.
 
+    Binary files are streamed to the file chunk by chunk with ranged requests,
+    so memory usage does not depend on the file size. Exported Google Docs
+    files and BOM removal still go through FetchContent.
+
     :param filename: name of the file to write to.
     :type filename: str
     :param mimetype: mimeType of the file.
     :type mimetype: str
     :param remove_bom: Whether to remove the byte order marking.
     :type remove_bom: bool
+    :param chunksize: size of each ranged request in bytes.
+    :type chunksize: int
+    :param resume: if True and the local file exists, continue downloading
+    from its current size instead of from the beginning.
+    :type resume: bool
+    :raises: ApiRequestError, FileNotUploadedError, FileNotDownloadableError,
+    ChecksumMismatchError
+    """
+    if remove_bom or not self._GetDownloadUrl():
+      if self.content is None or \
+                      type(self.content) is not io.BytesIO or \
+                      self.has_bom == remove_bom:
+        self.FetchContent(mimetype, remove_bom)
+      f = open(filename, 'wb')
+      f.write(self.content.getvalue())
+      f.close()
+      return
+
+    md5 = hashlib.md5()
+    offset = 0
+    if resume and os.path.exists(filename):
+      # Hash the part already downloaded so the checksum covers the whole file.
+      with open(filename, 'rb') as f:
+        for block in iter(lambda: f.read(chunksize), b''):
+          md5.update(block)
+          offset += len(block)
+    with open(filename, 'ab' if offset else 'wb') as f:
+      self.GetContentStream(f, chunksize=chunksize, offset=offset, md5=md5)
+
+    expected = self.metadata.get('md5Checksum')
+    if expected and md5.hexdigest() != expected:
+      # Remove the broken file so that a retry starts from the beginning.
+      os.remove(filename)
+      raise ChecksumMismatchError(
+        'md5Checksum mismatch for %s: expected %s, got %s'
+        % (self.metadata.get('id'), expected, md5.hexdigest()))
+
+  @LoadMetadata
+  def _GetDownloadUrl(self):
+    return self.metadata.get('downloadUrl')
+
+  @LoadAuth
+  @LoadMetadata
+  def GetContentStream(self, fd, mimetype=None, chunksize=DEFAULT_CHUNK_SIZE,
+                       offset=0, md5=None, callback=None):
+    """Write content of this file to a writable file object chunk by chunk.
+
+    Binary files are downloaded with ranged requests of chunksize bytes,
+    starting at offset. Exported Google Docs files have no size in advance
+    and are downloaded with a single request.
+
+    :param fd: writable binary file object.
+    :type fd: io.IOBase
+    :param mimetype: mimeType to export Google Docs files to.
+    :type mimetype: str
+    :param chunksize: size of each ranged request in bytes.
+    :type chunksize: int
+    :param offset: byte offset to start downloading from.
+    :type offset: int
+    :param md5: hashlib md5 object updated with every chunk written.
+    :type md5: hashlib._Hash
+    :param callback: called with (bytes written so far including offset,
+    total bytes or None) after every chunk.
+    :type callback: callable
+    :returns: int -- number of bytes written to fd.
     :raises: ApiRequestError, FileNotUploadedError, FileNotDownloadableError
     """
-    if self.content is None or \
-                    type(self.content) is not io.BytesIO or \
-                    self.has_bom == remove_bom:
-      self.FetchContent(mimetype, remove_bom)
-    f = open(filename, 'wb')
-    f.write(self.content.getvalue())
-    f.close()
+    download_url = self.metadata.get('downloadUrl')
+    export_links = self.metadata.get('exportLinks')
+    if not download_url:
+      if export_links and export_links.get(mimetype):
+        content = self._DownloadFromUrl(export_links.get(mimetype))
+        fd.write(content)
+        if md5 is not None:
+          md5.update(content)
+        if callback is not None:
+          callback(len(content), None)
+        return len(content)
+      raise FileNotDownloadableError(
+        'No downloadLink/exportLinks for mimetype found in metadata')
+
+    total = int(self.metadata.get('fileSize', 0))
+    written = 0
+    while offset < total:
+      end = min(offset + chunksize, total) - 1
+      resp, content = self.http.request(
+        download_url, headers={'Range': 'bytes=%d-%d' % (offset, end)})
+      # 200 means the server ignored the range and returned the whole file.
+      if resp.status != 206 and not (resp.status == 200 and offset == 0):
+        raise ApiRequestError('Cannot download file: %s' % resp)
+      fd.write(content)
+      if md5 is not None:
+        md5.update(content)
+      offset += len(content)
+      written += len(content)
+      if callback is not None:
+        callback(offset, total)
+      if not content:
+        raise ApiRequestError('Empty response while downloading file: %s' % resp)
+    return written
 
   @LoadAuth
   def FetchMetadata(self, fields=None, fetch_all=False):
@@ -285,6 +391,65 @@ class GoogleDriveFile(ApiAttributeMixin, ApiResource):
     else:
       self._FilesInsert(param=param)
 
+  @LoadAuth
+  def UploadResumable(self, param=None, chunksize=DEFAULT_UPLOAD_CHUNK_SIZE,
+                      callback=None, resumable_uri=None, session_callback=None):
+    """Upload content and metadata chunk by chunk in a resumable session.
+
+    Uses Files.insert() for a new file and Files.update() for an existing one.
+    If resumable_uri is given, the server is asked for the last committed
+    offset of that session and the upload continues from there.
+
+    :param param: additional parameter to upload file.
+    :type param: dict.
+    :param chunksize: size of each chunk in bytes, a multiple of 256 KB.
+    :type chunksize: int
+    :param callback: called with (bytes committed, total bytes) after every
+    chunk.
+    :type callback: callable
+    :param resumable_uri: session URI of an interrupted upload to resume.
+    :type resumable_uri: str
+    :param session_callback: called with the session URI once it is known,
+    so that it can be saved to resume the upload later.
+    :type session_callback: callable
+    :raises: ApiRequestError
+    """
+    if param is None:
+      param = {}
+    if self.get('mimeType') is None:
+      self['mimeType'] = 'application/octet-stream'
+    param['body'] = self.GetChanges()
+    param['media_body'] = MediaIoBaseUpload(self.content, self['mimeType'],
+                                            chunksize=chunksize, resumable=True)
+    file_id = self.metadata.get('id') or self.get('id')
+    if file_id:
+      request = self.auth.service.files().update(fileId=file_id, **param)
+    else:
+      request = self.auth.service.files().insert(**param)
+    if resumable_uri:
+      # Make next_chunk() query the committed offset before sending data.
+      request.resumable_uri = resumable_uri
+      request._in_error_state = True
+
+    metadata = None
+    notified_uri = resumable_uri
+    try:
+      while metadata is None:
+        status, metadata = request.next_chunk(http=self.http)
+        if session_callback is not None and \
+                request.resumable_uri != notified_uri:
+          notified_uri = request.resumable_uri
+          session_callback(notified_uri)
+        if status is not None and callback is not None:
+          callback(status.resumable_progress, status.total_size)
+    except errors.HttpError as error:
+      raise ApiRequestError(error)
+    self.uploaded = True
+    self.dirty['content'] = False
+    self.UpdateMetadata(metadata)
+    if callback is not None and metadata.get('fileSize'):
+      callback(int(metadata['fileSize']), int(metadata['fileSize']))
+
   def Trash(self, param=None):
     """Move a file to the trash.
 
@@ -481,16 +646,19 @@ class GoogleDriveFile(ApiAttributeMixin, ApiResource):
     else:
       self.UpdateMetadata(metadata)
 
-  def _BuildMediaBody(self):
+  def _BuildMediaBody(self, chunksize=DEFAULT_UPLOAD_CHUNK_SIZE):
     """Build MediaIoBaseUpload to get prepared to upload content of the file.
 
     Sets mimeType as 'application/octet-stream' if not specified.
 
+    :param chunksize: size of each chunk in bytes, a multiple of 256 KB.
+    :type chunksize: int
     :returns: MediaIoBaseUpload -- instance that will be used to upload content.
     """
     if self.get('mimeType') is None:
       self['mimeType'] = 'application/octet-stream'
-    return MediaIoBaseUpload(self.content, self['mimeType'], resumable=True)
+    return MediaIoBaseUpload(self.content, self['mimeType'],
+                             chunksize=chunksize, resumable=True)
 
   @LoadAuth
   def _DownloadFromUrl(self, url):
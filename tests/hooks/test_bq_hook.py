@@ -0,0 +1,107 @@
+"""lib.hooks.bq_hookのテスト
+"""
+import unittest
+
+import pyarrow as pa
+from google.cloud import bigquery
+
+from lib.hooks import bq_hook
+
+set_incremental_query = getattr(bq_hook, '__set_incremental_query')
+arrow_to_result = getattr(bq_hook, '__arrow_to_result')
+
+
+class FakeClient:
+    """get_tableのみを持つBigQueryクライアント
+    """
+
+    def __init__(self, table):
+        self.table = table
+
+    def get_table(self, table_ref):
+        return self.table
+
+
+def create_table():
+    table = bigquery.Table('project.dataset.sales', schema=[
+        bigquery.SchemaField('sales_date', 'DATE'),
+        bigquery.SchemaField('shop_id', 'STRING'),
+        bigquery.SchemaField('amount', 'INT64'),
+    ])
+    table.time_partitioning = bigquery.TimePartitioning(type_='DAY', field='sales_date')
+    return table
+
+
+def create_job_config():
+    job_config = bigquery.QueryJobConfig()
+    job_config.destination = bigquery.TableReference.from_string('project.dataset.sales')
+    return job_config
+
+
+class SetIncrementalQueryTest(unittest.TestCase):
+
+    WINDOW_CONDITION = ('BETWEEN CAST(@incremental_partition_start AS DATE) '
+                        'AND CAST(@incremental_partition_end AS DATE)')
+
+    def test_replace_partitions_with_window_filters_staging_rows(self):
+        script = set_incremental_query(FakeClient(create_table()),
+                                       'SELECT * FROM source',
+                                       create_job_config(),
+                                       'REPLACE_PARTITIONS',
+                                       partition_window=('2026-01-01', '2026-01-31'))
+
+        self.assertIn('DELETE FROM `project.dataset.sales` AS T WHERE T.`sales_date` {};'.format(
+            self.WINDOW_CONDITION), script)
+        self.assertIn('INSERT INTO `project.dataset.sales` (`sales_date`, `shop_id`, `amount`) '
+                      'SELECT `sales_date`, `shop_id`, `amount` FROM _incremental_staging '
+                      'AS S WHERE S.`sales_date` {};'.format(self.WINDOW_CONDITION), script)
+
+    def test_merge_with_window_filters_staging_rows(self):
+        script = set_incremental_query(FakeClient(create_table()),
+                                       'SELECT * FROM source',
+                                       create_job_config(),
+                                       'MERGE',
+                                       merge_keys=['sales_date', 'shop_id'],
+                                       partition_window=('2026-01-01', '2026-01-31'))
+
+        self.assertIn('USING (SELECT * FROM _incremental_staging AS S WHERE S.`sales_date` {}) AS S'.format(
+            self.WINDOW_CONDITION), script)
+        self.assertIn('ON T.`sales_date` = S.`sales_date` AND T.`shop_id` = S.`shop_id` '
+                      'AND T.`sales_date` {}'.format(self.WINDOW_CONDITION), script)
+
+    def test_replace_partitions_without_window_uses_staged_partitions(self):
+        script = set_incremental_query(FakeClient(create_table()),
+                                       'SELECT * FROM source',
+                                       create_job_config(),
+                                       'REPLACE_PARTITIONS')
+
+        self.assertIn('DELETE FROM `project.dataset.sales` AS T '
+                      'WHERE T.`sales_date` IN UNNEST(_incremental_partitions);', script)
+        self.assertIn('FROM _incremental_staging;', script)
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+
+class ArrowToResultTest(unittest.TestCase):
+
+    TABLE = pa.table({'id': list(range(5))})
+
+    def test_zero_max_return_records_returns_all_rows(self):
+        for return_type in ('list', 'rows', 'arrow_batches', 'df_chunks'):
+            with self.subTest(return_type=return_type):
+                result = list(arrow_to_result(self.TABLE, return_type, 0, 2))
+                self.assertEqual(5, sum(len(item) if return_type in ('arrow_batches', 'df_chunks') else 1
+                                        for item in result))
+
+    def test_max_return_records_limits_rows(self):
+        self.assertEqual([{'id': 0}, {'id': 1}, {'id': 2}], list(arrow_to_result(self.TABLE, 'rows', 3, 2)))
+
+    def test_row_iterator_with_result_cache_is_rejected(self):
+        with self.assertRaisesRegex(ValueError, 'use_result_cache'):
+            bq_hook.bq_query('SELECT 1',
+                             is_return_result=True,
+                             return_type='row_iterator',
+                             use_result_cache=True,
+                             by_query_str=True)